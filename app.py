@@ -1,4 +1,7 @@
 from app.app_factory import create_app
 
 app = create_app()
-app.run_server(debug=True, port=8050)
+
+if __name__ == '__main__':
+    # development server, see wsgi.py and gunicorn.conf.py for production
+    app.run_server(debug=True, port=8050)
@@ -0,0 +1,225 @@
+import inspect
+import io
+import json
+import time
+import zlib
+from typing import Callable, Iterator
+
+import flask
+import pandas as pd
+
+import app.file_handlers as fh
+from app.helpers import parse_csv
+from app.solvers import Instance
+from app.solvers.aco_solver import ant_colony, run_colony
+from app.solvers.annealing_solver import anneal
+from app.solvers.bounds import optimality_gap
+from app.solvers.decomposition_solver import decompose
+from app.solvers.instance import ENGINES
+from app.solvers.multilevel_solver import multilevel
+from app.solvers.portfolio import race
+
+SOLVERS = ['random'] + list(ENGINES)
+
+# functions the engines pass the rest of their options to, the portfolio passes them on to engines taking them by name
+FORWARDED = {'aco': [ant_colony, run_colony], 'annealing': [anneal], 'decomposition': [decompose],
+             'multilevel': [multilevel], 'portfolio': [race]}
+
+# parameters the solvers set themselves, not options of a request
+INTERNAL = {'self', 'instance', 'graph', 'working_time', 'targets', 'target', 'tau', 'rng', 'initial', 'incumbent',
+            'trace_memory'}
+
+# columns of records sent as json, whose keys have no order
+COLUMNS = {'cities': ['name', 'x', 'y', 'quantity'], 'paths': ['city_from', 'city_to', 'time']}
+
+# number of route items in one chunk of a streamed response
+CHUNK = 1000
+
+
+class ApiError(Exception):
+    """ Bad request, reported to the client with status 400. """
+
+
+def _dumps(obj) -> str:
+    return json.dumps(obj, separators=(',', ':'))
+
+
+def read_request(request: flask.Request) -> tuple:
+    """
+    Reads an instance and solver settings from a request, either json
+    {"cities": [...], "paths": [...], "time": int, "solver": str, "options": {...}, "reduce": bool}
+    with cities and paths as lists of records or csv text, or multipart form with
+    files cities, paths, time (csv) and fields solver, options (json), reduce.
+
+    :return: tuple (cities_csv, paths_csv, working_time, solver, options)
+    """
+
+    if request.is_json:
+        data = request.get_json(silent=True)
+        if not isinstance(data, dict):
+            raise ApiError('Body is not a json object!')
+        files = {}
+        for name in ('cities', 'paths'):
+            part = data.get(name)
+            # records are turned into csv text, so the same map hits the cache however it was sent
+            if not isinstance(part, str):
+                df = pd.DataFrame(part or [])
+                if set(df.columns) == set(COLUMNS[name]):
+                    df = df[COLUMNS[name]]
+                part = df.to_csv(index=False)
+            files[name] = part
+        working_time = data.get('time')
+        settings = data
+        options = data.get('options') or {}
+    else:
+        files = {name: request.files[name].read().decode('utf-8')
+                 for name in ('cities', 'paths', 'time') if name in request.files}
+        working_time = request.form.get('time')
+        if 'time' in files:
+            df_time = parse_csv(files['time'])
+            result = fh.validate_time(df_time)
+            if not result.status:
+                raise ApiError(result.msg)
+            working_time = df_time.time.values[0]
+        settings = request.form
+        try:
+            options = json.loads(request.form.get('options') or '{}')
+        except ValueError:
+            raise ApiError('Options are not valid json!')
+
+    if 'cities' not in files or 'paths' not in files:
+        raise ApiError('Cities and paths are required!')
+    try:
+        working_time = int(working_time)
+    except (TypeError, ValueError):
+        raise ApiError('Time is not an integer!')
+
+    solver = settings.get('solver') or 'random'
+    if solver not in SOLVERS:
+        raise ApiError(f'Unknown solver {solver}, use one of {", ".join(SOLVERS)}')
+    if not isinstance(options, dict):
+        raise ApiError('Options have to be a json object!')
+    validate_options(solver, options)
+    if str(settings.get('reduce', '')).lower() in ('1', 'true'):
+        options['reduce'] = True
+
+    return files['cities'], files['paths'], working_time, solver, options
+
+
+def option_types(solver: str, forwarded: bool = True) -> dict:
+    """
+    Returns {name: type} of the options solver takes, type None where any value is passed on.
+    :param forwarded: with options of the functions in FORWARDED
+    """
+    functions = [Instance.solve_random if solver == 'random' else ENGINES[solver]]
+    if forwarded:
+        functions += FORWARDED.get(solver, [])
+    types = {}
+    for function in functions:
+        for name, p in inspect.signature(function).parameters.items():
+            if name in INTERNAL or p.kind in (p.VAR_KEYWORD, p.VAR_POSITIONAL):
+                continue
+            kind = p.annotation if p.annotation in (bool, int, float, str) else type(p.default)
+            if types.get(name) is None:
+                types[name] = kind if kind in (bool, int, float, str) else None
+    if solver == 'portfolio':
+        for engine in SOLVERS:
+            if engine != 'portfolio':
+                for name, kind in option_types(engine, forwarded=False).items():
+                    types.setdefault(name, kind)
+    return types
+
+
+def validate_options(solver: str, options: dict) -> None:
+    """ Checks names and types of options against the parameters of the solver, see option_types. """
+    types = dict(option_types(solver), reduce=bool)
+    for name, value in options.items():
+        if name not in types:
+            raise ApiError(f'Unknown option {name} of solver {solver}, use one of {", ".join(sorted(types))}')
+        kind = types[name]
+        # json has no integer floats, bools are no numbers
+        allowed = (int, float) if kind is float else kind
+        if kind is not None and value is not None and (not isinstance(value, allowed)
+                                                       or isinstance(value, bool) and kind is not bool):
+            raise ApiError(f'Option {name} has to be {kind.__name__}!')
+
+
+def validate_header(txt: str, validate: Callable) -> None:
+    """ Checks columns of csv text with one of file_handlers validators, the rest is not parsed. """
+    try:
+        df = pd.read_csv(io.StringIO(txt), nrows=0)
+    except Exception:
+        df = pd.DataFrame([])
+    result = validate(df)
+    if not result.status:
+        raise ApiError(result.msg)
+
+
+def stream_solution(stats: dict, route: list) -> Iterator[str]:
+    """
+    Yields a compact json object {**stats, "route": [...], "edges": [[from, to], ...]}
+    in chunks of CHUNK cities, so long routes are never held as one string.
+    """
+
+    yield _dumps(stats)[:-1] + ',"route":['
+    for i in range(0, len(route), CHUNK):
+        yield (',' if i else '') + _dumps(route[i:i + CHUNK])[1:-1]
+    yield '],"edges":['
+    for i in range(0, max(len(route) - 1, 0), CHUNK):
+        edges = list(zip(route[i:i + CHUNK], route[i + 1:i + CHUNK + 1]))
+        yield (',' if i else '') + _dumps(edges)[1:-1]
+    yield ']}'
+
+
+def gzip_stream(chunks: Iterator[str], level: int = 6) -> Iterator[bytes]:
+    """ Compresses a stream of text chunks into a gzip stream. """
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    for chunk in chunks:
+        data = compressor.compress(chunk.encode('utf-8'))
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+def register_api(server: flask.Flask, get_instance: Callable) -> None:
+    """
+    Adds POST /api/solve to the server.
+    :param get_instance: function (cities_csv, paths_csv) -> Instance, the cache shared with the UI
+    """
+
+    @server.route('/api/solve', methods=['POST'])
+    def api_solve():
+        tic = time.time()
+        try:
+            cities, paths, working_time, solver, options = read_request(flask.request)
+            validate_header(cities, fh.validate_cities)
+            validate_header(paths, fh.validate_paths)
+
+            instance = get_instance(cities, paths)
+            solution = instance.solve(working_time, solver, **options)
+        except ApiError as e:
+            return flask.jsonify(error=str(e)), 400
+        except (TypeError, ValueError, KeyError, pd.errors.ParserError) as e:
+            # wrong options or data
+            return flask.jsonify(error=f'{type(e).__name__}: {e}'), 400
+
+        bound = instance.upper_bound(working_time)
+        stats = {'solver': solver,
+                 'total': int(solution.total),
+                 'bound': bound,
+                 'gap': round(optimality_gap(solution.total, bound), 4),
+                 'time_used': int(working_time - solution.time_left),
+                 'working_time': working_time,
+                 'status': solution.status,
+                 'runtime': round(time.time() - tic, 4)}
+        if solver == 'portfolio':
+            # the race of a reduced solve ran on the reduced instance
+            solved = instance.reduced(working_time) if options.get('reduce') else instance
+            stats['race'] = solved.races.get(working_time)
+        chunks = stream_solution(stats, [c.name for c in solution.path])
+
+        headers = {'Vary': 'Accept-Encoding'}
+        if 'gzip' in flask.request.headers.get('Accept-Encoding', ''):
+            headers['Content-Encoding'] = 'gzip'
+            chunks = gzip_stream(chunks)
+        return flask.Response(chunks, mimetype='application/json', headers=headers)
@@ -1,30 +1,148 @@
 # -*- coding: utf-8 -*-
+import inspect
+import os
 import time
+from functools import partial
+from threading import RLock
+
 import dash
 import flask
 import dash_core_components as dcc
 import dash_html_components as html
 from dash.dependencies import Input, Output, State
+from dash.exceptions import PreventUpdate
 
 
+import app.catalog as catalog
 import app.components as comp
 import app.file_handlers as fh
-from app.helpers import parse_contents, prepare_data
-from app.solvers import make_plot_data
+from app.api import register_api
+from app.precompute import Precompute
+from app.helpers import (decode_contents, encode_contents, parse_csv, parse_budgets, summarize, query_frame,
+                         base_figure, figure_bytes)
+from app.solvers import make_plot_data, sweep, Instance, InstanceCache, instance_key
+from app.solvers.instance import ENGINES
+from app.validators import cities_problems, paths_problems
 
 
 external_stylesheets = ['https://codepen.io/chriddyp/pen/bWLwgP.css']
 
 
-def create_app():
+def create_app(catalog_dir: str = catalog.CATALOG_DIR, cache_size: int = 8, export_dir: str = fh.EXPORT_DIR):
     """
-    Dash app factory and layout definition
+    Dash app factory and layout definition. All state lives in the app, so every process
+    of a server has its own; maps are shared between processes through the catalog on disk.
+    :param catalog_dir: directory of the instance catalog, see app.catalog
+    :param cache_size: number of maps kept in memory
+    :param export_dir: directory of solution files for download, see file_handlers.save_solution
     """
     app = dash.Dash(__name__, external_stylesheets=external_stylesheets)
     app.config['suppress_callback_exceptions'] = True
 
+    # Parsed maps kept between solves, so a new time.csv does not rebuild the graph.
+    # Shared by the UI and the api, keyed by csv text of cities and paths.
+    instances = InstanceCache(maxsize=cache_size)
+    # Parsed uploads kept for previews, the browser gets one page at a time
+    frames = InstanceCache(maxsize=12)
+    # Serialized base figures of maps, only the route is drawn for every solve
+    figures = InstanceCache()
+    lock = RLock()
+    # Maps are built in the background once cities and paths are uploaded, see precompute_jobs
+    precompute = Precompute()
+
+    def get_frame(txt: str) -> tuple:
+        key = instance_key(txt)
+        with lock:
+            df = frames.get(key)
+            if df is None:
+                df = frames.put(key, parse_csv(txt))
+        return key, df
+
+    def get_instance(cities_csv: str, paths_csv: str, store: bool = True) -> Instance:
+        """
+        Instance of the uploads from the cache, the catalog or built, disk is used outside of the lock.
+        :param store: keep a new instance in the catalog, so other processes map its graph
+        """
+        key = instance_key(cities_csv, paths_csv)
+        with lock:
+            instance = instances.get(key)
+        if instance is not None:
+            return instance
+        try:
+            # built by this or another process before, its graph is memory-mapped
+            instance, stored = catalog.load(key, catalog_dir).instance, True
+        except (KeyError, OSError):
+            instance, stored = Instance(get_frame(cities_csv)[1], get_frame(paths_csv)[1]), False
+        with lock:
+            # two users of a new map may both build it, the first one is kept
+            cached = instances.get(key)
+            instance = instances.put(key, instance) if cached is None else cached
+        if store and not stored:
+            catalog.store(instance, cities_csv, paths_csv, directory=catalog_dir)
+        return instance
+
+    def put_entry(entry: catalog.Entry) -> None:
+        # a reopened instance and its frames, so the uploads it fills in are not parsed again
+        with lock:
+            instances.put(instance_key(entry.cities_csv, entry.paths_csv), entry.instance)
+            frames.put(instance_key(entry.cities_csv), entry.instance.cities)
+            frames.put(instance_key(entry.paths_csv), entry.instance.paths)
+
+    def get_figure(cities_csv: str, paths_csv: str) -> bytes:
+        key = instance_key(cities_csv, paths_csv)
+        with lock:
+            base = figures.get(key)
+        if base is None:
+            # built outside of the lock, two users of a new map may both build it
+            base = figure_bytes(base_figure(get_instance(cities_csv, paths_csv).csr))
+            with lock:
+                figures.put(key, base)
+        return base
+
+    def job_keys(cities_csv: str, paths_csv: str, time_csv: str = None) -> tuple:
+        """ Keys of the graph job, the bounds job and the reduction job of uploads, see precompute_jobs. """
+        time_csv = time_csv or ''
+        return (instance_key(cities_csv, paths_csv), instance_key(cities_csv, paths_csv, time_csv),
+                instance_key(cities_csv, paths_csv, time_csv, 'reduce'))
+
+    def precompute_jobs(cities_csv: str, paths_csv: str, time_csv: str = None) -> dict:
+        """
+        Everything a solve needs besides the search, as jobs {key : steps}, see job_keys: the graph
+        and its figure, which every solve waits for, and for a valid time.csv the bounds and distances
+        from the best starts, read by random walks, and the reduced graph of its budget.
+        Every step keeps its result in a cache, so the solve finds it there.
+        """
+
+        def validate():
+            # invalid uploads are reported by the upload callbacks, nothing is built for them
+            for txt, check in ((cities_csv, fh.validate_cities), (paths_csv, fh.validate_paths)):
+                result = check(get_frame(txt)[1])
+                if not result.status:
+                    raise ValueError(result.msg)
+
+        def instance() -> Instance:
+            return get_instance(cities_csv, paths_csv)
+
+        graph, bounds, reduction = job_keys(cities_csv, paths_csv, time_csv)
+        jobs = {graph: [validate, instance, lambda: get_figure(cities_csv, paths_csv)]}
+        if time_csv is None or not fh.validate_time(get_frame(time_csv)[1]).status:
+            return jobs
+        working_time = int(get_frame(time_csv)[1].time.values[0])
+
+        def distances(k: int = 8):
+            # one step per source, so a cancelled job stops between them
+            names = instance().csr.names
+            best = instance().bounds(working_time).argsort()[::-1][:k]
+            return [lambda name=names[i]: instance().distances(name, working_time) for i in best]
+
+        jobs[bounds] = [validate, lambda: instance().bounds(working_time), distances]
+        jobs[reduction] = [validate, lambda: instance().reduced(working_time).bounds(working_time)]
+        return jobs
+
     app.layout = html.Div([
         dcc.Store(id='memory'),
+        dcc.Store(id='precompute'),
+        dcc.Store(id='pins'),
         html.Div(children=[
             html.H3('Files upload', style={'margin-top': '40px'}),
             comp.vbar(),
@@ -47,12 +165,23 @@ def create_app():
                 ])
             ], style={'width': '100%', 'height': '100px'}),
             comp.button('solve-btn', 'solve'),
+            comp.number_input('beam-width', 100, placeholder='beam width'),
+            comp.number_input('gap-input', None, placeholder='target gap %', max=99),
+            comp.dropdown('solver-select', ['random'] + list(ENGINES), 'random'),
+            comp.checkbox('reduce-check', 'reduce graph'),
+            comp.checkbox('guided-check', 'guided walks'),
+            comp.picker('catalog-select', 'reopen a stored instance'),
+            comp.button('unpin-btn', 'unpin'),
+            comp.dropdown('pin-select', ['pin start', 'pin end'], 'pin start'),
+            comp.button('sweep-btn', 'sweep', align='left'),
+            comp.budgets_input('sweep-input'),
         ]),
 
         html.Div(children=[
             html.Div(id='save-prompt', children=[]),
             dcc.Loading([html.Div(id='tsp-solution', children=[])], color='#1EAEDB'),
-            dcc.Loading([html.Div(id='tsp-graph', children=[])], color='#1EAEDB')
+            dcc.Loading([html.Div(id='tsp-frontier', children=[])], color='#1EAEDB'),
+            dcc.Loading([html.Div(id='tsp-graph', children=[comp.hidden_graph()])], color='#1EAEDB')
         ], style={'margin-top': '40px'})
 
     ], style={'width': '85%', 'margin-left': '7.5%'})
@@ -64,12 +193,12 @@ def create_app():
         if content is not None:
             if '.csv' not in name:
                 return html.Div(['Only .csv files ar supported!']),
-            df = parse_contents(content)
+            key, df = get_frame(decode_contents(content))
             result = fh.validate_cities(df)
             if not result.status:
                 return html.P(result.msg),
 
-            return comp.upload_table(name, df),
+            return comp.upload_table('city-matrix', name, df, key, summarize(df, 'quantity'), cities_problems(df)),
         return None,
 
     @app.callback([Output('output-coordinates', 'children')],
@@ -79,12 +208,12 @@ def create_app():
         if content is not None:
             if '.csv' not in name:
                 return html.Div(['Only .csv files ar supported!']),
-            df = parse_contents(content)
+            key, df = get_frame(decode_contents(content))
             result = fh.validate_paths(df)
             if not result.status:
                 return html.P(result.msg),
 
-            return comp.upload_table(name, df),
+            return comp.upload_table('coordinates', name, df, key, summarize(df, 'time'), paths_problems(df)),
         return None,
 
     @app.callback([Output('output-info', 'children')],
@@ -94,40 +223,133 @@ def create_app():
         if content is not None:
             if '.csv' not in name:
                 return [html.Div(['Only .csv files ar supported!']), {'visibility': 'hidden'}]
-            df = parse_contents(content)
+            key, df = get_frame(decode_contents(content))
             result = fh.validate_time(df)
             if not result.status:
                 return html.P(result.msg),
 
-            return comp.upload_table(name, df),
+            return comp.upload_table('info', name, df, key, summarize(df, 'time'), []),
         return None,
 
+    @app.callback([Output('precompute', 'data')],
+                  [Input('city-matrix-input', 'contents'),
+                   Input('coordinates-input', 'contents'),
+                   Input('info-input', 'contents')],
+                  [State('precompute', 'data')])
+    def start_precompute(city, coords, info, keys):
+        # jobs for the uploads of this session, jobs of replaced uploads are cancelled
+        jobs = {}
+        if city and coords:
+            jobs = precompute_jobs(decode_contents(city), decode_contents(coords),
+                                   decode_contents(info) if info else None)
+        keys = keys or []
+        if keys == list(jobs):
+            raise PreventUpdate
+        for key in keys:
+            if key not in jobs:
+                precompute.cancel(key)
+        for i, (key, steps) in enumerate(jobs.items()):
+            if key not in keys:
+                # work for the budget gives way to searches
+                precompute.submit(key, steps, idle=i > 0)
+        return list(jobs),
+
+    def page_table(page, size, sort_by, filter_query, key):
+        with lock:
+            df = frames.get(key) if key else None
+        if df is None:
+            return [], 1
+        return query_frame(df, page or 0, size or comp.PAGE_SIZE, sort_by, filter_query)
+
+    for idx in ('city-matrix', 'coordinates', 'info'):
+        app.callback([Output(f'{idx}-table', 'data'), Output(f'{idx}-table', 'page_count')],
+                     [Input(f'{idx}-table', 'page_current'),
+                      Input(f'{idx}-table', 'page_size'),
+                      Input(f'{idx}-table', 'sort_by'),
+                      Input(f'{idx}-table', 'filter_query')],
+                     [State(f'{idx}-key', 'data')])(page_table)
+
     @app.callback([Output('tsp-solution', 'children'), Output('memory', 'data')],
                   [Input('solve-btn', 'n_clicks'),
                    Input('city-matrix-input', 'contents'),
                    Input('coordinates-input', 'contents'),
-                   Input('info-input', 'contents')],
-                  [State('memory', 'data')])
-    def generate_solution(n_clicks, city, coords, df_time, cache):
+                   Input('info-input', 'contents'),
+                   Input('pins', 'data')],
+                  [State('memory', 'data'),
+                   State('solver-select', 'value'),
+                   State('beam-width', 'value'),
+                   State('reduce-check', 'value'),
+                   State('guided-check', 'value'),
+                   State('gap-input', 'value')])
+    def generate_solution(n_clicks, city, coords, df_time, pins, cache, solver, width, reduce, guided, gap):
         if n_clicks and city and coords and df_time and n_clicks > 0:
             tic = time.time()
+            clicked = 'solve-btn.n_clicks' in [t['prop_id'] for t in dash.callback_context.triggered]
+
+            cities_csv, paths_csv, time_csv = decode_contents(city), decode_contents(coords), decode_contents(df_time)
+            # the graph may still be built in the background, it is not built twice;
+            # bounds and the reduced graph are waited for only by solves which read them
+            graph_job, bounds_job, reduction_job = job_keys(cities_csv, paths_csv, time_csv)
+            precompute.wait(graph_job)
+            if solver == 'random':
+                precompute.wait(bounds_job)
+            if reduce:
+                precompute.wait(reduction_job)
+            instance = get_instance(cities_csv, paths_csv)
+
+            options = {'width': int(width or 100)} if solver == 'beam' else {}
+            if reduce:
+                options['reduce'] = True
+            if guided and solver == 'random':
+                options['guided'] = True
+            if gap is not None and not 0 <= gap < 100:
+                return [html.P('The target gap has to be at least 0 and below 100 %')], cache
+            if gap and 'gap' in inspect.signature(instance.engine(solver)).parameters:
+                options['gap'] = gap / 100
 
-            df_time = parse_contents(df_time)
-            solution, cities, edges = make_plot_data(cities=parse_contents(city),
-                                                     paths=parse_contents(coords),
-                                                     time=df_time)
+            df_time = get_frame(time_csv)[1]
+            working_time = int(df_time.time.values[0])
+
+            # pins of another map are ignored
+            pins = {k: v for k, v in (pins or {}).items() if v in instance.cities_dict}
+            with precompute.paused():
+                try:
+                    if 'start' in pins:
+                        # a click shows the best route found from the start so far, the solve button refines it
+                        solution = instance.pin(working_time, pins['start'], pins.get('end'), refine=clicked)
+                        cities = list(instance.cities_dict.values())
+                    else:
+                        solution, cities, _ = make_plot_data(cities=instance.cities,
+                                                             paths=instance.paths,
+                                                             time=df_time,
+                                                             instance=instance,
+                                                             solver=solver,
+                                                             **options)
+                        if 'end' in pins:
+                            solution = instance.end_at(solution.path, pins['end'], working_time)
+                except ValueError as e:
+                    # the end is out of reach
+                    return [html.P(str(e))], cache
 
             solving_time = time.time() - tic
 
-            # Save solution
-            fh.save_solution(solution, df_time.time.values[0])
+            # Save solution, and the instance with its caches for the next session
+            job = fh.save_solution(solution, df_time.time.values[0], directory=export_dir)
+            if clicked:
+                # stored in the background, the caches are pickled only if the solve added to them
+                store = partial(catalog.store, instance, cities_csv, paths_csv, time_csv, directory=catalog_dir)
+                precompute.submit(instance_key(cities_csv, paths_csv, time_csv, 'store'), [store], idle=True)
 
             # Generate html elements
             output = [html.H3(children='The magic TSP graph'), comp.vbar()]
-            output += comp.stats(solving_time, solution, cities)
+            race = None
+            if solver == 'portfolio':
+                solved = instance.reduced(working_time) if reduce else instance
+                race = solved.races.get(working_time)
+            output += comp.stats(solving_time, solution, cities, job, race, instance.upper_bound(working_time), pins)
 
-            # Cache data
-            cache = {'cities': prepare_data(cities), 'edges': list(edges)}
+            # Only edge ids of the route go to the browser, the map is drawn from the cached base figure
+            cache = {'edges': solution.edges.tolist()}
 
             return output, cache
 
@@ -136,15 +358,89 @@ def create_app():
 
         return None, dict()
 
+    @app.callback([Output('pins', 'data')],
+                  [Input('example-graph', 'clickData'),
+                   Input('unpin-btn', 'n_clicks')],
+                  [State('pin-select', 'value'),
+                   State('pins', 'data'),
+                   State('city-matrix-input', 'contents'),
+                   State('coordinates-input', 'contents')])
+    def pin_city(click, n_clicks, mode, pins, city, coords):
+        triggered = [t['prop_id'] for t in dash.callback_context.triggered]
+        if 'unpin-btn.n_clicks' in triggered and n_clicks:
+            return {},
+        if not (click and click.get('points') and city and coords):
+            raise PreventUpdate
+        # clicks on edges and the route snap to the closest city
+        point = click['points'][0]
+        instance = get_instance(decode_contents(city), decode_contents(coords))
+        pins = dict(pins or {})
+        pins[mode.split()[-1]] = instance.nearest_city(point['x'], point['y'])
+        return pins,
+
+    @app.callback([Output('catalog-select', 'options')],
+                  [Input('memory', 'data')])
+    def list_catalog(_):
+        return [{'label': f"{e['name']}, budget {e['working_time']}, "
+                          f"{time.strftime('%Y-%m-%d %H:%M', time.localtime(e['used']))}",
+                 'value': e['key']} for e in catalog.list_entries(catalog_dir)],
+
+    @app.callback([Output('city-matrix-input', 'contents'), Output('city-matrix-input', 'filename'),
+                   Output('coordinates-input', 'contents'), Output('coordinates-input', 'filename'),
+                   Output('info-input', 'contents'), Output('info-input', 'filename')],
+                  [Input('catalog-select', 'value')])
+    def open_catalog(key):
+        if not key:
+            raise PreventUpdate
+        try:
+            entry = catalog.load(key, catalog_dir)
+        except KeyError:
+            # evicted since the list was shown
+            raise PreventUpdate
+        put_entry(entry)
+        time_csv = entry.time_csv
+        return (encode_contents(entry.cities_csv), catalog.CITIES_FILE,
+                encode_contents(entry.paths_csv), catalog.PATHS_FILE,
+                encode_contents(time_csv) if time_csv is not None else None, catalog.TIME_FILE)
+
+    @app.callback([Output('tsp-frontier', 'children')],
+                  [Input('sweep-btn', 'n_clicks')],
+                  [State('sweep-input', 'value'),
+                   State('city-matrix-input', 'contents'),
+                   State('coordinates-input', 'contents')])
+    def generate_frontier(n_clicks, budgets, city, coords):
+        if n_clicks and n_clicks > 0:
+            if not (city and coords):
+                return html.P('no data'),
+            try:
+                budgets = parse_budgets(budgets or '')
+            except ValueError as e:
+                return html.P(str(e)),
+            if not budgets:
+                return html.P('No budgets given!'),
+
+            tic = time.time()
+            frontier = sweep(get_instance(decode_contents(city), decode_contents(coords)), budgets)
+            solving_time = time.time() - tic
+
+            budgets = sorted(set(budgets))
+            totals = [s.total for s in frontier]
+            return [html.H3(children='Value vs working time'), comp.vbar(),
+                    html.P(f'Sweep of {len(budgets)} budgets: {solving_time:.4f}'),
+                    comp.frontier(budgets, totals)],
+        return None,
+
     @app.callback([Output('tsp-graph', 'children')],
                   [Input('memory', 'data')],
-                  [State('memory', 'data')])
-    def show_plot(cache):
-        if cache:
-            cities, edges = cache.values()
-            plot = comp.graph(cities, edges)
+                  [State('city-matrix-input', 'contents'),
+                   State('coordinates-input', 'contents')])
+    def show_plot(cache, city, coords):
+        if cache and city and coords:
+            city, coords = decode_contents(city), decode_contents(coords)
+            instance = get_instance(city, coords)
+            plot = comp.graph(get_figure(city, coords), instance.csr, cache['edges'])
             return plot,
-        return None,
+        return comp.hidden_graph(),
 
     @app.callback([Output('save-prompt', 'children')],
                   [Input('save-btn', 'n_clicks')])
@@ -155,11 +451,27 @@ def create_app():
 
         return None,
 
+    # maps of the api are not written to the catalog, it would keep every upload of scripts
+    register_api(app.server, partial(get_instance, store=False))
+
     @app.server.route('/tmp/solution')
     def download_solution():
-        return flask.send_file('tmp/solution.txt',
-                               mimetype='text',
-                               attachment_filename='solution.txt',
-                               as_attachment=True)
+        path = fh.find_export(flask.request.args.get('job', ''), export_dir)
+        try:
+            # opened here, so eviction cannot remove the file under a started download
+            file = open(path, 'rb') if path else None
+        except FileNotFoundError:
+            file = None
+        if file is None:
+            return flask.abort(404)
+
+        def read_chunks(size: int = 2 ** 16):
+            with file:
+                for chunk in iter(lambda: file.read(size), b''):
+                    yield chunk
+
+        name = os.path.basename(path).replace(f"_{flask.request.args['job']}", '')
+        return flask.Response(read_chunks(), mimetype=fh.EXPORT_TYPES[name.rsplit('.', 1)[1]],
+                              headers={'Content-Disposition': f'attachment; filename={name}'})
 
     return app
@@ -0,0 +1,231 @@
+import argparse
+import csv
+import inspect
+import json
+import os
+import random
+import sys
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from time import time as now
+from typing import Iterable, Iterator, List
+
+import numpy as np
+import pandas as pd
+
+from app.solvers import Instance
+from app.solvers.bounds import optimality_gap
+from app.solvers.instance import ENGINES
+
+try:
+    import resource
+except ImportError:  # not available on Windows
+    resource = None
+
+COORDS_FILE_NAME = 'cities.csv'
+TIMES_FILE_NAME = 'paths.csv'
+WORKTIME_FILE_NAME = 'time.csv'
+
+FIELDS = ['instance', 'solver', 'total', 'bound', 'gap', 'time_used', 'working_time', 'status', 'runtime',
+          'peak_memory', 'route', 'error']
+
+# solvers which stop at a wall-clock deadline, directly or through the options they pass on
+DEADLINE_SOLVERS = ['aco', 'annealing', 'decomposition', 'exact', 'portfolio']
+
+
+def find_instances(paths: Iterable[str]) -> List[str]:
+    """
+    Returns instance directories, ones holding cities.csv, paths.csv and time.csv.
+    A directory without them is searched one level down, so a whole folder of depots can be given.
+    """
+
+    def is_instance(directory):
+        return all(os.path.isfile(os.path.join(directory, f))
+                   for f in (COORDS_FILE_NAME, TIMES_FILE_NAME, WORKTIME_FILE_NAME))
+
+    directories = []
+    for path in paths:
+        if is_instance(path) or not os.path.isdir(path):
+            # missing instances are kept so that they are reported with an error
+            directories.append(path)
+        else:
+            directories += sorted(e.path for e in os.scandir(path) if e.is_dir() and is_instance(e.path))
+    return directories
+
+
+def load_instance(directory: str) -> tuple:
+    """ Returns (df_cities, df_paths, working_time) read from an instance directory. """
+    df_cities = pd.read_csv(os.path.join(directory, COORDS_FILE_NAME))
+    df_paths = pd.read_csv(os.path.join(directory, TIMES_FILE_NAME))
+    df_time = pd.read_csv(os.path.join(directory, WORKTIME_FILE_NAME))
+    return df_cities, df_paths, int(df_time['time'].values[0])
+
+
+def solver_options(solver: str, seed: int = None, deadline: float = None, **options) -> dict:
+    """
+    Adds seed to options of the solvers which take it, and deadline to options of DEADLINE_SOLVERS.
+    Raises ValueError for a deadline of another solver, it would not be kept.
+    """
+    if deadline is not None:
+        if solver not in DEADLINE_SOLVERS:
+            raise ValueError(f'solver {solver} does not take a deadline, only {", ".join(DEADLINE_SOLVERS)}')
+        options['deadline'] = deadline
+    engine = Instance.solve_random if solver == 'random' else ENGINES[solver]
+    parameters = inspect.signature(engine).parameters
+    if seed is not None and ('seed' in parameters or any(p.kind == p.VAR_KEYWORD for p in parameters.values())):
+        options['seed'] = seed
+    return options
+
+
+# number of instances solved by this process, see instance_peak
+_solved = 0
+
+
+def peak_memory() -> int:
+    """ Peak resident memory of this process in kB, None where it cannot be read. """
+    if resource is None:
+        return None
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+def instance_peak(before: int, after: int) -> int:
+    """
+    Peak resident memory of the instance just solved, from peak_memory before and after it.
+    The peak of a process never goes down, so in a process which solved instances before it is
+    known only when this instance raised it; None otherwise, not the peak of an earlier instance.
+    """
+    global _solved
+    _solved += 1
+    if after is None or (_solved > 1 and after <= before):
+        return None
+    return after
+
+
+def solve_directory(directory: str, solver: str = 'random', seed: int = None,
+                    deadline: float = None, **options) -> dict:
+    """
+    Solves one instance directory and returns a record with FIELDS.
+    Errors are reported in the record, so one broken instance does not stop a batch.
+    peak_memory is the high-water mark of the process while it solved the instance, see instance_peak.
+    """
+
+    record = dict.fromkeys(FIELDS)
+    record.update(instance=directory, solver=solver)
+    tic = now()
+    before = peak_memory()
+    try:
+        if seed is not None:
+            # random walks use the global generators
+            random.seed(seed)
+            np.random.seed(seed)
+
+        df_cities, df_paths, working_time = load_instance(directory)
+        instance = Instance(df_cities, df_paths)
+        solution = instance.solve(working_time, solver, **solver_options(solver, seed, deadline, **options))
+        bound = instance.upper_bound(working_time)
+        record.update(total=int(solution.total),
+                      bound=bound,
+                      gap=round(optimality_gap(solution.total, bound), 4),
+                      time_used=int(working_time - solution.time_left),
+                      working_time=working_time,
+                      status=solution.status,
+                      route=[c.name for c in solution.path])
+    except Exception as e:
+        record['error'] = f'{type(e).__name__}: {e}'
+
+    record.update(runtime=round(now() - tic, 3), peak_memory=instance_peak(before, peak_memory()))
+    return record
+
+
+def _solve_task(args: tuple) -> dict:
+    directory, solver, seed, deadline, options = args
+    return solve_directory(directory, solver, seed, deadline, **options)
+
+
+def run_batch(directories: Iterable[str], solver: str = 'random', seed: int = None, deadline: float = None,
+              workers: int = None, **options) -> Iterator[dict]:
+    """
+    Solves instance directories in a pool of processes, yielding records as soon as they are done,
+    so results are not held until the whole batch ends.
+
+    :param solver: 'random' or one of ENGINES
+    :param seed: random seed, the same for every instance so results do not depend on scheduling
+    :param deadline: wall-clock limit in seconds, only for DEADLINE_SOLVERS
+    :param workers: number of processes, os.cpu_count() by default, 1 solves in this process
+    :param options: passed to the solver
+    """
+
+    # a deadline which is not kept is reported once, not by every record
+    solver_options(solver, seed, deadline)
+    tasks = [(directory, solver, seed, deadline, options) for directory in directories]
+    if workers == 1:
+        yield from map(_solve_task, tasks)
+        return
+
+    with ProcessPoolExecutor(workers) as pool:
+        futures = [pool.submit(_solve_task, task) for task in tasks]
+        for future in as_completed(futures):
+            yield future.result()
+
+
+def write_json(records: Iterable[dict], file) -> int:
+    """ Writes records as JSON lines, one line per instance. Returns number of records. """
+    n = 0
+    for n, record in enumerate(records, 1):
+        file.write(json.dumps(record) + '\n')
+        file.flush()
+    return n
+
+
+def write_csv(records: Iterable[dict], file) -> int:
+    """ Writes records as csv rows, route as city names separated by spaces. Returns number of records. """
+    writer = csv.DictWriter(file, FIELDS)
+    writer.writeheader()
+    n = 0
+    for n, record in enumerate(records, 1):
+        writer.writerow(dict(record, route=' '.join(record['route'] or [])))
+        file.flush()
+    return n
+
+
+def parse_option(txt: str) -> tuple:
+    """ Parses solver option key=value, value as int or float where possible. """
+    key, sep, value = txt.partition('=')
+    if not sep:
+        raise argparse.ArgumentTypeError(f'option {txt!r} is not key=value')
+    for kind in (int, float):
+        try:
+            return key, kind(value)
+        except ValueError:
+            pass
+    return key, value
+
+
+def main(argv: List[str] = None) -> int:
+    parser = argparse.ArgumentParser(description='Solve instance directories without the web app.')
+    parser.add_argument('paths', nargs='+',
+                        help='instance directories with cities.csv, paths.csv and time.csv, or their parents')
+    parser.add_argument('-s', '--solver', default='random', choices=['random'] + list(ENGINES))
+    parser.add_argument('--seed', type=int, default=None)
+    parser.add_argument('--deadline', type=float, default=None,
+                        help='time limit per instance in seconds, for ' + ', '.join(DEADLINE_SOLVERS))
+    parser.add_argument('-j', '--workers', type=int, default=None, help='number of processes')
+    parser.add_argument('-f', '--format', default='json', choices=['json', 'csv'])
+    parser.add_argument('-o', '--output', default=None, help='output file, standard output by default')
+    parser.add_argument('-O', '--option', type=parse_option, action='append', default=[],
+                        help='solver option key=value, e.g. -O width=50')
+    args = parser.parse_args(argv)
+    try:
+        solver_options(args.solver, args.seed, args.deadline)
+    except ValueError as e:
+        parser.error(str(e))
+
+    records = run_batch(find_instances(args.paths), args.solver, args.seed, args.deadline, args.workers,
+                        **dict(args.option))
+    write = write_json if args.format == 'json' else write_csv
+
+    if args.output is None:
+        write(records, sys.stdout)
+    else:
+        with open(args.output, 'w', newline='') as file:
+            write(records, file)
+    return 0
@@ -0,0 +1,189 @@
+import os
+import pickle
+import shutil
+import sqlite3
+import time as clock
+import uuid
+from collections import namedtuple
+from contextlib import contextmanager
+from typing import Iterator
+
+import pandas as pd
+from atomicwrites import atomic_write
+
+from app.solvers import Instance
+from app.solvers.graph import Graph
+from app.solvers.instance import instance_key
+
+Entry = namedtuple('Entry', ['instance', 'cities_csv', 'paths_csv', 'time_csv'])
+
+CATALOG_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'catalog')
+INDEX_NAME = 'index.sqlite'
+MAX_BYTES = 2 ** 30
+
+# files of an entry: uploads as they were, so an entry is also an instance directory for batch runs,
+# and the compiled graph, data frames and caches of the instance
+CITIES_FILE = 'cities.csv'
+PATHS_FILE = 'paths.csv'
+TIME_FILE = 'time.csv'
+GRAPH_DIR = 'graph'
+FRAMES_FILE = 'frames.pkl'
+CACHES_FILE = 'caches.pkl'
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS instances (
+    key TEXT PRIMARY KEY,
+    name TEXT NOT NULL,
+    cities INTEGER NOT NULL,
+    paths INTEGER NOT NULL,
+    working_time INTEGER,
+    bytes INTEGER NOT NULL,
+    created REAL NOT NULL,
+    used REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS instances_used ON instances (used);
+"""
+
+
+@contextmanager
+def connect(directory: str = CATALOG_DIR) -> Iterator[sqlite3.Connection]:
+    """ Opens the index of a catalog, creating it if needed; commits and closes it at the end. """
+    os.makedirs(directory, exist_ok=True)
+    connection = sqlite3.connect(os.path.join(directory, INDEX_NAME), timeout=30)
+    try:
+        connection.row_factory = sqlite3.Row
+        connection.executescript(SCHEMA)
+        with connection:
+            yield connection
+    finally:
+        connection.close()
+
+
+def _write(path: str, data: bytes) -> None:
+    with atomic_write(path, mode='wb', overwrite=True) as file:
+        file.write(data)
+
+
+def _size(folder: str) -> int:
+    return sum(os.path.getsize(os.path.join(root, name)) for root, _, names in os.walk(folder) for name in names)
+
+
+def store(instance: Instance, cities_csv: str, paths_csv: str, time_csv: str = None, name: str = None,
+          directory: str = CATALOG_DIR, max_bytes: int = MAX_BYTES) -> str:
+    """
+    Stores an instance in the catalog under the hash of its csv files. Files of a new entry are
+    written once; an entry stored again gets the current budget and last use time, and its caches
+    if searches added to them since they were stored. Least recently used entries are evicted afterwards.
+
+    :param time_csv: time.csv of the last solve, its budget is kept in the index
+    :param name: shown in the picker, number of cities by default
+    :return: key of the entry
+    """
+
+    key = instance_key(cities_csv, paths_csv)
+    folder = os.path.join(directory, key)
+    os.makedirs(folder, exist_ok=True)
+
+    if not all(os.path.isfile(os.path.join(folder, f)) for f in (CITIES_FILE, PATHS_FILE, FRAMES_FILE)):
+        _write(os.path.join(folder, CITIES_FILE), cities_csv.encode('utf-8'))
+        _write(os.path.join(folder, PATHS_FILE), paths_csv.encode('utf-8'))
+        _write(os.path.join(folder, FRAMES_FILE), pickle.dumps((instance.cities, instance.paths)))
+    if not os.path.isdir(os.path.join(folder, GRAPH_DIR)):
+        # the graph is written aside and renamed, so it is never seen half written
+        temporary = os.path.join(folder, f'{GRAPH_DIR}.{uuid.uuid4().hex}')
+        instance.csr.save(temporary)
+        try:
+            os.rename(temporary, os.path.join(folder, GRAPH_DIR))
+        except OSError:
+            # stored by another process meanwhile
+            shutil.rmtree(temporary, ignore_errors=True)
+    if time_csv is not None:
+        _write(os.path.join(folder, TIME_FILE), time_csv.encode('utf-8'))
+    # read before the caches are copied, additions made meanwhile are stored next time
+    changed = instance.caches_changed
+    if instance.caches_stored != changed or not os.path.isfile(os.path.join(folder, CACHES_FILE)):
+        _write(os.path.join(folder, CACHES_FILE), pickle.dumps(instance.dump_caches()))
+        instance.caches_stored = changed
+
+    working_time = None
+    if time_csv is not None:
+        try:
+            working_time = int(pd.read_csv(os.path.join(folder, TIME_FILE))['time'].values[0])
+        except (KeyError, IndexError, ValueError, pd.errors.ParserError):
+            pass
+
+    now = clock.time()
+    with connect(directory) as connection:
+        connection.execute(
+            'INSERT INTO instances (key, name, cities, paths, working_time, bytes, created, used) '
+            'VALUES (?, ?, ?, ?, ?, ?, ?, ?) '
+            'ON CONFLICT (key) DO UPDATE SET working_time = COALESCE(excluded.working_time, working_time), '
+            'bytes = excluded.bytes, used = excluded.used',
+            (key, name or f'{instance.csr.n} cities', instance.csr.n, len(instance.csr.indices) // 2,
+             working_time, _size(folder), now, now))
+    evict(directory, max_bytes, keep=key)
+    return key
+
+
+def load(key: str, directory: str = CATALOG_DIR, mmap: bool = True) -> Entry:
+    """
+    Reopens a stored instance with its graph and caches read from disk, no csv is parsed.
+    Raises KeyError for an unknown or evicted key, or an entry missing files.
+    :param mmap: memory-map arrays of the graph, so processes opening the same instance share them
+    """
+
+    with connect(directory) as connection:
+        found = connection.execute('UPDATE instances SET used = ? WHERE key = ?', (clock.time(), key)).rowcount
+    folder = os.path.join(directory, key)
+    if not found or not os.path.isdir(folder):
+        raise KeyError(key)
+
+    def read(file_name):
+        path = os.path.join(folder, file_name)
+        if not os.path.isfile(path):
+            return None
+        with open(path, 'rb') as file:
+            return file.read()
+
+    frames, cities_csv, paths_csv = read(FRAMES_FILE), read(CITIES_FILE), read(PATHS_FILE)
+    if frames is None or cities_csv is None or paths_csv is None or not os.path.isdir(os.path.join(folder, GRAPH_DIR)):
+        # e.g. a store of another process which has not finished, or files removed by hand
+        raise KeyError(key)
+    cities, paths = pickle.loads(frames)
+    instance = Instance(cities, paths, csr=Graph.load(os.path.join(folder, GRAPH_DIR), mmap))
+    caches = read(CACHES_FILE)
+    if caches is not None:
+        instance.load_caches(pickle.loads(caches))
+        instance.caches_stored = instance.caches_changed
+
+    time_csv = read(TIME_FILE)
+    return Entry(instance, cities_csv.decode('utf-8'), paths_csv.decode('utf-8'),
+                 time_csv.decode('utf-8') if time_csv is not None else None)
+
+
+def list_entries(directory: str = CATALOG_DIR) -> list:
+    """ Returns index rows of stored instances as dictionaries, most recently used first. """
+    with connect(directory) as connection:
+        return [dict(row) for row in connection.execute('SELECT * FROM instances ORDER BY used DESC')]
+
+
+def evict(directory: str = CATALOG_DIR, max_bytes: int = MAX_BYTES, keep: str = None) -> list:
+    """
+    Removes least recently used entries until all of them take at most max_bytes.
+    :param keep: key which is never removed, e.g. the one just stored
+    :return: removed keys
+    """
+
+    removed = []
+    with connect(directory) as connection:
+        used = 0
+        for row in connection.execute('SELECT key, bytes FROM instances ORDER BY used DESC').fetchall():
+            used += row['bytes']
+            if used > max_bytes and row['key'] != keep:
+                connection.execute('DELETE FROM instances WHERE key = ?', (row['key'],))
+                removed.append(row['key'])
+                used -= row['bytes']
+
+    for key in removed:
+        shutil.rmtree(os.path.join(directory, key), ignore_errors=True)
+    return removed
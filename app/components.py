@@ -4,7 +4,8 @@ import dash_table
 import pandas as pd
 import numpy as np
 
-from app.helpers import make_graph
+from app.helpers import make_graph, make_frontier
+from app.solvers.bounds import optimality_gap
 
 
 def button(idx: str, txt: str, align: str = 'right'):
@@ -18,10 +19,10 @@ def button(idx: str, txt: str, align: str = 'right'):
                        n_clicks=0)
 
 
-def graph(cities, edges):
+def graph(base: bytes, csr, edges):
     return dcc.Graph(
         id='example-graph',
-        figure=make_graph(cities, edges),
+        figure=make_graph(base, csr, edges),
         style={
             'width': '100%',
             'height': '1000px',
@@ -29,6 +30,62 @@ def graph(cities, edges):
     )
 
 
+def hidden_graph():
+    """ Placeholder of the map before a solve, keeps inputs of callbacks on clicks in the layout. """
+    return dcc.Graph(id='example-graph', figure={}, style={'display': 'none'})
+
+
+def frontier(budgets, totals):
+    return dcc.Graph(
+        id='frontier-graph',
+        figure=make_frontier(budgets, totals),
+        style={
+            'width': '100%',
+            'height': '400px',
+        }
+    )
+
+
+def budgets_input(idx: str, placeholder: str = '30:120:10 or 30, 60, 90'):
+    return dcc.Input(id=idx,
+                     type='text',
+                     placeholder=placeholder,
+                     style={'margin-top': '20px', 'margin-right': '10px', 'float': 'right'})
+
+
+def dropdown(idx: str, options: list, value: str):
+    return html.Div(dcc.Dropdown(id=idx,
+                                 options=[{'label': o, 'value': o} for o in options],
+                                 value=value,
+                                 clearable=False),
+                    style={'margin-top': '20px', 'margin-right': '10px', 'width': '150px', 'float': 'right'})
+
+
+def picker(idx: str, placeholder: str):
+    """ Dropdown with options set by a callback. """
+    return html.Div(dcc.Dropdown(id=idx,
+                                 options=[],
+                                 placeholder=placeholder),
+                    style={'margin-top': '20px', 'margin-right': '10px', 'width': '300px', 'float': 'right'})
+
+
+def number_input(idx: str, value: int, placeholder: str = '', max: int = None):
+    return dcc.Input(id=idx,
+                     type='number',
+                     value=value,
+                     min=1,
+                     max=max,
+                     placeholder=placeholder,
+                     style={'margin-top': '20px', 'margin-right': '10px', 'width': '100px', 'float': 'right'})
+
+
+def checkbox(idx: str, label: str):
+    return dcc.Checklist(id=idx,
+                         options=[{'label': label, 'value': 'on'}],
+                         value=[],
+                         style={'margin-top': '25px', 'margin-right': '10px', 'float': 'right'})
+
+
 def upload(idx: str, name: str = 'Select Files'):
     return html.Div([
         html.P(name),
@@ -54,28 +111,86 @@ def upload(idx: str, name: str = 'Select Files'):
     ])
 
 
-def stats(solve_time: float, solution, cities):
+def race_report(reports: list) -> list:
+    """ List items for reports of a portfolio race, the winner first. """
+    items = []
+    for r in reports:
+        result = r['error'] or str(r['total'])
+        if r['status'] == 'gap':
+            result += ', stopped within the target gap'
+        elif r['status'] not in (None, 'complete'):
+            result += f", stopped by the {r['status']} limit"
+        items.append(html.Li(html.P(f"{r['engine']}: {result} in {r['runtime']:.2f} s")))
+    return [html.Li(html.P(f"Portfolio won by {reports[0]['engine']}")), html.Ul(items)] if reports else []
+
+
+def stopped(status: str) -> list:
+    """ Note on a search which did not run to the end, none for the others. """
+    if status == 'gap':
+        return [html.Li(html.P('Search stopped within the target gap'))]
+    if status not in (None, 'complete'):
+        return [html.Li(html.P(f'Search stopped by the {status} limit, best path found so far'))]
+    return []
+
+
+def stats(solve_time: float, solution, cities, job: str = None, race: list = None, bound: int = None,
+          pins: dict = None):
+    pins = pins or {}
     return [
         html.Div([
             html.H6('SOLUTION:'),
             html.Li(html.P(f'Solving time: {solve_time:.4f}')),
+            *[html.Li(html.P(f'Pinned {k}: {pins[k]}')) for k in ('start', 'end') if k in pins],
             html.Li(html.P(f"Path: {', '.join([c.name for c in solution.path])}")),
             html.Li(html.P(f'Time left: {solution.time_left}')),
             html.Li(html.P(f'Earned / total: {solution.total}')),
+            *([html.Li(html.P(f'Upper bound: {bound}, gap: {optimality_gap(solution.total, bound):.1%}'))]
+              if bound is not None else []),
+            *stopped(solution.status),
+            *race_report(race or []),
             html.Li(html.P(f'Mean quantity: {float(np.mean([c.value for c in cities])):.2f}')),
-            html.A('Download', href="/tmp/solution", target='blank')
+            html.A('Download', href=f"/tmp/solution?job={job}", target='blank')
             ])
     ]
 
 
-def upload_table(name: str, df: pd.DataFrame):
+PAGE_SIZE = 10
+
+
+def summary_card(name: str, summary: dict, problems: list):
+    items = [html.Li(html.P(f"Rows: {summary['rows']}"))]
+    if 'histogram' in summary:
+        counts, edges = summary['histogram']
+        items.append(html.Li(html.P(f"{summary['column']}: min {summary['min']}, "
+                                    f"median {summary['median']}, max {summary['max']}")))
+        items.append(html.Li(html.P(' | '.join(f'{a:g}-{b:g}: {c}'
+                                               for a, b, c in zip(edges[:-1], edges[1:], counts)))))
+    items += [html.Li(html.P(p, style={'color': '#D9534F'})) for p in problems] or \
+             [html.Li(html.P('No problems found'))]
+    return html.Div([html.H6(f'File {name} successfully uploaded!')] + items)
+
+
+def upload_table(idx: str, name: str, df: pd.DataFrame, key: str, summary: dict, problems: list):
+    """
+    Summary of the uploaded file and a preview table, pages are read from the frame kept
+    on the server (see app_factory), so the browser gets only PAGE_SIZE rows at a time.
+    """
     return html.Div([
-        html.P(f'File {name} successfully uploaded!'),
+        summary_card(name, summary, problems),
+        dcc.Store(id=f'{idx}-key', data=key),
         dash_table.DataTable(
-            data=df.to_dict('rows'),
+            id=f'{idx}-table',
             columns=[{'name': i, 'id': i} for i in df.columns],
+            page_current=0,
+            page_size=PAGE_SIZE,
+            page_action='custom',
+            sort_action='custom',
+            sort_mode='multi',
+            sort_by=[],
+            filter_action='custom',
+            filter_query='',
             style_cell={'textAlign': 'center', 'width': '150px'},
-            n_fixed_rows=1,
+            fixed_rows={'headers': True},
             style_table={'maxHeight': '300px'},
         ),
     ])
@@ -1,15 +1,131 @@
+import csv
+import gzip
+import io
+import json
+import os
+import re
+import time as clock
+import uuid
 import pandas as pd
 from collections import namedtuple
 
-from app.solvers.solver import Output
+from atomicwrites import atomic_write
+
+from app.solvers.random_solver import Output
 
 Result = namedtuple('Result', ['status', 'msg'])
 
+EXPORT_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'tmp')
+EXPORT_FORMATS = ('csv', 'json')
+# media types of downloads by file extension, exports may be gzipped
+EXPORT_TYPES = {'csv': 'text/csv', 'json': 'application/json', 'gz': 'application/gzip'}
+JOB_ID = re.compile(r'^[0-9a-f]{32}$')
+
+
+def new_job() -> str:
+    """ Returns a new job id, used to name solution exports. """
+    return uuid.uuid4().hex
+
+
+def export_name(job: str, fmt: str = 'csv', compress: bool = False) -> str:
+    if not JOB_ID.match(job or '') or fmt not in EXPORT_FORMATS:
+        raise ValueError('Wrong job id or format!')
+    return f'solution_{job}.{fmt}' + ('.gz' if compress else '')
+
+
+def dump_solution(solution: Output, time: int, fmt: str = 'csv') -> str:
+    """
+    Returns solution as text: csv with one row per visited city (name, x, y, quantity)
+    or json {"total", "time_used", "working_time", "path": [[name, x, y, quantity], ...]},
+    with "edges": [[from, to, time], ...] too if the solution has edge ids.
+    """
+
+    path = [(c.name, int(c.x), int(c.y), int(c.value)) for c in solution.path]
+    if fmt == 'json':
+        data = {'total': int(solution.total),
+                'time_used': int(time - solution.time_left),
+                'working_time': int(time),
+                'path': path}
+        if solution.edges is not None and solution.path:
+            times = solution.path[0].graph.edge_time[solution.edges].tolist()
+            data['edges'] = [[a.name, b.name, t] for a, b, t in zip(solution.path[:-1], solution.path[1:], times)]
+        return json.dumps(data, separators=(',', ':'))
+    buffer = io.StringIO()
+    writer = csv.writer(buffer, lineterminator='\n')
+    writer.writerow(['name', 'x', 'y', 'quantity'])
+    writer.writerows(path)
+    return buffer.getvalue()
+
+
+def save_solution(solution: Output, time: int, job: str = None, fmt: str = 'csv', compress: bool = False,
+                  directory: str = EXPORT_DIR, **limits) -> str:
+    """
+    Writes solution atomically to its own file per job, so concurrent users never see
+    each other's or half written files. Old exports are evicted afterwards.
+    :param job: job id, a new one if not given
+    :param compress: gzip the file
+    :param limits: passed to evict_exports (max_age, max_bytes)
+    :return: job id
+    """
+
+    job = job or new_job()
+    data = dump_solution(solution, time, fmt).encode('utf-8')
+    if compress:
+        data = gzip.compress(data)
+
+    os.makedirs(directory, exist_ok=True)
+    with atomic_write(os.path.join(directory, export_name(job, fmt, compress)), mode='wb', overwrite=True) as file:
+        file.write(data)
+
+    evict_exports(directory, **limits)
+    return job
+
+
+def find_export(job: str, directory: str = EXPORT_DIR) -> str:
+    """ Returns path of the export of a job, csv before json, None if there is none. """
+    for fmt in EXPORT_FORMATS:
+        for compress in (False, True):
+            try:
+                path = os.path.join(directory, export_name(job, fmt, compress))
+            except ValueError:
+                return None
+            if os.path.isfile(path):
+                return path
+    return None
+
+
+def evict_exports(directory: str = EXPORT_DIR, max_age: float = 24 * 3600, max_bytes: int = 100 * 2 ** 20) -> list:
+    """
+    Removes exports older than max_age seconds, then the oldest ones until
+    all of them take at most max_bytes. Returns removed paths.
+    """
+
+    try:
+        entries = [e for e in os.scandir(directory) if e.is_file() and e.name.startswith('solution_')]
+    except FileNotFoundError:
+        return []
+
+    files = []
+    for e in entries:
+        try:
+            st = e.stat()
+        except FileNotFoundError:  # removed by another process
+            continue
+        files.append((st.st_mtime, st.st_size, e.path))
+    files.sort(reverse=True)
 
-def save_solution(solution: Output, time: int) -> None:
-    txt = f"{[(c.name, c.x, c.y, c.value) for c in solution.path]}\n{solution.total}\n{time - solution.time_left}"
-    with open('app/tmp/solution.txt', 'w') as file:
-        file.write(txt)
+    removed = []
+    now = clock.time()
+    used = 0
+    for mtime, size, path in files:
+        used += size
+        if now - mtime > max_age or used > max_bytes:
+            try:
+                os.remove(path)
+                removed.append(path)
+            except FileNotFoundError:
+                pass
+    return removed
 
 
 def validate_cities(df: pd.DataFrame) -> Result:
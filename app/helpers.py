@@ -1,129 +1,227 @@
 import base64
 import io
+import json
+import numpy as np
 import plotly.graph_objs as go
-from plotly.graph_objs.scatter import Marker
-import networkx as nx
-from typing import List, Tuple
+from typing import List
 import pandas as pd
-from functools import reduce
-from time import time as now
 
-from app.solvers import City
+from app.solvers.graph import Graph
 
 
-def prepare_data(cities: List[City]):
-    return [(city.name, {'pos': (city.x, city.y), 'name': city.name, 'quantity': city.value})
-            for city in cities]
+def decode_contents(contents: str) -> str:
+    """
+    Helper for decoding uploaded file to text
+    """
+    content_type, content_string = contents.split(',')
+    return base64.b64decode(content_string).decode('utf-8')
+
+
+def encode_contents(txt: str, content_type: str = 'text/csv') -> str:
+    """
+    Helper for encoding text as upload contents, reverse of decode_contents
+    """
+    return f'data:{content_type};base64,' + base64.b64encode(txt.encode('utf-8')).decode('ascii')
+
+
+def parse_csv(txt: str) -> pd.DataFrame:
+    """
+    Helper for parsing .csv text, empty data frame if it is not a csv
+    """
+    try:
+        return pd.read_csv(io.StringIO(txt))
+    except Exception as e:
+        print(e)
+        return pd.DataFrame([])
 
 
 def parse_contents(contents: str) -> pd.DataFrame:
     """
     Helper for parsing uploaded .csv file
     """
-    content_type, content_string = contents.split(',')
-    decoded = base64.b64decode(content_string)
     try:
         # Assume that the user uploaded a CSV file
-        df = pd.read_csv(io.StringIO(decoded.decode('utf-8')))
-        return df
+        return parse_csv(decode_contents(contents))
     except Exception as e:
         print(e)
         return pd.DataFrame([])
 
 
-def _color_edge(info: dict) -> dict:
-    if info['solution']:
-        return dict(width=8, color='#1EAEDB')
-    return dict(width=0.8, color='#888')
-
-
-def make_graph(nodes: List[City], edges: List[Tuple[str, str]]):
-    G = nx.Graph()
-
-    # Create graph
-    G.add_nodes_from(nodes)
-    G.add_edges_from(edges)
-
-    # Hack
-    edge_labels_x = []
-    edge_labels_y = []
-    edge_labels_txt = []
-
-    # Define appends for better performance
-    add_x = edge_labels_x.append
-    add_y = edge_labels_y.append
-    add_txt = edge_labels_txt.append
-
-    tic = now()
-
-    # Create edges plot
-    edge_traces = []
-    add = edge_traces.append
-    for edge in G.edges(data=True):
-        a, b, info = edge
-        x0, y0 = G.node[a]['pos']
-        x1, y1 = G.node[b]['pos']
-        trace = go.Scatter(
-            x=[x0, x1, None],
-            y=[y0, y1, None],
-            line=_color_edge(info),
-            hoverinfo='none',
-            mode='lines'
-        )
-        add(trace)
-        add_x((x0 + x1) / 2)
-        add_y((y0 + y1) / 2)
-        add_txt(f"time: {info['time'] }")
-
-    print(f'edges : {now() - tic}')
-
-    # Hack for info hover on edges:
-    middle_node_trace = go.Scatter(
-        x=edge_labels_x,
-        y=edge_labels_y,
-        text=edge_labels_txt,
-        mode='markers',
-        hoverinfo='text',
-        marker=Marker(opacity=0)
-    )
+def parse_budgets(txt: str) -> List[int]:
+    """
+    Helper for parsing budgets given as a comma separated list (30, 60, 90)
+    or as a range start:stop:step with inclusive stop (30:120:10).
+    Raises ValueError with a message for the user.
+    """
+    txt = txt.strip()
+    try:
+        if ':' in txt:
+            start, stop, *step = [int(v) for v in txt.split(':')]
+            step = step[0] if step else 1
+            budgets = None
+        else:
+            budgets = [int(v) for v in txt.split(',') if v.strip()]
+    except ValueError:
+        raise ValueError('Budgets have to be integers, e.g. 30:120:10 or 30, 60, 90')
+    if budgets is None:
+        if step <= 0:
+            raise ValueError('Step has to be positive!')
+        budgets = list(range(start, stop + 1, step))
+    if any(b < 0 for b in budgets):
+        raise ValueError('Budgets cannot be negative!')
+    return budgets
+
+
+def summarize(df: pd.DataFrame, column: str, bins: int = 10) -> dict:
+    """
+    Helper for the upload summary: number of rows and distribution of one column
+    (min, median, max and a histogram)
+    """
+    values = pd.to_numeric(df[column], errors='coerce').dropna() if column in df else pd.Series([], dtype=float)
+    summary = {'rows': len(df), 'column': column}
+    if len(values):
+        counts, edges = np.histogram(values, bins=bins)
+        summary.update(min=values.min(), median=values.median(), max=values.max(),
+                       histogram=(counts.tolist(), edges.tolist()))
+    return summary
 
-    node_trace = go.Scatter(
-        x=[],
-        y=[],
-        text=[],
-        mode='markers',
-        hoverinfo='text',
-        marker=Marker(
-            color=[],
-            size=10,
-            line=dict(width=2))
-    )
 
-    tic = now()
+FILTER_OPERATORS = [['ge ', '>='], ['le ', '<='], ['lt ', '<'], ['gt ', '>'], ['ne ', '!='], ['eq ', '='],
+                    ['contains '], ['datestartswith ']]
+
+
+def split_filter_part(part: str) -> tuple:
+    """
+    Helper for parsing one part of DataTable filter_query, e.g. {time} > 5,
+    returns (column, operator, value), Nones if it is not understood
+    """
+    for operators in FILTER_OPERATORS:
+        for operator in operators:
+            if operator not in part:
+                continue
+            name_part, value_part = part.split(operator, 1)
+            name = name_part[name_part.find('{') + 1: name_part.rfind('}')]
+            value_part = value_part.strip()
+            if value_part and value_part[0] == value_part[-1] and value_part[0] in ('"', "'", '`'):
+                value = value_part[1:-1].replace('\\' + value_part[0], value_part[0])
+            else:
+                try:
+                    value = float(value_part)
+                except ValueError:
+                    value = value_part
+            return name, operators[0].strip(), value
+    return None, None, None
+
+
+def query_frame(df: pd.DataFrame, page: int, size: int, sort_by: list = None, filter_query: str = '') -> tuple:
+    """
+    Helper for DataTable with custom paging, sorting and filtering done on the server
+    :param sort_by: DataTable sort_by, list of {'column_id', 'direction'}
+    :param filter_query: DataTable filter_query, parts joined with &&
+    :return: tuple (records of the page, number of pages)
+    """
+    for part in (filter_query or '').split(' && '):
+        name, operator, value = split_filter_part(part)
+        if name not in df:
+            continue
+        column = df[name]
+        if operator in ('eq', 'ne', 'lt', 'le', 'gt', 'ge'):
+            try:
+                df = df.loc[getattr(column, operator)(value)]
+            except TypeError:
+                # text compared with numbers, the part is skipped
+                pass
+        elif operator == 'contains':
+            df = df.loc[column.astype(str).str.contains(str(value), regex=False)]
+        elif operator == 'datestartswith':
+            df = df.loc[column.astype(str).str.startswith(str(value))]
+
+    sort_by = [s for s in sort_by or [] if s['column_id'] in df]
+    if sort_by:
+        df = df.sort_values([s['column_id'] for s in sort_by],
+                            ascending=[s['direction'] == 'asc' for s in sort_by],
+                            kind='stable')
+
+    pages = max(1, -(-len(df) // size))
+    return df.iloc[page * size:(page + 1) * size].to_dict('records'), pages
+
+
+def _gaps(first: np.ndarray, second: np.ndarray) -> list:
+    """ Coordinates of segments first[i] - second[i] for one plotly trace, None between segments. """
+    coords = np.column_stack([first, second, np.full(len(first), np.nan)]).ravel().tolist()
+    return [None if c != c else c for c in coords]
+
+
+def base_figure(graph: Graph) -> dict:
+    """
+    Plotly figure of the whole map as plain dicts, so plotly validators are not run:
+    all edges in one trace, invisible markers in the middle of edges for their hover info
+    and the cities. Segments and markers are in order of edge ids. The route is drawn over it by route_trace.
+    """
+
+    a, b, t = graph.edge_ends[:, 0], graph.edge_ends[:, 1], graph.edge_time
+    x = graph.x.astype(float)
+    y = graph.y.astype(float)
+
+    edges = dict(type='scatter', x=_gaps(x[a], x[b]), y=_gaps(y[a], y[b]),
+                 line=dict(width=0.8, color='#888'), hoverinfo='none', mode='lines')
+    middles = dict(type='scatter', x=((x[a] + x[b]) / 2).tolist(), y=((y[a] + y[b]) / 2).tolist(),
+                   text=[f'time: {time}' for time in t.tolist()],
+                   mode='markers', hoverinfo='text', marker=dict(opacity=0))
+    nodes = dict(type='scatter', x=graph.x.tolist(), y=graph.y.tolist(),
+                 text=[f'pos : ({cx}, {cy}) | name : {name} | quantity : {value}'
+                       for name, cx, cy, value in zip(graph.names, graph.x_list, graph.y_list, graph.value_list)],
+                 mode='markers', hoverinfo='text', marker=dict(size=10, line=dict(width=2)))
+
+    layout = dict(showlegend=False,
+                  hovermode='closest',
+                  margin=dict(b=20, l=5, r=5, t=40),
+                  annotations=[dict(text='', showarrow=False, xref='paper', yref='paper', x=0.005, y=-0.002)],
+                  xaxis=dict(showgrid=False, zeroline=False, showticklabels=False),
+                  yaxis=dict(showgrid=False, zeroline=False, showticklabels=False, scaleanchor='x', scaleratio=1))
+    return dict(data=[edges, middles, nodes], layout=layout)
+
 
-    # Create nodes plot
-    for node in G.nodes():
-        the_node = G.node[node]
-        x, y = the_node['pos']
-        node_trace['x'] += tuple([x])
-        node_trace['y'] += tuple([y])
-        node_info = reduce(lambda a, b: f'{a} | {b}', [f'{k} : {v}' for k, v in the_node.items()])
-        node_trace['text'] += tuple([node_info])
+def figure_bytes(figure: dict) -> bytes:
+    """ Figure serialized once, as JSON bytes, for caching. """
+    return json.dumps(figure, separators=(',', ':')).encode('utf-8')
 
-    print(f'edges : {now() - tic}')
 
-    data = edge_traces + [node_trace, middle_node_trace]
+def route_trace(graph: Graph, edges) -> dict:
+    """ Trace of the edges of a solution route drawn over base_figure, each edge once. """
+    ends = graph.edge_ends[np.unique(np.asarray(edges, dtype=np.int64))]
+    x = graph.x.astype(float)
+    y = graph.y.astype(float)
+    return dict(type='scatter', x=_gaps(x[ends[:, 0]], x[ends[:, 1]]), y=_gaps(y[ends[:, 0]], y[ends[:, 1]]),
+                line=dict(width=8, color='#1EAEDB'), hoverinfo='none', mode='lines')
+
+
+def make_graph(base: bytes, graph: Graph, edges) -> dict:
+    """
+    Figure of a solution: a copy of the cached base figure with the route drawn
+    under the cities, so they stay on top for hover.
+    :param base: figure_bytes of base_figure
+    :param edges: ids of the edges of the route, see Graph.edge_ids
+    """
+    figure = json.loads(base)
+    figure['data'].insert(1, route_trace(graph, edges))
+    return figure
+
+
+def make_frontier(budgets: List[int], totals: List[int]):
+    trace = go.Scatter(
+        x=budgets,
+        y=totals,
+        mode='lines+markers',
+        line=dict(shape='hv', color='#1EAEDB'),
+        hoverinfo='x+y'
+    )
 
-    return go.Figure(data=data,
+    return go.Figure(data=[trace],
                      layout=go.Layout(
                          showlegend=False,
                          hovermode='closest',
-                         margin=dict(b=20, l=5, r=5, t=40),
-                         annotations=[dict(
-                             text='',
-                             showarrow=False,
-                             xref="paper", yref="paper",
-                             x=0.005, y=-0.002)],
-                         xaxis=dict(showgrid=False, zeroline=False, showticklabels=False),
-                         yaxis=dict(showgrid=False, zeroline=False, showticklabels=False, scaleanchor="x", scaleratio=1),
+                         margin=dict(b=40, l=60, r=5, t=40),
+                         xaxis=dict(title='working time'),
+                         yaxis=dict(title='collected quantity'),
                      ))
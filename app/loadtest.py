@@ -0,0 +1,98 @@
+import argparse
+import gzip
+import json
+import os
+import sys
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from itertools import cycle, islice
+from time import time as now
+from typing import List
+
+import numpy as np
+
+from app.api import COLUMNS
+from app.batch import COORDS_FILE_NAME, TIMES_FILE_NAME, find_instances, load_instance, parse_option
+
+
+def make_bodies(directories: List[str], solver: str = 'random', **options) -> List[bytes]:
+    """ Returns json bodies of POST /api/solve, one for each instance directory. """
+    bodies = []
+    for directory in directories:
+        with open(os.path.join(directory, COORDS_FILE_NAME)) as file:
+            # most sample files call the first column city_name, the api takes the upload columns
+            cities = ','.join(COLUMNS['cities']) + '\n' + file.read().split('\n', 1)[1]
+        with open(os.path.join(directory, TIMES_FILE_NAME)) as file:
+            paths = file.read()
+        working_time = load_instance(directory)[2]
+        bodies.append(json.dumps({'cities': cities, 'paths': paths, 'time': working_time,
+                                  'solver': solver, 'options': options}).encode('utf-8'))
+    return bodies
+
+
+def post(url: str, body: bytes, timeout: float = 300) -> tuple:
+    """ Sends one solve, returns (status code, latency in seconds, total or error). """
+    request = urllib.request.Request(url, data=body, headers={'Content-Type': 'application/json',
+                                                              'Accept-Encoding': 'gzip'})
+    tic = now()
+    try:
+        with urllib.request.urlopen(request, timeout=timeout) as response:
+            data = response.read()
+            if response.headers.get('Content-Encoding') == 'gzip':
+                data = gzip.decompress(data)
+            return response.status, now() - tic, json.loads(data)['total']
+    except urllib.error.HTTPError as e:
+        return e.code, now() - tic, e.read().decode('utf-8', 'replace')
+    except (urllib.error.URLError, OSError) as e:
+        return None, now() - tic, str(e)
+
+
+def run(url: str, bodies: List[bytes], requests: int, clients: int) -> dict:
+    """
+    Replays bodies round robin from clients threads, each sending its next request
+    as soon as the last one is answered. Returns a summary of the run.
+    """
+
+    tic = now()
+    with ThreadPoolExecutor(clients) as pool:
+        results = list(pool.map(lambda body: post(url, body), islice(cycle(bodies), requests)))
+    elapsed = now() - tic
+
+    latencies = np.array([latency for status, latency, _ in results if status == 200])
+    errors = [(status, message) for status, _, message in results if status != 200]
+    summary = {'requests': requests, 'clients': clients, 'ok': len(latencies), 'errors': len(errors),
+               'seconds': round(elapsed, 3), 'throughput': round(len(latencies) / elapsed, 2)}
+    if len(latencies):
+        for q in (50, 90, 99):
+            summary[f'p{q}'] = round(float(np.percentile(latencies, q)), 4)
+        summary['max'] = round(float(latencies.max()), 4)
+    if errors:
+        summary['first_error'] = errors[0]
+    return summary
+
+
+def main(argv: List[str] = None) -> int:
+    parser = argparse.ArgumentParser(description='Replays solves of instance directories against a running server.')
+    parser.add_argument('paths', nargs='*', default=['sample files'],
+                        help='instance directories with cities.csv, paths.csv and time.csv, or their parents')
+    parser.add_argument('--url', default='http://127.0.0.1:8050', help='address of the server')
+    parser.add_argument('-n', '--requests', type=int, default=100, help='number of solves')
+    parser.add_argument('-c', '--clients', type=int, nargs='+', default=[1, 2, 4, 8],
+                        help='numbers of concurrent clients, one run for each')
+    parser.add_argument('-s', '--solver', default='random')
+    parser.add_argument('-O', '--option', type=parse_option, action='append', default=[],
+                        help='solver option key=value, e.g. -O width=50')
+    args = parser.parse_args(argv)
+
+    bodies = make_bodies(find_instances(args.paths), args.solver, **dict(args.option))
+    if not bodies:
+        parser.error('no instances found')
+
+    url = args.url.rstrip('/') + '/api/solve'
+    # the first round only fills caches of the server
+    run(url, bodies, len(bodies), 1)
+    for clients in args.clients:
+        print(json.dumps(run(url, bodies, args.requests, clients)))
+        sys.stdout.flush()
+    return 0
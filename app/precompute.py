@@ -0,0 +1,127 @@
+from collections import namedtuple
+from concurrent.futures import CancelledError, Future, ThreadPoolExecutor
+from contextlib import contextmanager
+from threading import Condition, Event, Lock
+from typing import Callable, List
+
+Job = namedtuple('Job', ['future', 'cancelled'])
+
+
+class Precompute:
+    """
+    Jobs started in the background before their results are asked for, e.g. the graph and caches
+    of a map while the rest of its files are uploaded. A job is a list of steps run in order, a step
+    may return a list of further steps which run right after it. Results are kept by the steps themselves,
+    in caches of the app. Cancelling a job skips its remaining steps, a running step is not interrupted.
+    Steps of idle jobs only start while no search runs, see paused. Idle jobs run on a thread of their own,
+    so while they wait for searches the jobs of other sessions are not queued behind them.
+    """
+
+    def __init__(self, workers: int = 1) -> None:
+        """
+        :param workers: number of threads, steps hold the GIL for most of their time, so one is enough
+        """
+        self.pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='precompute')
+        self.idle_pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix='precompute-idle')
+        self.jobs = {}    # {key : Job}
+        self.users = {}   # {key : number of sessions waiting for the job}
+        self.lock = Lock()
+        self.searches = 0  # number of searches running, see paused
+        self.quiet = Condition()
+
+    def submit(self, key: str, steps: List[Callable], idle: bool = False) -> Future:
+        """
+        Starts steps as job key, a job of the same key already started is shared instead.
+        :param idle: steps wait while searches run, for work a search does not wait for
+        """
+        with self.lock:
+            self.users[key] = self.users.get(key, 0) + 1
+            job = self.jobs.get(key)
+            if job is None:
+                cancelled = Event()
+                pool = self.idle_pool if idle else self.pool
+                job = self.jobs[key] = Job(pool.submit(self._run, key, steps, cancelled, idle), cancelled)
+        return job.future
+
+    def _run(self, key: str, steps: List[Callable], cancelled: Event, idle: bool = False) -> int:
+        done = 0
+        steps = list(steps)
+        try:
+            while steps and not cancelled.is_set():
+                if idle:
+                    with self.quiet:
+                        self.quiet.wait_for(lambda: not self.searches or cancelled.is_set())
+                    if cancelled.is_set():
+                        break
+                more = steps.pop(0)()
+                if isinstance(more, list):
+                    steps[:0] = more
+                done += 1
+        finally:
+            # a cancelled job may have been replaced by a new one of the same key
+            with self.lock:
+                job = self.jobs.get(key)
+                if job is not None and job.cancelled is cancelled:
+                    del self.jobs[key]
+                    self.users.pop(key, None)
+        return done
+
+    def cancel(self, key: str) -> bool:
+        """ Stops job key once no other session waits for it. Returns True if the job was stopped. """
+        with self.lock:
+            job = self.jobs.get(key)
+            if job is None:
+                return False
+            self.users[key] -= 1
+            if self.users[key] > 0:
+                return False
+            del self.jobs[key]
+            del self.users[key]
+        job.cancelled.set()
+        job.future.cancel()
+        with self.quiet:
+            self.quiet.notify_all()
+        return True
+
+    def wait(self, key: str, timeout: float = None) -> None:
+        """
+        Waits until job key is finished, if there is one. Errors of steps are not raised here,
+        the caller repeats the failed step and reports the error itself.
+        """
+        with self.lock:
+            job = self.jobs.get(key)
+        if job is not None:
+            try:
+                job.future.result(timeout)
+            except (CancelledError, Exception):
+                pass
+
+    @contextmanager
+    def paused(self):
+        """ Holds steps of idle jobs back while the block runs, e.g. a search, so they do not take its CPU. """
+        with self.quiet:
+            self.searches += 1
+        try:
+            yield
+        finally:
+            with self.quiet:
+                self.searches -= 1
+                self.quiet.notify_all()
+
+    def running(self, key: str) -> bool:
+        with self.lock:
+            return key in self.jobs
+
+    def shutdown(self) -> None:
+        """ Cancels all jobs, e.g. at the end of tests. """
+        with self.lock:
+            jobs = list(self.jobs.values())
+            self.jobs.clear()
+            self.users.clear()
+        for job in jobs:
+            job.cancelled.set()
+            job.future.cancel()
+        with self.quiet:
+            self.quiet.notify_all()
+        self.pool.shutdown(wait=True)
+        self.idle_pool.shutdown(wait=True)
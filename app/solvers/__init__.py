@@ -1,16 +1,31 @@
+import numpy as np
 import pandas as pd
 
 from .city import City
-from .random_solver import solve
+from .random_solver import solve, convert_to_edges_list
+from .instance import Instance, InstanceCache, instance_key
+from .sweep import sweep
 
 
-def make_plot_data(cities: pd.DataFrame, paths: pd.DataFrame, time: pd.DataFrame):
-    solution, selected_edges = solve(cities, paths, time)
+def make_plot_data(cities: pd.DataFrame, paths: pd.DataFrame, time: pd.DataFrame,
+                   instance: Instance = None, solver: str = 'random', **options):
+    if instance is None:
+        instance = Instance(cities, paths)
 
-    check = lambda fc, tc: ((fc, tc) in selected_edges) or ((tc, fc) in selected_edges)
+    solution = instance.solve(int(time['time'].values[0]), solver, **options)
 
-    cities = [City(name, x, y, q) for name, x, y, q in cities.values]
-    edges = ((from_c, to_c, {'time': t, 'solution': check(from_c, to_c)})
-             for from_c, to_c, t in paths.values)
+    # rows of paths are looked up by edge id, rows of unknown cities are not on the route
+    graph = instance.csr
+    on_route = np.zeros(graph.m + 1, dtype=bool)
+    on_route[solution.edges] = True
+    index = pd.Index(graph.names)
+    a, b = index.get_indexer(paths['city_from']), index.get_indexer(paths['city_to'])
+    known = (a >= 0) & (b >= 0)
+    ids = np.full(len(paths), graph.m)
+    ids[known] = graph.edge_ids(a[known], b[known])
+
+    cities = list(instance.cities_dict.values())
+    edges = ((from_c, to_c, {'time': t, 'solution': s})
+             for (from_c, to_c, t), s in zip(paths.values, on_route[ids].tolist()))
 
     return solution, cities, edges
@@ -0,0 +1,182 @@
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+from time import time as now
+
+from .graph import Graph, bitset, bitset_test, bitset_set
+from .limits import GAP
+from .random_solver import Output
+
+
+def sample_walks(graph: Graph, working_time: int, tau: np.ndarray, rng: np.random.RandomState,
+                 ants: int = 64, alpha: float = 1.0, beta: float = 2.0) -> tuple:
+    """
+    Samples a batch of walks at once. Each ant moves to a neighbour with probability
+    proportional to tau ** alpha * eta ** beta, where eta is uncollected value per travel time.
+
+    :return: tuple (totals, time_left, nodes, edges), nodes and edges are (steps, ants) matrices
+             of visited cities and used edges (-1 once an ant has stopped)
+    """
+
+    rows = np.arange(ants)
+    node = rng.choice(graph.n, size=ants, p=(graph.value + 1) / (graph.value + 1).sum())
+    time_left = np.full(ants, working_time, dtype=np.int64)
+    total = graph.value[node].copy()
+    bits = bitset(ants, graph.n_items)
+    bitset_set(bits, rows, node)
+    alive = np.ones(ants, dtype=bool)
+
+    nodes = [node]
+    edges = []
+    while alive.any():
+        cand = graph.nbr[node]
+        cand_time = graph.nbr_time[node]
+        valid = (cand >= 0) & (cand_time <= time_left[:, None]) & alive[:, None]
+
+        safe = np.maximum(cand, 0)
+        gain = np.where(bitset_test(bits, rows[:, None], safe), 0, graph.value[safe])
+        item = graph.nbr_item[node]
+        safe = np.maximum(item, 0)
+        gain += np.where((item < 0) | bitset_test(bits, rows[:, None], safe), 0, graph.item_value[safe])
+        eta = (gain + 1) / np.maximum(cand_time, 1)
+        weights = np.where(valid, tau[graph.nbr_edge[node]] ** alpha * eta ** beta, 0)
+
+        # weighted sampling of one column per row
+        cum = np.cumsum(weights, axis=1)
+        alive = cum[:, -1] > 0
+        pick = (cum <= rng.random_sample(ants)[:, None] * cum[:, -1:]).sum(axis=1)
+        pick = np.minimum(pick, cand.shape[1] - 1)
+
+        step = np.where(alive, cand[rows, pick], -1)
+        edge = np.where(alive, graph.nbr_edge[node, pick], -1)
+        moved = rows[alive]
+        time_left[moved] -= cand_time[moved, pick[moved]]
+        total[moved] += gain[moved, pick[moved]]
+        bitset_set(bits, moved, step[moved])
+        corridor = moved[item[moved, pick[moved]] >= 0]
+        bitset_set(bits, corridor, item[corridor, pick[corridor]])
+        node = np.where(alive, step, node)
+
+        if alive.any():
+            nodes.append(step)
+            edges.append(edge)
+
+    nodes = np.array(nodes)
+    edges = np.array(edges).reshape(-1, ants)
+    return total, time_left, nodes, edges
+
+
+def run_colony(graph: Graph, working_time: int, tau: np.ndarray, rng: np.random.RandomState,
+               iterations: int = 5, ants: int = 64, alpha: float = 1.0, beta: float = 2.0,
+               rho: float = 0.1) -> tuple:
+    """
+    Runs a colony for a number of iterations. Pheromone evaporates by rho and every ant
+    deposits its total relative to the best one on the edges it used.
+
+    :return: tuple (tau, best) where best is (total, time_left, route) of the best walk
+    """
+
+    best = (-1, 0, [])
+    for _ in range(iterations):
+        totals, time_left, nodes, edges = sample_walks(graph, working_time, tau, rng, ants, alpha, beta)
+
+        i = int(totals.argmax())
+        if totals[i] > best[0]:
+            route = nodes[:, i]
+            best = (int(totals[i]), int(time_left[i]), route[route >= 0].tolist())
+
+        tau *= 1 - rho
+        used = edges >= 0
+        deposit = np.broadcast_to(totals / max(totals.max(), 1), edges.shape)
+        np.add.at(tau, edges[used], deposit[used])
+        np.clip(tau, 0.01, 10, out=tau)
+
+    return tau, best
+
+
+def route_edges(graph: Graph, route: list) -> np.ndarray:
+    """ Returns CSR positions of edges on a route. """
+    edges = []
+    for a, b in zip(route[:-1], route[1:]):
+        start = graph.indptr[a]
+        edges.append(start + int(np.flatnonzero(graph.indices[start:graph.indptr[a + 1]] == b)[0]))
+    return np.array(edges, dtype=np.int64)
+
+
+_graph = None
+
+
+def _init_worker(graph: Graph) -> None:
+    global _graph
+    _graph = graph
+
+
+def _colony_epoch(args: tuple) -> tuple:
+    working_time, tau, seed, options = args
+    return run_colony(_graph, working_time, tau, np.random.RandomState(seed), **options)
+
+
+def ant_colony(graph: Graph, working_time: int, colonies: int = 1, epochs: int = 10,
+               deadline: float = None, seed: int = None, target: int = None, **options) -> tuple:
+    """
+    Ant colony optimization. Colonies run in parallel processes; after every epoch the best
+    route found so far is reinforced in all of them.
+
+    :param graph: Graph of the instance
+    :param working_time:
+    :param colonies: number of colonies, each in its own process if more than one
+    :param epochs: number of epochs, each made of run_colony iterations
+    :param deadline: wall-clock limit in seconds, checked between epochs
+    :param seed: random seed, same seed gives the same result
+    :param target: total which is good enough, checked between epochs
+    :param options: passed to run_colony (iterations, ants, alpha, beta, rho)
+    :return: tuple (time_left, total, list of city indices) of the best route
+    """
+
+    tic = now()
+    seed = np.random.randint(2 ** 31) if seed is None else seed
+    taus = [np.ones(len(graph.indices)) for _ in range(colonies)]
+    best = (-1, 0, [])
+
+    pool = ProcessPoolExecutor(colonies, initializer=_init_worker, initargs=(graph,)) if colonies > 1 else None
+    try:
+        for epoch in range(epochs):
+            args = [(working_time, tau, seed + epoch * colonies + c, options) for c, tau in enumerate(taus)]
+            if pool is None:
+                results = [run_colony(graph, working_time, tau, np.random.RandomState(s), **o)
+                           for _, tau, s, o in args]
+            else:
+                results = list(pool.map(_colony_epoch, args))
+
+            taus = [tau for tau, _ in results]
+            for _, colony_best in results:
+                if colony_best[0] > best[0]:
+                    best = colony_best
+
+            # share the best route between colonies
+            shared = route_edges(graph, best[2])
+            for tau in taus:
+                tau[shared] = np.minimum(tau[shared] + 1, 10)
+
+            if deadline is not None and now() - tic > deadline:
+                break
+            if target is not None and best[0] >= target:
+                break
+    finally:
+        if pool is not None:
+            pool.shutdown()
+
+    total, time_left, route = best
+    return time_left, total, route
+
+
+def find_aco_path(instance, working_time: int, gap: float = None, **options) -> Output:
+    """
+    Returns Output for the best route found by ant colony optimization on an Instance.
+    :param gap: colonies stop once their route is within gap (a fraction) of the upper bound,
+                the Output has status limits.GAP then
+    """
+    graph = instance.csr
+    target = instance.target(working_time, gap)
+    time_left, total, route = ant_colony(graph, working_time, target=target, **options)
+    path = [instance.cities_dict[graph.names[i]] for i in route]
+    return Output(time_left, total, path, GAP if target is not None and total >= target else None)
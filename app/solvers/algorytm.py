@@ -1,18 +1,21 @@
 import sys, getopt
 import os
+import numpy as np
 import pandas as pd
 
+from .graph import route_totals
+from .limits import Guard
+
 class City:
     """ This class defines how city is represented. """
 
-    def __init__(self, name = "", x = None, y = None, value = 0, neighbours = {}):
+    def __init__(self, name = "", x = None, y = None, value = 0, neighbours = None):
         """ Initializes attributes. """
         self.name = name
         self.x = x
         self.y = y
         self.value = value
-        self.neighbours = neighbours
-        self.visited = False
+        self.neighbours = {} if neighbours is None else neighbours
 
     def getCoords(self, df_cities):
         self.x = df_cities.loc[df_cities['name']]
@@ -49,17 +52,23 @@ def convert_to_dict(df_cities, df_paths):
     return dict_paths
 
 
-def find_all_possible_paths(graph, start, time, path=[], price=0):
-    global all_paths
-    global newpaths
+def find_all_possible_paths(graph, start, time, path=None, price=0, all_paths=None, guard=None):
+    """
+    Adds to all_paths every path from start which cannot go further within time.
+    :param guard: limits.Guard counting nodes and memory of the paths, stops the search
+                  with LimitReached, paths found until then stay in all_paths
+    """
+    all_paths = [] if all_paths is None else all_paths
     time = time - price
-    path = path + [start]
+    path = (path or []) + [start]
+    if guard is not None:
+        # a list of len(path) references
+        guard.node(memory=64 + 8 * len(path))
     if start not in graph:
         return []
-    paths = []
     for node in graph[start].keys():
         if time - graph[start][node] >=0:
-            newpaths = find_all_possible_paths(graph, node, time , path, graph[start][node])
+            find_all_possible_paths(graph, node, time , path, graph[start][node], all_paths, guard)
         else:
             all_paths.append(path)
         if time==0:
@@ -75,13 +84,22 @@ def duplicate(items):
     return unique
 
 
-def create_all_possible_paths(graph,time):
+def create_all_possible_paths(graph, time, guard=None):
+    """
+    Paths from every city, see find_all_possible_paths. The search runs under the limits
+    of guard (unlimited by default); when one is hit the paths found so far are returned
+    and guard.status tells which limit it was.
+    """
     lista = []
-    for x in graph.keys():
-        all_paths=[]
-        newpaths=[]
-        lista = lista + duplicate(find_all_possible_paths(graph,x,time))
-        print(x)
+    guard = Guard() if guard is None else guard
+    with guard:
+        for x in graph.keys():
+            found = []
+            try:
+                find_all_possible_paths(graph, x, time, all_paths=found, guard=guard)
+            finally:
+                lista = lista + duplicate(found)
+            print(x)
     return lista
 
 
@@ -96,20 +114,15 @@ def create_cities_dictionary(graph, cities):
 
 
 def choose_the_best_path(lista, cities_list):
-    podsumowanie={}
-    g = 0
-    i = 1
-    for j in lista:
-        zysk = 0
-        for krok in j:
-            if cities_list[krok].visited == False:
-                zysk = zysk + cities_list[krok].value
-                cities_list[krok].visited = True
+    # visited cities are kept in a boolean mask per path, cities are not modified
+    nazwy = list(cities_list.keys())
+    indeks = {nazwa: i for i, nazwa in enumerate(nazwy)}
+    wartosci = np.array([cities_list[nazwa].value for nazwa in nazwy])
+    zyski = route_totals([[indeks[krok] for krok in j] for j in lista], wartosci)
+
+    podsumowanie = {}
+    for zysk, j in zip(zyski.tolist(), lista):
         podsumowanie[zysk] = j
-        g = g + 1
-        for krok in j:
-            cities_list[krok].visited = False
-        i = i + 1
     return podsumowanie
 
 
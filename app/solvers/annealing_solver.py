@@ -0,0 +1,239 @@
+import math
+import random
+from concurrent.futures import ProcessPoolExecutor
+from time import time as now
+
+from .limits import GAP
+from .random_solver import Output, path_total
+
+
+def geometric(t0: float, k: int, iterations: int, ratio: float = 1e-3) -> float:
+    return t0 * ratio ** (k / iterations)
+
+
+def linear(t0: float, k: int, iterations: int) -> float:
+    return t0 * max(0.0, 1 - k / iterations)
+
+
+def lundy_mees(t0: float, k: int, beta: float = 0.01) -> float:
+    return t0 / (1 + beta * k * t0)
+
+
+COOLING = {
+    'geometric': geometric,
+    'linear': linear,
+    'lundy': lambda t0, k, iterations: lundy_mees(t0, k),
+}
+
+
+def path_to_targets(path: list) -> list:
+    """ Returns names of cities of a path in order of the first visit. """
+    seen = {}
+    for city in path:
+        seen.setdefault(city.name, None)
+    return list(seen)
+
+
+class Route:
+    """
+    Order of target cities travelled by shortest paths. Keeps total value and time,
+    so every move is costed in constant time with a few distance lookups.
+    """
+
+    def __init__(self, instance, working_time: int, targets: list) -> None:
+        self.instance = instance
+        self.working_time = working_time
+        self.targets = list(targets)
+        self.members = set(self.targets)
+        self.value = sum(instance.cities_dict[t].value for t in self.targets)
+        self.time = sum(self.dist(a, b) for a, b in zip(self.targets[:-1], self.targets[1:]))
+        self._near = {}
+
+    def dist(self, a: str, b: str) -> float:
+        """ Shortest path oracle, bounded by working time. """
+        if a is None or b is None:
+            return 0
+        return self.instance.distances(a, self.working_time)[0].get(b, math.inf)
+
+    def near(self, a: str, k: int = 32) -> list:
+        """ The k cities closest to a. """
+        if a not in self._near:
+            dist = self.instance.distances(a, self.working_time)[0]
+            self._near[a] = sorted(dist, key=dist.get)[1:k + 1] or [a]
+        return self._near[a]
+
+    def at(self, i: int):
+        return self.targets[i] if 0 <= i < len(self.targets) else None
+
+    def _link(self, a, b) -> float:
+        return self.dist(a, b) if a is not None and b is not None else 0
+
+    def delta_insert(self, i: int, city: str) -> float:
+        a, b = self.at(i - 1), self.at(i)
+        return self._link(a, city) + self._link(city, b) - self._link(a, b)
+
+    def delta_remove(self, i: int) -> float:
+        a, c, b = self.at(i - 1), self.at(i), self.at(i + 1)
+        return self._link(a, b) - self._link(a, c) - self._link(c, b)
+
+    def delta_replace(self, i: int, city: str) -> float:
+        a, c, b = self.at(i - 1), self.at(i), self.at(i + 1)
+        return self._link(a, city) + self._link(city, b) - self._link(a, c) - self._link(c, b)
+
+    def delta_reverse(self, i: int, j: int) -> float:
+        a, b = self.at(i - 1), self.at(j + 1)
+        return self._link(a, self.at(j)) + self._link(self.at(i), b) \
+            - self._link(a, self.at(i)) - self._link(self.at(j), b)
+
+    def insert(self, i: int, city: str, delta: float) -> None:
+        self.targets.insert(i, city)
+        self.members.add(city)
+        self.value += self.instance.cities_dict[city].value
+        self.time += delta
+
+    def remove(self, i: int, delta: float) -> None:
+        city = self.targets.pop(i)
+        self.members.discard(city)
+        self.value -= self.instance.cities_dict[city].value
+        self.time += delta
+
+    def replace(self, i: int, city: str, delta: float) -> None:
+        self.remove(i, 0)
+        self.insert(i, city, delta)
+
+    def reverse(self, i: int, j: int, delta: float) -> None:
+        self.targets[i:j + 1] = self.targets[i:j + 1][::-1]
+        self.time += delta
+
+
+def anneal(instance, working_time: int, targets: list, seed: int = None, iterations: int = 100000,
+           deadline: float = None, t0: float = None, cooling: str = 'geometric', target: int = None) -> list:
+    """
+    Simulated annealing over the order of target cities. Moves: insert, remove,
+    replace and reverse a segment; routes longer than working time are rejected.
+
+    :param instance: Instance to solve
+    :param working_time:
+    :param targets: initial list of target city names
+    :param seed: random seed
+    :param iterations: number of moves
+    :param deadline: wall-clock limit in seconds
+    :param t0: initial temperature, defaults to the mean city value
+    :param cooling: one of COOLING
+    :param target: total which is good enough, the search stops once it is reached
+    :return: best list of target city names found
+    """
+
+    rng = random.Random(seed)
+    schedule = COOLING[cooling]
+    names = list(instance.cities_dict)
+    if t0 is None:
+        t0 = max(1.0, sum(c.value for c in instance.cities_dict.values()) / len(names))
+
+    route = Route(instance, working_time, targets or [rng.choice(names)])
+    best = (route.value, -route.time, list(route.targets))
+    tic = now()
+
+    for k in range(iterations):
+        if deadline is not None and k % 256 == 0 and now() - tic > deadline:
+            break
+        if target is not None and best[0] >= target:
+            break
+
+        temperature = max(schedule(t0, k, iterations), 1e-9)
+        n = len(route.targets)
+        move = rng.random()
+
+        if move < 0.4 or n < 2:
+            # insert a city reachable from its new predecessor
+            i = rng.randint(0, n)
+            anchor = route.at(i - 1) or route.at(i)
+            city = rng.choice(route.near(anchor))
+            if city in route.members:
+                continue
+            delta, gain = route.delta_insert(i, city), instance.cities_dict[city].value
+            apply = lambda: route.insert(i, city, delta)
+        elif move < 0.6:
+            i = rng.randrange(n)
+            delta, gain = route.delta_remove(i), -instance.cities_dict[route.targets[i]].value
+            apply = lambda: route.remove(i, delta)
+        elif move < 0.8:
+            i = rng.randrange(n)
+            city = rng.choice(route.near(route.targets[i]))
+            if city in route.members:
+                continue
+            delta = route.delta_replace(i, city)
+            gain = instance.cities_dict[city].value - instance.cities_dict[route.targets[i]].value
+            apply = lambda: route.replace(i, city, delta)
+        else:
+            i, j = sorted(rng.sample(range(n), 2))
+            delta, gain = route.delta_reverse(i, j), 0
+            apply = lambda: route.reverse(i, j, delta)
+
+        if route.time + delta > working_time:
+            continue
+
+        # value first, shorter routes break ties
+        score = gain - delta * 1e-6
+        if score >= 0 or rng.random() < math.exp(score / temperature):
+            apply()
+            if (route.value, -route.time) > best[:2]:
+                best = (route.value, -route.time, list(route.targets))
+
+    return best[2]
+
+
+def expand_targets(instance, working_time: int, targets: list) -> Output:
+    """ Joins target cities with shortest paths into a path of City objects. """
+    path = [instance.cities_dict[targets[0]]]
+    time = 0
+    for a, b in zip(targets[:-1], targets[1:]):
+        dist, prev = instance.distances(a, working_time)
+        time += dist[b]
+        path += instance.shortest_path(a, b, prev)
+    return Output(working_time - time, path_total(path), path)
+
+
+_instance = None
+
+
+def _init_worker(instance) -> None:
+    global _instance
+    _instance = instance
+
+
+def _run_chain(args: tuple) -> list:
+    working_time, targets, seed, options = args
+    return anneal(_instance, working_time, targets, seed=seed, **options)
+
+
+def find_annealing_path(instance, working_time: int, chains: int = 1, seed: int = None,
+                        initial: list = None, gap: float = None, **options) -> Output:
+    """
+    Returns Output for the best route of independent annealing chains on an Instance,
+    each chain in its own process if more than one.
+
+    :param initial: path of City objects to start from, defaults to a narrow beam search
+    :param gap: chains stop once their route is within gap (a fraction) of the upper bound,
+                the Output has status limits.GAP then
+    :param options: passed to anneal (iterations, deadline, t0, cooling)
+    """
+
+    if initial is None:
+        initial = instance.solve(working_time, 'beam', width=10).path
+    targets = path_to_targets(initial)
+    seed = random.randrange(2 ** 31) if seed is None else seed
+    target = instance.target(working_time, gap)
+    if target is not None:
+        options['target'] = target
+
+    args = [(working_time, targets, seed + c, options) for c in range(chains)]
+    if chains > 1:
+        with ProcessPoolExecutor(chains, initializer=_init_worker, initargs=(instance,)) as pool:
+            results = list(pool.map(_run_chain, args))
+    else:
+        results = [anneal(instance, working_time, targets, seed=seed, **options)]
+
+    outputs = [expand_targets(instance, working_time, r) for r in results]
+    best = max(outputs, key=lambda x: x.total)
+    return best._replace(status=GAP) if target is not None and best.total >= target else best
@@ -0,0 +1,101 @@
+import numpy as np
+
+from .graph import Graph, bitset, bitset_test, bitset_set
+from .random_solver import Output
+
+
+def _state_hash(node: np.ndarray, bits: np.ndarray) -> np.ndarray:
+    """ Hashes (current city, visited set) of every route, used to drop duplicate routes. """
+    h = node.astype(np.uint64) * np.uint64(0x9E3779B97F4A7C15)
+    for w in range(bits.shape[1]):
+        h = (h ^ bits[:, w]) * np.uint64(0xBF58476D1CE4E5B9)
+    return h
+
+
+def beam_search(graph: Graph, working_time: int, width: int = 100, starts: list = None) -> tuple:
+    """
+    Deterministic beam search. Every step extends each route of the beam by all
+    of its neighbours, scores the beam x neighbours matrix at once and keeps
+    the width best routes by collected value, then by value per time of the last move.
+
+    :param graph: Graph of the instance
+    :param working_time:
+    :param width: beam width, larger is slower and better
+    :param starts: indices of start cities, the width most valuable cities by default
+    :return: tuple (time_left, total, list of city indices) of the best route
+    """
+
+    # start from the most valuable cities
+    node = np.argsort(-graph.value, kind='stable')[:width] if starts is None else np.asarray(starts, dtype=np.int64)
+    time_left = np.full(len(node), working_time, dtype=np.int64)
+    total = graph.value[node].copy()
+    bits = bitset(len(node), graph.n_items)
+    bitset_set(bits, np.arange(len(node)), node)
+
+    # history of (parent, node) per step for rebuilding routes
+    history = [(np.full(len(node), -1), node)]
+    best = (total.max(), 0, int(total.argmax()))  # (total, step, position)
+    best_time_left = working_time
+
+    min_time = graph.times[graph.times > 0].min() if (graph.times > 0).any() else 1
+    max_steps = working_time // min_time + graph.n
+
+    for step in range(1, max_steps + 1):
+        cand = graph.nbr[node]
+        cand_time = graph.nbr_time[node]
+        valid = (cand >= 0) & (cand_time <= time_left[:, None])
+        if not valid.any():
+            break
+
+        rows, cols = np.nonzero(valid)
+        child = cand[rows, cols]
+        child_time = time_left[rows] - cand_time[rows, cols]
+        item = graph.nbr_item[node[rows], cols]
+        gain = np.where(bitset_test(bits, rows, child), 0, graph.value[child])
+        corridor = item >= 0
+        gain[corridor] += np.where(bitset_test(bits, rows[corridor], item[corridor]),
+                                   0, graph.item_value[item[corridor]])
+        child_total = total[rows] + gain
+        ratio = gain / np.maximum(cand_time[rows, cols], 1)
+
+        # best routes first: value, value per time of the last move, time left
+        order = np.lexsort((-child_time, -ratio, -child_total))
+        rows, child, child_time, child_total = rows[order], child[order], child_time[order], child_total[order]
+        item = item[order]
+
+        child_bits = bits[rows]
+        bitset_set(child_bits, np.arange(len(rows)), child)
+        corridor = np.flatnonzero(item >= 0)
+        bitset_set(child_bits, corridor, item[corridor])
+
+        # the same city with the same visited set is kept once, with the best score
+        _, first = np.unique(_state_hash(child, child_bits), return_index=True)
+        keep = np.sort(first)[:width]
+
+        node = child[keep]
+        time_left = child_time[keep]
+        total = child_total[keep]
+        bits = child_bits[keep]
+        history.append((rows[keep], node))
+
+        if total[0] > best[0]:
+            best = (total[0], step, 0)
+            best_time_left = int(time_left[0])
+
+    total, step, position = best
+    route = []
+    while step >= 0:
+        parent, nodes = history[step]
+        route.append(int(nodes[position]))
+        position = parent[position]
+        step -= 1
+
+    return best_time_left, int(total), route[::-1]
+
+
+def find_beam_path(instance, working_time: int, width: int = 100) -> Output:
+    """ Returns Output for the best route found by beam search on an Instance. """
+    graph = instance.csr
+    time_left, total, route = beam_search(graph, working_time, width)
+    path = [instance.cities_dict[graph.names[i]] for i in route]
+    return Output(time_left, total, path)
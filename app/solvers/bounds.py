@@ -0,0 +1,210 @@
+from heapq import heappush, heappop
+
+import numpy as np
+
+from .graph import Graph
+
+
+def item_weights(graph: Graph) -> np.ndarray:
+    """
+    Least time needed to collect each item: the shortest edge into a city,
+    the corridor edge itself for a corridor.
+    """
+
+    weights = np.zeros(graph.n_items, dtype=np.int64)
+    has_edges = graph.degree > 0
+    weights[:graph.n][has_edges] = np.minimum.reduceat(graph.times, graph.indptr[:-1][has_edges])
+    corridor = graph.edge_item >= 0
+    weights[graph.edge_item[corridor]] = graph.times[corridor]
+    return weights
+
+
+def dijkstra(graph: Graph, source: int) -> np.ndarray:
+    """ Travel times from source to every city, inf where a city is out of reach. """
+    dist = np.full(graph.n, np.inf)
+    dist[source] = 0
+    heap = [(0, source)]
+    while heap:
+        d, city = heappop(heap)
+        if d > dist[city]:
+            continue
+        for neighbour, t in graph.adjacency(city):
+            if d + t < dist[neighbour]:
+                dist[neighbour] = d + t
+                heappush(heap, (d + t, neighbour))
+    return dist
+
+
+def collect_times(graph: Graph) -> np.ndarray:
+    """
+    Least travel time from every city to collect an item of value other than the city itself:
+    another valuable city or a valuable corridor, inf where there is none.
+    No route from a city with less time left collects anything more.
+    """
+
+    src = np.repeat(np.arange(graph.n), graph.degree)
+    corridor = graph.edge_item >= 0
+    corridor[corridor] = graph.item_value[graph.edge_item[corridor]] > 0
+
+    # multi-source Dijkstra: valuable cities are sources, a corridor is collected by crossing it
+    dist = np.where(graph.value > 0, 0.0, np.inf)
+    np.minimum.at(dist, src[corridor], graph.times[corridor])
+    heap = [(d, i) for i, d in enumerate(dist.tolist()) if d < np.inf]
+    heap.sort()
+    while heap:
+        d, city = heappop(heap)
+        if d > dist[city]:
+            continue
+        for neighbour, t in graph.adjacency(city):
+            if d + t < dist[neighbour]:
+                dist[neighbour] = d + t
+                heappush(heap, (d + t, neighbour))
+
+    # one move out of the city, so its own value does not count
+    step = graph.times + np.where(corridor, 0, dist[graph.indices])
+    times = np.full(graph.n, np.inf)
+    has_edges = graph.degree > 0
+    times[has_edges] = np.minimum.reduceat(step, graph.indptr[:-1][has_edges])
+    return times
+
+
+def landmarks(graph: Graph, k: int = 16) -> np.ndarray:
+    """
+    Travel times from k landmarks spread over the graph, each one the farthest city
+    from the ones chosen before. Returns a (k, n) matrix.
+    """
+
+    dist = [dijkstra(graph, int(np.argmax(graph.value)))]
+    closest = dist[0].copy()
+    for _ in range(1, min(k, graph.n)):
+        # unreachable cities are the farthest ones, so each component gets landmarks
+        far = np.where(np.isinf(closest), np.finfo(float).max, closest)
+        if far.max() <= 0:
+            break
+        dist.append(dijkstra(graph, int(np.argmax(far))))
+        closest = np.minimum(closest, dist[-1])
+    return np.array(dist)
+
+
+def lower_distances(marks: np.ndarray, starts: np.ndarray) -> np.ndarray:
+    """
+    Lower bounds of travel times from starts to every city by the triangle inequality,
+    max over landmarks of |d(landmark, start) - d(landmark, city)|.
+    """
+
+    lower = np.zeros((len(starts), marks.shape[1]))
+    for dist in marks:
+        a, b = dist[starts][:, None], dist[None, :]
+        with np.errstate(invalid='ignore'):
+            gap = np.abs(a - b)
+        # different components are out of reach, no information when both are unreachable
+        np.maximum(lower, np.where(np.isinf(a) & np.isinf(b), 0, gap), out=lower)
+    return lower
+
+
+def start_bounds(graph: Graph, working_time: int, k: int = 16, chunk: int = 256) -> np.ndarray:
+    """
+    Upper bound of value collected by any route from each start, for all starts at once.
+    Only items within working_time of the start can be collected and each costs
+    at least its item weight, so the bound is the fractional knapsack of those items
+    with working_time capacity. Travel times are bounded from below with landmarks.
+    A move across a contracted corridor collects two items, see knapsack_bound,
+    so on reduced graphs the capacity is doubled.
+
+    :param k: number of landmarks
+    :param chunk: number of starts scored together, limits memory to chunk x items
+    :return: array of bounds, one for each city of the graph
+    """
+
+    weights = item_weights(graph)
+    value = graph.item_value
+    capacity = (2 if graph.n_items > graph.n else 1) * working_time
+
+    # items by value per time, free items first
+    ratio = np.where(weights > 0, value / np.maximum(weights, 1), np.inf)
+    order = np.argsort(-ratio, kind='stable')
+    w_sorted = weights[order].astype(float)
+    v_sorted = value[order].astype(float)
+
+    # corridors are reachable when their city is
+    has_corridor = graph.edge_item >= 0
+    corridor_city = np.zeros(graph.n_items - graph.n, dtype=np.int64)
+    corridor_city[graph.edge_item[has_corridor] - graph.n] = np.repeat(np.arange(graph.n), graph.degree)[has_corridor]
+    item_city = np.concatenate([np.arange(graph.n), corridor_city])[order]
+
+    marks = landmarks(graph, k)
+    bounds = np.zeros(graph.n, dtype=np.int64)
+    for first in range(0, graph.n, chunk):
+        starts = np.arange(first, min(first + chunk, graph.n))
+        rows = np.arange(len(starts))
+        reach = lower_distances(marks, starts)[:, item_city] <= working_time
+
+        # the start city is collected first and for free
+        w = np.where(reach, w_sorted, 0)
+        v = np.where(reach, v_sorted, 0)
+        is_start = order[None, :] == starts[:, None]
+        w[is_start] = 0
+        v[is_start] = 0
+
+        used = np.cumsum(w, axis=1)
+        full = used <= capacity
+        bound = (v * full).sum(axis=1) + value[starts]
+
+        # fraction of the first item that does not fit
+        nxt = np.argmin(full, axis=1)
+        partial = ~full.all(axis=1)
+        spare = capacity - np.where(nxt > 0, used[rows, nxt - 1], 0)
+        bound += np.where(partial, v[rows, nxt] * spare / np.maximum(w[rows, nxt], 1), 0)
+        bounds[starts] = np.floor(bound).astype(np.int64)
+
+    return bounds
+
+
+def knapsack_bound(graph: Graph, working_time: int) -> int:
+    """
+    Upper bound of value collected by any route, computed in one sort. Every move collects
+    at most one new item and costs at least its item weight, so the route collects no more
+    than the best start city plus the fractional knapsack of all items with working_time capacity,
+    and no more than the best start plus the values of as many items as moves fit into working_time.
+    A move across a contracted corridor collects the corridor and the city behind it, each weighing
+    at most the move, so on reduced graphs the capacity and the number of items per move are doubled.
+    """
+
+    weights = item_weights(graph).astype(float)
+    value = graph.item_value.astype(float)
+    if not len(value):
+        return 0
+    first = value[:graph.n].max() if graph.n else 0
+    per_move = 2 if graph.n_items > graph.n else 1
+    capacity = per_move * working_time
+
+    # items by value per time, free items first
+    ratio = np.where(weights > 0, value / np.maximum(weights, 1), np.inf)
+    order = np.argsort(-ratio, kind='stable')
+    used = np.cumsum(weights[order])
+    full = used <= capacity
+    knapsack = value[order][full].sum()
+    if not full.all():
+        nxt = int(np.argmin(full))
+        spare = capacity - (used[nxt - 1] if nxt else 0)
+        knapsack += value[order][nxt] * spare / weights[order][nxt]
+
+    # the number of moves is not limited when some take no time
+    moves = per_move * (working_time // int(graph.times.min())) if len(graph.times) and graph.times.min() > 0 \
+        else len(value)
+    top = np.sort(value)[::-1][:min(len(value), moves)].sum()
+
+    return int(np.floor(min(first + knapsack, first + top, value.sum())))
+
+
+def optimality_gap(total: int, bound: int) -> float:
+    """ Relative distance of total from an upper bound of the optimum, 0 when total reaches it. """
+    return max(0.0, (bound - total) / bound) if bound > 0 else 0.0
+
+
+def gap_target(bound: int, gap: float) -> int:
+    """ Least total which is within gap (a fraction, e.g. 0.05) of an upper bound. Raises ValueError out of [0, 1). """
+    if not 0 <= gap < 1:
+        # a negative gap is never reached, a gap of 1 or more is reached by any walk
+        raise ValueError(f'gap has to be at least 0 and below 1, not {gap}')
+    return int(np.ceil((1 - gap) * bound))
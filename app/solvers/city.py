@@ -1,23 +1,45 @@
-import pandas as pd
+from collections.abc import Mapping
 
 
 class City:
-    """ This class defines how city is represented. """
+    """
+    This class defines how city is represented: a light view of city id in a Graph.
+    Views hold no data of their own, everything is read from the graph arrays.
+    """
 
-    def __init__(self, name: str, x: int, y: int, value: int = 0) -> None:
+    __slots__ = ('graph', 'id')
+
+    def __init__(self, graph, id: int) -> None:
         """ Initializes attributes. """
-        self.name = name
-        self.x = x
-        self.y = y
-        self.value = value
-        self.neighbours = {}
-        self.visited = False
+        self.graph = graph
+        self.id = id
+
+    @property
+    def name(self) -> str:
+        return self.graph.names[self.id]
+
+    @property
+    def x(self) -> int:
+        return self.graph.x_list[self.id]
+
+    @property
+    def y(self) -> int:
+        return self.graph.y_list[self.id]
 
-    def set_coords(self, df_cities: pd.DataFrame) -> None:
-        self.x = df_cities.loc[df_cities['name']]
+    @property
+    def value(self) -> int:
+        return self.graph.value_list[self.id]
 
-    def set_neighbours(self, d) -> None:
-        self.neighbours = d.get(self.name, {})   # get the dictionary of pairs {neighbour:travel_time}
+    @property
+    def neighbours(self) -> dict:
+        """ Dictionary {neighbour : travel time}, built from the graph on every access. """
+        return self.graph.neighbour_times(self.id)
+
+    def __eq__(self, other) -> bool:
+        return isinstance(other, City) and self.graph is other.graph and self.id == other.id
+
+    def __hash__(self) -> int:
+        return hash((id(self.graph), self.id))
 
     def __str__(self) -> str:
         """ Defines how print(object_name) is displayed. """
@@ -25,3 +47,24 @@ class City:
                f"Coord: ({self.x}, {self.y})\n" + \
                f"Value: {self.value}\n" + \
                f"Ngbrs: {self.neighbours}\n"
+
+
+class Cities(Mapping):
+    """ Read-only dictionary {name : City} over a Graph, City views are created on access. """
+
+    __slots__ = ('graph',)
+
+    def __init__(self, graph) -> None:
+        self.graph = graph
+
+    def __getitem__(self, name: str) -> City:
+        return City(self.graph, self.graph.index[name])
+
+    def __iter__(self):
+        return iter(self.graph.names)
+
+    def __len__(self) -> int:
+        return self.graph.n
+
+    def __contains__(self, name) -> bool:
+        return name in self.graph.index
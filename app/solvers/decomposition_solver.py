@@ -0,0 +1,169 @@
+import math
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import get_context
+from time import time as now
+
+import numpy as np
+
+from .annealing_solver import find_annealing_path
+from .beam_solver import beam_search
+from .graph import Graph
+from .random_solver import Output, path_time, path_total
+
+
+def make_tiles(graph: Graph, size: float) -> np.ndarray:
+    """ Returns tile number of every city, tiles are size x size squares of coordinates. """
+    tx = ((graph.x - graph.x.min()) // size).astype(np.int64)
+    ty = ((graph.y - graph.y.min()) // size).astype(np.int64)
+    return tx * (int(ty.max()) + 1) + ty
+
+
+def score_tiles(graph: Graph, tile: np.ndarray, size: float) -> tuple:
+    """
+    Returns (tile numbers, scores) of tiles holding any city, best first.
+    The score is collected value per unit of area.
+    """
+
+    numbers, inverse = np.unique(tile, return_inverse=True)
+    density = np.bincount(inverse, weights=graph.value) / (size * size)
+    order = np.argsort(-density, kind='stable')
+    return numbers[order], density[order]
+
+
+def solve_tile(graph: Graph, cities: np.ndarray, working_time: int, width: int) -> tuple:
+    """
+    Beam search on the subgraph of the given cities.
+    :return: tuple (total, list of city indices of the whole graph)
+    """
+    _, total, route = beam_search(graph.subgraph(cities), working_time, width)
+    return total, cities[route].tolist()
+
+
+_graph = None
+
+
+def _init_worker(graph: Graph) -> None:
+    global _graph
+    _graph = graph
+
+
+def _solve_tile(args: tuple) -> tuple:
+    cities, working_time, width = args
+    return solve_tile(_graph, cities, working_time, width)
+
+
+def stitch(instance, working_time: int, routes: list) -> list:
+    """
+    Joins routes, given as lists of city names, with shortest path connectors.
+    Starts with the most valuable route, then each step appends the route, entered
+    at either end, with the best new value per time of connector and route;
+    routes that do not fit into the time left are skipped.
+    :return: path of City objects
+    """
+
+    cities = instance.cities_dict
+    routes = [[cities[name] for name in route] for route in routes if route]
+    if not routes:
+        return []
+    times = [path_time(route) for route in routes]
+
+    best = max(range(len(routes)), key=lambda i: path_total(routes[i]))
+    path = routes.pop(best)
+    times.pop(best)
+    visited = {c.name for c in path}
+    time_left = working_time - path_time(path)
+
+    while routes and time_left > 0:
+        last = path[-1].name
+        dist, prev = instance.distances(last, time_left)
+        choice = None  # (ratio, index, cities added, time)
+        for i, route in enumerate(routes):
+            for oriented in (route, route[::-1]):
+                entry = oriented[0].name
+                if entry not in dist:
+                    continue
+                cost = dist[entry] + times[i]
+                if cost > time_left:
+                    continue
+                # the connector ends at the entry city
+                added = instance.shortest_path(last, entry, prev) + oriented[1:]
+                gain = path_total([c for c in added if c.name not in visited])
+                ratio = gain / cost if cost else math.inf
+                if gain > 0 and (choice is None or ratio > choice[0]):
+                    choice = (ratio, i, added, cost)
+        if choice is None:
+            break
+
+        _, i, added, cost = choice
+        routes.pop(i)
+        times.pop(i)
+        path += added
+        visited.update(c.name for c in added)
+        time_left -= cost
+
+    return path
+
+
+def decompose(instance, working_time: int, size: float = None, tiles: int = 8, per_tile: int = 2000,
+              width: int = 50, workers: int = None) -> list:
+    """
+    Tiles the map by coordinates, solves the tiles with the highest value density
+    separately, in parallel processes, and stitches their routes.
+
+    :param size: side of a tile, by default chosen to put about per_tile cities in a tile
+    :param tiles: number of tiles solved, each gets an equal share of working_time
+    :param width: beam width used in every tile
+    :param workers: number of spawned processes, os.cpu_count() by default, 1 solves in this process
+    :return: path of City objects
+    """
+
+    graph = instance.csr
+    if size is None:
+        area = float(np.ptp(graph.x) + 1) * float(np.ptp(graph.y) + 1)
+        size = max(1.0, math.sqrt(area * per_tile / graph.n))
+
+    tile = make_tiles(graph, size)
+    numbers, _ = score_tiles(graph, tile, size)
+    numbers = numbers[:tiles]
+    budget = max(1, working_time // len(numbers))
+
+    order = np.argsort(tile, kind='stable')
+    bounds = np.searchsorted(tile[order], [numbers, numbers + 1])
+    args = [(order[a:b], budget, width) for a, b in zip(*bounds)]
+
+    if workers == 1 or len(args) == 1:
+        results = [solve_tile(graph, *a) for a in args]
+    else:
+        # spawned, a fork of a process running threads, e.g. a worker of the web app, may deadlock
+        with ProcessPoolExecutor(workers, get_context('spawn'), initializer=_init_worker, initargs=(graph,)) as pool:
+            results = list(pool.map(_solve_tile, args))
+
+    routes = [[graph.names[i] for i in route] for _, route in results]
+    return stitch(instance, working_time, routes)
+
+
+def find_decomposition_path(instance, working_time: int, repair: int = 2000, seed: int = None,
+                            deadline: float = None, **options) -> Output:
+    """
+    Returns Output for the stitched route of decompose, with the time left spent
+    by Instance.extend_path and the route repaired by a short annealing run.
+
+    :param repair: number of annealing moves, 0 skips the repair
+    :param deadline: wall-clock limit in seconds of the repair
+    :param options: passed to decompose (size, tiles, per_tile, width, workers)
+    """
+
+    tic = now()
+    path = decompose(instance, working_time, **options)
+    if not path:
+        return Output(working_time, 0, [])
+
+    solution = instance.extend_path(path, working_time)
+    if repair:
+        if deadline is not None:
+            deadline = max(0.0, deadline - (now() - tic))
+        repaired = find_annealing_path(instance, working_time, seed=seed, initial=solution.path,
+                                       iterations=repair, deadline=deadline)
+        if repaired.total > solution.total:
+            solution = repaired
+    return solution
@@ -1,18 +1,26 @@
 import sys, getopt
 import os
+import numpy as np
 import pandas as pd
 
+from .graph import route_totals
+from .limits import GAP, Guard, LimitReached, offer
+from .random_solver import Output
+
+# memory a step of exact_search keeps while it is on the walk: references in the lists of the walk,
+# an entry of the visit counts and an iterator over the neighbours
+LEVEL_BYTES = 160
+
 class City:
     """ This class defines how city is represented. """
 
-    def __init__(self, name = "", x = None, y = None, value = 0, neighbours = {}):
+    def __init__(self, name = "", x = None, y = None, value = 0, neighbours = None):
         """ Initializes attributes. """
         self.name = name
         self.x = x
         self.y = y
         self.value = value
-        self.neighbours = neighbours
-        self.visited = False
+        self.neighbours = {} if neighbours is None else neighbours
 
     def getCoords(self, df_cities):
         self.x = df_cities.loc[df_cities['name']]
@@ -49,17 +57,23 @@ def convert_to_dict(df_cities, df_paths):
     return dict_paths
 
 
-def find_all_possible_paths(graph, start, time, path=[], price=0):
-    global all_paths
-    global newpaths
+def find_all_possible_paths(graph, start, time, path=None, price=0, all_paths=None, guard=None):
+    """
+    Adds to all_paths every path from start which cannot go further within time.
+    :param guard: limits.Guard counting nodes and memory of the paths, stops the search
+                  with LimitReached, paths found until then stay in all_paths
+    """
+    all_paths = [] if all_paths is None else all_paths
     time = time - price
-    path = path + [start]
+    path = (path or []) + [start]
+    if guard is not None:
+        # a list of len(path) references
+        guard.node(memory=64 + 8 * len(path))
     if start not in graph:
         return []
-    paths = []
     for node in graph[start].keys():
         if time - graph[start][node] >=0:
-            newpaths = find_all_possible_paths(graph, node, time , path, graph[start][node])
+            find_all_possible_paths(graph, node, time , path, graph[start][node], all_paths, guard)
         else:
             all_paths.append(path)
         if time==0:
@@ -75,13 +89,22 @@ def duplicate(items):
     return unique
 
 
-def create_all_possible_paths(graph,time):
+def create_all_possible_paths(graph, time, guard=None):
+    """
+    Paths from every city, see find_all_possible_paths. The search runs under the limits
+    of guard (unlimited by default); when one is hit the paths found so far are returned
+    and guard.status tells which limit it was.
+    """
     lista = []
-    for x in graph.keys():
-        all_paths=[]
-        newpaths=[]
-        lista = lista + duplicate(find_all_possible_paths(graph,x,time))
-        print(x)
+    guard = Guard() if guard is None else guard
+    with guard:
+        for x in graph.keys():
+            found = []
+            try:
+                find_all_possible_paths(graph, x, time, all_paths=found, guard=guard)
+            finally:
+                lista = lista + duplicate(found)
+            print(x)
     return lista
 
 
@@ -96,20 +119,15 @@ def create_cities_dictionary(graph, cities):
 
 
 def choose_the_best_path(lista, cities_list):
-    podsumowanie={}
-    g = 0
-    i = 1
-    for j in lista:
-        zysk = 0
-        for krok in j:
-            if cities_list[krok].visited == False:
-                zysk = zysk + cities_list[krok].value
-                cities_list[krok].visited = True
+    # visited cities are kept in a boolean mask per path, cities are not modified
+    nazwy = list(cities_list.keys())
+    indeks = {nazwa: i for i, nazwa in enumerate(nazwy)}
+    wartosci = np.array([cities_list[nazwa].value for nazwa in nazwy])
+    zyski = route_totals([[indeks[krok] for krok in j] for j in lista], wartosci)
+
+    podsumowanie = {}
+    for zysk, j in zip(zyski.tolist(), lista):
         podsumowanie[zysk] = j
-        g = g + 1
-        for krok in j:
-            cities_list[krok].visited = False
-        i = i + 1
     return podsumowanie
 
 
@@ -134,3 +152,137 @@ def create_answer_for_path_creation(dict, best):
     for x in range(do):
         answer_plot.append((dict[best][x], dict[best][x + 1]))
     return answer_plot
+
+
+def exact_search(graph, working_time, guard, best=None, incumbent=None, target=None):
+    """
+    Depth first branch and bound over walks of the graph, cities and corridors of reduced graphs
+    may be revisited but are counted once. A walk is cut when its total plus the best values that
+    could still fit into its time left cannot beat the best walk found.
+    :param graph: Graph of the instance
+    :param guard: limits.Guard, LimitReached is not caught here
+    :param best: list [total, time_left, list of city indices] of the best walk, updated in place,
+                 so it holds the incumbent when a limit stops the search
+    :param incumbent: total shared with searches in other processes, see limits.offer;
+                      walks which cannot beat it are cut too, so best may stay below it
+    :param target: total which is good enough, LimitReached(GAP) is raised once a walk collects it
+    :return: best
+    """
+    values = graph.value_list
+    item_value = graph.item_value.tolist()
+    indptr, indices, times = graph.indptr_list, graph.indices_list, graph.times_list
+    edge_item = graph.edge_item.tolist()
+    positive = [t for t in times if t > 0]
+    min_time = min(positive) if positive else 1
+    # with free moves any number of moves fits into the time left
+    free = len(positive) < len(times)
+    # a move across a contracted corridor collects the corridor and the city behind it
+    per_move = 2 if graph.n_items > graph.n else 1
+
+    def moves_within(time: int) -> int:
+        return graph.n_items if free else min(graph.n_items, per_move * (time // min_time))
+
+    # the k best values of the whole map bound what k more items can add,
+    # no walk collects more than the whole map
+    prefix = [0]
+    for v in sorted(item_value, reverse=True):
+        prefix.append(prefix[-1] + v)
+
+    best = [-1, working_time, []] if best is None else best
+    bar = best[0]  # total a walk has to beat
+    for start in sorted(range(graph.n), key=lambda i: -values[i]):
+        if incumbent is not None:
+            bar = max(bar, incumbent.value)
+        if values[start] + prefix[moves_within(working_time)] <= bar:
+            continue
+        path = [start]
+        counts = {start: 1}  # visits of items, cities and corridors
+        moves = []  # position in indices of every move on the path
+        # position on the path since which neither time nor total changed, for every position
+        still = [0]
+        total = values[start]
+        time_left = working_time
+        stack = [iter(range(indptr[start], indptr[start + 1]))]
+        if total > bar:
+            best[:] = [total, time_left, list(path)]
+            bar = total
+            offer(incumbent, total)
+            if target is not None and total >= target:
+                raise LimitReached(GAP)
+
+        while stack:
+            for k in stack[-1]:
+                t = times[k]
+                if t > time_left:
+                    continue
+                city, corridor = indices[k], edge_item[k]
+                gain = values[city] if city not in counts else 0
+                if corridor >= 0 and corridor not in counts:
+                    gain += item_value[corridor]
+                if t == 0 and gain == 0 and city in path[still[-1]:]:
+                    # a free cycle without value, the walk would be where it was before
+                    continue
+                if min(total + gain + prefix[moves_within(time_left - t)], prefix[-1]) <= bar:
+                    continue
+                break
+            else:
+                # all moves from the last city are done, step back
+                stack.pop()
+                if moves:
+                    guard.release(LEVEL_BYTES)
+                    still.pop()
+                    k = moves.pop()
+                    for item in (path.pop(), edge_item[k]):
+                        if item >= 0:
+                            counts[item] -= 1
+                            if not counts[item]:
+                                del counts[item]
+                                total -= item_value[item]
+                    time_left += times[k]
+                continue
+
+            guard.node(memory=LEVEL_BYTES)
+            if incumbent is not None and guard.nodes % guard.sample == 0:
+                bar = max(bar, incumbent.value)
+            still.append(still[-1] if t == 0 and gain == 0 else len(path))
+            path.append(city)
+            for item in (city, corridor):
+                if item >= 0:
+                    counts[item] = counts.get(item, 0) + 1
+            moves.append(k)
+            total += gain
+            time_left -= t
+            stack.append(iter(range(indptr[city], indptr[city + 1])))
+            if total > bar:
+                best[:] = [total, time_left, list(path)]
+                bar = total
+                offer(incumbent, total)
+                if target is not None and total >= target:
+                    raise LimitReached(GAP)
+
+    return best
+
+
+def find_exact_path(instance, working_time, max_nodes=10 ** 6, max_memory=256 * 2 ** 20, deadline=None,
+                    trace_memory=False, incumbent=None, gap=None):
+    """
+    Returns Output for the best walk of exact_search on an Instance. Status is
+    limits.COMPLETE when the walk is optimal, otherwise the limit which stopped the search
+    and the walk is the best one found until then.
+
+    :param max_nodes: number of search nodes
+    :param max_memory: memory in bytes
+    :param deadline: wall-clock limit in seconds
+    :param trace_memory: check memory with tracemalloc too, see limits.Guard
+    :param incumbent: shared total of other searches, see exact_search
+    :param gap: the search stops with status limits.GAP once its walk is within gap (a fraction)
+                of the upper bound
+    """
+    graph = instance.csr
+    guard = Guard(max_nodes, max_memory, deadline, trace_memory)
+    best = [-1, working_time, []]
+    with guard:
+        exact_search(graph, working_time, guard, best, incumbent, instance.target(working_time, gap))
+    total, time_left, route = best
+    path = [instance.cities_dict[graph.names[i]] for i in route]
+    return Output(time_left, max(total, 0), path, guard.status)
@@ -0,0 +1,292 @@
+import os
+
+import numpy as np
+import pandas as pd
+
+
+class Graph:
+    """
+    Compressed sparse row (CSR) form of the cities graph. Cities are numbered 0..n-1,
+    neighbours of city i are indices[indptr[i]:indptr[i + 1]] with travel times
+    in times at the same positions.
+
+    Values are collected from items: cities 0..n-1 and contracted corridors n..n_items-1.
+    edge_item holds the corridor item of every edge or -1.
+
+    Edges are also numbered 0..m-1 in order of the pair (min, max) of their cities, both
+    directions share the id: edge_id holds it for every position in indices, edge_ends
+    and edge_time hold the cities and the travel time of every edge, see edge_ids.
+    """
+
+    def __init__(self, names: list, x: np.ndarray, y: np.ndarray, value: np.ndarray,
+                 indptr: np.ndarray, indices: np.ndarray, times: np.ndarray,
+                 edge_item: np.ndarray = None, corridor_value: np.ndarray = None, derived: dict = None) -> None:
+        """
+        :param derived: arrays of DERIVED computed before, e.g. memory-mapped by load, computed here if not given
+        """
+        self.names = names
+        self.x = x
+        self.y = y
+        self.value = value
+        self.indptr = indptr
+        self.indices = indices
+        self.times = times
+        self.n = len(names)
+        self.edge_item = np.full(len(indices), -1, dtype=np.int64) if edge_item is None else edge_item
+        if derived is None:
+            corridor_value = np.zeros(0, dtype=np.int64) if corridor_value is None else corridor_value
+            derived = self._derive(np.concatenate([value, corridor_value]))
+        for name in self.DERIVED:
+            setattr(self, name, derived[name])
+        self.n_items = len(self.item_value)
+        self.m = len(self.edge_keys)
+
+    # arrays computed from the ones above, written by save so loaded graphs share them too
+    DERIVED = ('item_value', 'degree', 'nbr', 'nbr_time', 'nbr_edge', 'nbr_item',
+               'edge_keys', 'edge_id', 'edge_ends', 'edge_time')
+    # plain lists are much faster than arrays for reading a few items at a time,
+    # they are made on first use, e.g. graph.indices_list, so graphs which are only drawn do not hold them
+    LISTS = ('indptr', 'indices', 'times', 'x', 'y', 'value')
+
+    def _derive(self, item_value: np.ndarray) -> dict:
+        indptr, indices, times = self.indptr, self.indices, self.times
+
+        # neighbour matrix padded with -1, used for scoring many routes at once
+        degree = np.diff(indptr)
+        width = int(degree.max()) if self.n else 0
+        nbr = np.full((self.n, width), -1, dtype=np.int64)
+        nbr_time = np.zeros((self.n, width), dtype=np.int64)
+        nbr_edge = np.full((self.n, width), -1, dtype=np.int64)  # position in indices
+        rows = np.repeat(np.arange(self.n), degree)
+        cols = np.arange(len(indices)) - np.repeat(indptr[:-1], degree)
+        nbr[rows, cols] = indices
+        nbr_time[rows, cols] = times
+        nbr_edge[rows, cols] = np.arange(len(indices))
+        nbr_item = np.where(nbr_edge >= 0, self.edge_item[nbr_edge], -1)
+
+        # canonical edge table keyed by min * n + max of the cities of an edge
+        low, high = np.minimum(rows, indices), np.maximum(rows, indices)
+        edge_keys, edge_id = np.unique(low * self.n + high, return_inverse=True)
+        edge_ends = np.column_stack([edge_keys // max(self.n, 1), edge_keys % max(self.n, 1)])
+        edge_time = np.zeros(len(edge_keys), dtype=np.int64)
+        edge_time[edge_id] = times
+
+        return dict(item_value=item_value, degree=degree, nbr=nbr, nbr_time=nbr_time, nbr_edge=nbr_edge,
+                    nbr_item=nbr_item, edge_keys=edge_keys, edge_id=edge_id, edge_ends=edge_ends, edge_time=edge_time)
+
+    def __getattr__(self, name: str):
+        # lazy attributes, only called when the attribute is not set yet
+        if name.endswith('_list') and name[:-5] in self.LISTS:
+            setattr(self, name, getattr(self, name[:-5]).tolist())
+        elif name == 'index':
+            self.index = {city: i for i, city in enumerate(self.names)}
+        else:
+            raise AttributeError(name)
+        return self.__dict__[name]
+
+    @classmethod
+    def from_frames(cls, df_cities: pd.DataFrame, df_paths: pd.DataFrame) -> 'Graph':
+        """
+        Builds the graph straight from data frames, edges work both ways.
+        For repeated edges the last travel time wins, in whichever direction it was given,
+        so both directions and the edge table share one time.
+
+        :param df_cities: pandas.read_csv("cities.csv")
+        :param df_paths: pandas.read_csv("paths.csv")
+        """
+
+        names = df_cities.iloc[:, 0].tolist()
+        n = len(names)
+        index = pd.Index(names)
+        a = index.get_indexer(df_paths['city_from'])
+        b = index.get_indexer(df_paths['city_to'])
+        t = df_paths['time'].values.astype(np.int64)
+        known = (a >= 0) & (b >= 0)
+        a, b, t = a[known], b[known], t[known]
+
+        # one time for each pair of cities, of its last row
+        pair = np.minimum(a, b).astype(np.int64) * n + np.maximum(a, b)
+        _, inverse = np.unique(pair, return_inverse=True)
+        _, last_row = np.unique(pair[::-1], return_index=True)
+        t = t[len(pair) - 1 - last_row][inverse]
+
+        src = np.concatenate([a, b]).astype(np.int64)
+        dst = np.concatenate([b, a]).astype(np.int64)
+        times = np.concatenate([t, t])
+
+        # neighbours in order of the first occurrence, travel time of the last one
+        key = src * n + dst
+        _, first = np.unique(key, return_index=True)
+        _, last = np.unique(key[::-1], return_index=True)
+        last = len(key) - 1 - last
+        order = np.lexsort((first, src[first]))
+        first, last = first[order], last[order]
+
+        indptr = np.zeros(n + 1, dtype=np.int64)
+        indptr[1:] = np.cumsum(np.bincount(src[first], minlength=n))
+
+        return cls(names,
+                   df_cities.iloc[:, 1].values,
+                   df_cities.iloc[:, 2].values,
+                   df_cities.iloc[:, 3].values.astype(np.int64),
+                   indptr, dst[first], times[last])
+
+    @classmethod
+    def from_dict(cls, graph: dict, base: 'Graph', corridors: dict = None) -> 'Graph':
+        """
+        Builds the graph {city: {neighbour : time}} over cities of the base graph.
+        :param corridors: values of contracted corridors {(city_from, city_to) : value}
+        """
+
+        names = list(graph.keys())
+        index = {name: i for i, name in enumerate(names)}
+        rows = np.array([base.index[name] for name in names], dtype=np.int64)
+
+        indptr = np.zeros(len(names) + 1, dtype=np.int64)
+        indptr[1:] = np.cumsum([len(graph[name]) for name in names])
+        indices = np.array([index[n] for name in names for n in graph[name]], dtype=np.int64)
+        times = np.array([t for name in names for t in graph[name].values()], dtype=np.int64)
+
+        # both directions of a corridor share one item
+        items = {}
+        edge_item = np.full(len(indices), -1, dtype=np.int64)
+        edges = ((name, n) for name in names for n in graph[name])
+        for position, edge in enumerate(edges):
+            if corridors and edge in corridors:
+                key = frozenset(edge)
+                edge_item[position] = items.setdefault(key, len(names) + len(items))
+        corridor_value = np.zeros(len(items), dtype=np.int64)
+        for key, item in items.items():
+            corridor_value[item - len(names)] = corridors[tuple(key)]
+
+        return cls(names, base.x[rows], base.y[rows], base.value[rows],
+                   indptr, indices, times, edge_item, corridor_value)
+
+    ARRAYS = ('x', 'y', 'value', 'indptr', 'indices', 'times', 'edge_item', 'corridor_value')
+
+    def save(self, directory: str) -> None:
+        """ Writes names, arrays and derived arrays of the graph as .npy files into a directory, see load. """
+        os.makedirs(directory, exist_ok=True)
+        arrays = dict(x=self.x, y=self.y, value=self.value, indptr=self.indptr, indices=self.indices,
+                      times=self.times, edge_item=self.edge_item, corridor_value=self.item_value[self.n:])
+        arrays.update((name, getattr(self, name)) for name in self.DERIVED)
+        np.save(os.path.join(directory, 'names.npy'), np.asarray(self.names))
+        for name, array in arrays.items():
+            np.save(os.path.join(directory, f'{name}.npy'), np.ascontiguousarray(array))
+
+    @classmethod
+    def load(cls, directory: str, mmap: bool = True) -> 'Graph':
+        """
+        Reads a graph written by save.
+        :param mmap: memory-map the arrays read-only, processes loading the same graph share their pages
+        """
+        mode = 'r' if mmap else None
+
+        def read(name):
+            return np.load(os.path.join(directory, f'{name}.npy'), mmap_mode=mode)
+
+        arrays = [read(name) for name in cls.ARRAYS]
+        names = np.load(os.path.join(directory, 'names.npy')).tolist()
+        # graphs saved without derived arrays compute them
+        derived = None
+        if all(os.path.exists(os.path.join(directory, f'{name}.npy')) for name in cls.DERIVED):
+            derived = {name: read(name) for name in cls.DERIVED}
+        return cls(names, *arrays, derived=derived)
+
+    def subgraph(self, cities: np.ndarray) -> 'Graph':
+        """
+        Graph induced by the given city indices, city i of the subgraph is cities[i].
+        Corridor items are dropped, their edges become plain edges.
+        """
+
+        cities = np.asarray(cities, dtype=np.int64)
+        local = np.full(self.n, -1, dtype=np.int64)
+        local[cities] = np.arange(len(cities))
+
+        # positions in indices of all edges going out of the cities
+        degree = self.degree[cities]
+        offsets = np.arange(degree.sum()) - np.repeat(np.cumsum(degree) - degree, degree)
+        positions = np.repeat(self.indptr[cities], degree) + offsets
+        rows = np.repeat(np.arange(len(cities)), degree)
+
+        inside = local[self.indices[positions]] >= 0
+        positions, rows = positions[inside], rows[inside]
+        indptr = np.zeros(len(cities) + 1, dtype=np.int64)
+        indptr[1:] = np.cumsum(np.bincount(rows, minlength=len(cities)))
+
+        return Graph([self.names[i] for i in cities.tolist()],
+                     self.x[cities], self.y[cities], self.value[cities],
+                     indptr, local[self.indices[positions]], self.times[positions])
+
+    def edge_ids(self, a, b) -> np.ndarray:
+        """
+        Ids of the edges between cities a[i] and b[i], arrays of city indices in either direction.
+        Raises KeyError if some pair is not an edge.
+        """
+
+        a, b = np.asarray(a, dtype=np.int64), np.asarray(b, dtype=np.int64)
+        keys = np.minimum(a, b) * self.n + np.maximum(a, b)
+        ids = np.minimum(np.searchsorted(self.edge_keys, keys), max(self.m - 1, 0))
+        missing = self.edge_keys[ids] != keys if self.m else np.ones(len(keys), dtype=bool)
+        if missing.any():
+            k = int(np.argmax(missing))
+            raise KeyError(f'no edge between {self.names[a[k]]} and {self.names[b[k]]}')
+        return ids
+
+    def route_edges(self, route) -> np.ndarray:
+        """ Ids of the edges of a route given as city indices, in order, repeated when walked again. """
+        route = np.asarray(route, dtype=np.int64)
+        return self.edge_ids(route[:-1], route[1:])
+
+    def to_dict(self) -> dict:
+        """ Returns the graph as a dictionary {city: {neighbour : time}}. """
+        return {name: self.neighbour_times(i) for i, name in enumerate(self.names)}
+
+    def neighbour_times(self, i: int) -> dict:
+        """ Returns dictionary {neighbour name : travel time} of city i. """
+        start, stop = self.indptr_list[i], self.indptr_list[i + 1]
+        names = self.names
+        return {names[j]: t for j, t in zip(self.indices_list[start:stop], self.times_list[start:stop])}
+
+    def adjacency(self, i: int) -> list:
+        """ Returns list of pairs (neighbour index, travel time) of city i. """
+        start, stop = self.indptr_list[i], self.indptr_list[i + 1]
+        return list(zip(self.indices_list[start:stop], self.times_list[start:stop]))
+
+
+def bitset(rows: int, n: int) -> np.ndarray:
+    """ Returns empty bitsets over n cities, one row of 64-bit words per route. """
+    return np.zeros((rows, (n + 63) // 64), dtype=np.uint64)
+
+
+def bitset_test(bits: np.ndarray, rows: np.ndarray, cities: np.ndarray) -> np.ndarray:
+    """ Tests bits of cities (broadcast against rows), True where a city was visited. """
+    words = bits[rows, cities >> 6]
+    return ((words >> (cities & 63).astype(np.uint64)) & np.uint64(1)).astype(bool)
+
+
+def bitset_set(bits: np.ndarray, rows: np.ndarray, cities: np.ndarray) -> None:
+    """ Sets bits of cities in given rows, in place. """
+    bits[rows, cities >> 6] |= np.uint64(1) << (cities & 63).astype(np.uint64)
+
+
+def visited_mask(routes: list, n: int) -> np.ndarray:
+    """ Boolean (routes, n) matrix, True where a route (array of city indices) visits a city. """
+    mask = np.zeros((len(routes), n), dtype=bool)
+    if routes:
+        rows = np.repeat(np.arange(len(routes)), [len(r) for r in routes])
+        mask[rows, np.concatenate(routes).astype(np.int64)] = True
+    return mask
+
+
+def route_totals(routes: list, value: np.ndarray, chunk: int = 1024) -> np.ndarray:
+    """
+    Value collected by each route, every city counted once per route.
+    Routes are scored in chunks, so memory is limited to chunk x cities booleans.
+    """
+
+    totals = np.zeros(len(routes), dtype=value.dtype)
+    for first in range(0, len(routes), chunk):
+        mask = visited_mask(routes[first:first + chunk], len(value))
+        totals[first:first + chunk] = mask @ value
+    return totals
@@ -0,0 +1,390 @@
+import hashlib
+from collections import OrderedDict
+from heapq import heappush, heappop
+
+import numpy as np
+import pandas as pd
+
+from .aco_solver import find_aco_path
+from .beam_solver import beam_search, find_beam_path
+from .decomposition_solver import find_decomposition_path
+from .exact_solver import find_exact_path
+from .multilevel_solver import find_multilevel_path
+from .portfolio import find_portfolio_path
+from .bounds import gap_target, knapsack_bound, start_bounds
+from .graph import Graph
+from .limits import COMPLETE
+from .reduction import Reduction, reduce_graph
+from .annealing_solver import find_annealing_path
+from .city import Cities, City
+from .random_solver import Output, find_best_random_paths_per_start, path_time, path_total, random_walk, trim_path
+from .spatial import GridIndex
+
+
+# engines other than random walks: {name : function(instance, working_time, **options) -> Output}
+ENGINES = {
+    'beam': find_beam_path,
+    'aco': find_aco_path,
+    'annealing': find_annealing_path,
+    'decomposition': find_decomposition_path,
+    'multilevel': find_multilevel_path,
+    'exact': find_exact_path,
+    'portfolio': find_portfolio_path,
+}
+
+
+def instance_key(*contents: str) -> str:
+    """ Returns a hash of the uploaded files, used to recognise the same map between solves. """
+    h = hashlib.sha1()
+    for content in contents:
+        h.update(content.encode('utf-8'))
+        h.update(b'\0')
+    return h.hexdigest()
+
+
+class Instance:
+    """
+    Keeps a parsed map between solves: graph, views of its cities, distance cache
+    and the best path found for every start city for each solved budget.
+    """
+
+    def __init__(self, cities: pd.DataFrame, paths: pd.DataFrame,
+                 reduction: Reduction = None, base: Graph = None, csr: Graph = None) -> None:
+        """
+        :param reduction: builds the instance on a reduced graph of the base graph instead
+        :param csr: uses a graph built elsewhere instead, cities and paths may be None then
+        """
+        self.cities = cities
+        self.paths = paths
+        self.reduction = reduction
+        if csr is not None:
+            self.csr = csr
+            self.corridors = {}
+        elif reduction is None:
+            self.csr = Graph.from_frames(cities, paths)
+            self.corridors = {}
+        else:
+            self.csr = Graph.from_dict(reduction.graph, base, reduction.corridor_value)
+            self.corridors = reduction.corridor_value
+        self.cities_dict = Cities(self.csr)
+        self._reduced = {}     # {working_time : Instance on the reduced graph}
+        self.solutions = {}    # {(solver, working_time) : Output}
+        self.starts = {}       # {(guided, n, gap) : {working_time : {starting_city : Output}}}, random walks only
+        self._distances = {}   # {city : (limit, distances, predecessors)}
+        self._bounds = {}      # {working_time : upper bound of value for each start}
+        self.races = {}        # {working_time : reports of engines of the last portfolio race}
+        self.by_start = {}     # {working_time : {starting_city : Output}}, best route of any solve for each start
+        self._grid = None      # GridIndex over coordinates of cities, built on the first click
+        self.caches_changed = 0     # number of additions to the caches of dump_caches
+        self.caches_stored = None   # caches_changed when the caches were last stored, see catalog.store
+
+    def dump_caches(self) -> dict:
+        """
+        Distance and bound caches, stored with the graph to skip them next time, see load_caches.
+        The dictionaries are copied, so they can be pickled while a background job adds to them.
+        """
+        return {'distances': self._distances.copy(), 'bounds': self._bounds.copy()}
+
+    def load_caches(self, caches: dict) -> None:
+        """ Restores caches of dump_caches made for the same graph. """
+        self._distances.update(caches.get('distances', {}))
+        self._bounds.update(caches.get('bounds', {}))
+
+    def bounds(self, working_time: int) -> np.ndarray:
+        """ Upper bounds of value for each start city (ordered as csr.names), cached per budget. """
+        if working_time not in self._bounds:
+            self._bounds[working_time] = start_bounds(self.csr, working_time)
+            self.caches_changed += 1
+        return self._bounds[working_time]
+
+    def upper_bound(self, working_time: int) -> int:
+        """
+        Upper bound of the best total for working_time: the knapsack bound, the best bound
+        of start cities if they were computed and the total of a complete exact search if one was run.
+        """
+        bound = knapsack_bound(self.csr, working_time)
+        if working_time in self._bounds:
+            bound = min(bound, int(self._bounds[working_time].max()))
+        for key, solution in self.solutions.items():
+            if key[1] == working_time and solution.status == COMPLETE and ('reduce', True) not in key:
+                bound = min(bound, solution.total)
+        return bound
+
+    def target(self, working_time: int, gap: float = None):
+        """ Total at which searches within gap of the upper bound stop, None without a gap. """
+        return None if gap is None else gap_target(self.upper_bound(working_time), gap)
+
+    def distances(self, source: str, limit: float = float('inf')) -> tuple:
+        """
+        Dijkstra from source bounded by limit, cached per source.
+        :return: tuple (distances, predecessors) of dictionaries keyed by city name
+        """
+
+        cached = self._distances.get(source)
+        if cached is not None and cached[0] >= limit:
+            return cached[1], cached[2]
+
+        graph = self.csr
+        start = graph.index[source]
+        dist = {start: 0}
+        prev = {start: None}
+        heap = [(0, start)]
+        while heap:
+            d, city = heappop(heap)
+            if d > dist[city]:
+                continue
+            for neighbour, t in graph.adjacency(city):
+                nd = d + t
+                if nd <= limit and nd < dist.get(neighbour, float('inf')):
+                    dist[neighbour] = nd
+                    prev[neighbour] = city
+                    heappush(heap, (nd, neighbour))
+
+        names = graph.names
+        dist = {names[c]: d for c, d in dist.items()}
+        prev = {names[c]: (names[p] if p is not None else None) for c, p in prev.items()}
+        self._distances[source] = (limit, dist, prev)
+        self.caches_changed += 1
+        return dist, prev
+
+    def shortest_path(self, source: str, target: str, prev: dict) -> list:
+        """ Returns City objects on the shortest path from source to target, source excluded. """
+        path = []
+        while target != source:
+            path.append(self.cities_dict[target])
+            target = prev[target]
+        return path[::-1]
+
+    def extend_path(self, path: list, working_time: int) -> Output:
+        """
+        Greedily spends the extra time on a path. Each step takes the best value per time
+        out of: a detour u -> v -> u to an unvisited neighbour of a city on the path
+        or a shortest path from the last city to an unvisited city.
+        """
+
+        path = list(path)
+        visited = {c.name for c in path}
+        time_left = working_time - path_time(path)
+
+        while time_left > 0:
+            best = None  # (ratio, gain, cost, position, cities to insert)
+
+            # detours from the first occurrence of each city on the path
+            positions = {}
+            for i, city in enumerate(path):
+                positions.setdefault(city.name, i)
+            for name, i in positions.items():
+                city = path[i]
+                for neighbour, t in city.neighbours.items():
+                    if neighbour in visited or 2 * t > time_left:
+                        continue
+                    value = self.cities_dict[neighbour].value
+                    ratio = value / (2 * t) if t else float('inf')
+                    if best is None or ratio > best[0]:
+                        best = (ratio, value, 2 * t, i + 1, [self.cities_dict[neighbour], city])
+
+            # extension of the tail
+            last = path[-1].name
+            dist, prev = self.distances(last, time_left)
+            for name, d in dist.items():
+                if name in visited or d > time_left:
+                    continue
+                tail = self.shortest_path(last, name, prev)
+                value = sum(c.value for c in {c.name: c for c in tail if c.name not in visited}.values())
+                ratio = value / d if d else float('inf')
+                if best is None or ratio > best[0]:
+                    best = (ratio, value, d, len(path), tail)
+
+            if best is None or best[1] <= 0:
+                break
+
+            _, _, cost, position, cities = best
+            path[position:position] = cities
+            visited.update(c.name for c in cities)
+            time_left -= cost
+
+        return Output(time_left, path_total(path), path)
+
+    def reduced(self, working_time: int) -> 'Instance':
+        """ Instance on the graph reduced for working_time, see reduction.reduce_graph. """
+        if working_time not in self._reduced:
+            values = dict(zip(self.csr.names, self.csr.value.tolist()))
+            reduction = reduce_graph(self.csr.to_dict(), values, working_time)
+            if reduction.graph:
+                self._reduced[working_time] = Instance(self.cities, self.paths, reduction, self.csr)
+            else:
+                self._reduced[working_time] = self
+        return self._reduced[working_time]
+
+    def expand(self, solution: Output, working_time: int) -> Output:
+        """ Maps a solution of a reduced instance back to cities of this one. """
+        reduced = self.reduced(working_time)
+        if reduced is self:
+            return solution
+        names = reduced.reduction.expand([c.name for c in solution.path])
+        path = [self.cities_dict[name] for name in names]
+        return Output(working_time - path_time(path), path_total(path), path, solution.status)
+
+    def with_edges(self, solution: Output) -> Output:
+        """ Solution with ids of the edges of its path, see Graph.route_edges. """
+        if solution.edges is not None:
+            return solution
+        return solution._replace(edges=self.csr.route_edges([c.id for c in solution.path]))
+
+    def keep_start(self, working_time: int, solution: Output) -> None:
+        """ Keeps solution in by_start if it is the best route found from its first city. """
+        if not solution.path:
+            return
+        starts = self.by_start.setdefault(working_time, {})
+        name = solution.path[0].name
+        if name not in starts or solution.total > starts[name].total:
+            starts[name] = solution
+
+    def nearest_city(self, x: float, y: float) -> str:
+        """ Name of the city closest to (x, y), e.g. to a click on the map. """
+        if self._grid is None:
+            self._grid = GridIndex(self.csr.x, self.csr.y)
+        return self.csr.names[self._grid.nearest(x, y)]
+
+    def end_at(self, path: list, end: str, working_time: int) -> Output:
+        """
+        Best route made of a prefix of path and the shortest path from its last city to end
+        which fits into working_time. Raises ValueError when end is out of reach of the first city.
+        """
+
+        dist, prev = self.distances(end, working_time)
+        best = None
+        elapsed = 0
+        for k, city in enumerate(path):
+            if k:
+                elapsed += path[k - 1].neighbours[city.name]
+            if elapsed > working_time:
+                break
+            if city.name not in dist or elapsed + dist[city.name] > working_time:
+                continue
+            # the shortest path from end to the city, walked backwards
+            tail = self.shortest_path(end, city.name, prev)[::-1][1:] + [self.cities_dict[end]] \
+                if city.name != end else []
+            route = path[:k + 1] + tail
+            total = path_total(route)
+            if best is None or total > best.total:
+                best = Output(working_time - elapsed - dist[city.name], total, route)
+
+        if best is None:
+            raise ValueError(f'{end} cannot be reached from {path[0].name} within {working_time}')
+        return best
+
+    def pin(self, working_time: int, start: str, end: str = None, refine: bool = False,
+            n: int = 50, width: int = 100) -> Output:
+        """
+        Best route from start, ending at end if given. The best route of earlier solves from start
+        is returned at once; a refinement searches from start only: random walks and a beam search
+        from it, the best of them extended by extend_path. It runs when refine is set or nothing
+        was found from start before, and its route is kept in by_start.
+
+        :param n: number of random walks of a refinement
+        :param width: beam width of a refinement
+        """
+
+        route = self.by_start.get(working_time, {}).get(start)
+        if refine or route is None:
+            graph = self.csr
+            first = graph.index[start]
+            walks = [random_walk(graph, first, working_time, self.corridors) for _ in range(n)]
+            walks.append(beam_search(graph, working_time, width, starts=[first]))
+            time_left, total, path = max(walks, key=lambda x: x[1])
+            found = self.extend_path([City(graph, i) for i in path], working_time)
+            self.keep_start(working_time, found)
+            route = self.by_start[working_time][start]
+
+        if end is not None:
+            return self.with_edges(self.end_at(route.path, end, working_time))
+        # edges are found once, later pins return the same route
+        self.by_start[working_time][start] = self.with_edges(route)
+        return self.by_start[working_time][start]
+
+    def engine(self, solver: str):
+        """ Returns the function solving with solver, 'random' or one of ENGINES. """
+        return self.solve_random if solver == 'random' else ENGINES[solver]
+
+    def solve(self, working_time: int, solver: str = 'random', reduce: bool = False, **options) -> Output:
+        """
+        Returns the best path for working_time found by the solver,
+        'random' or one of ENGINES. Solutions are cached per solver, budget and options.
+        :param reduce: search on the reduced graph and map the solution back
+        """
+
+        key = (solver, working_time) + tuple(sorted(options.items()))
+        if reduce:
+            key += (('reduce', True),)
+            if key not in self.solutions:
+                solution = self.reduced(working_time).solve(working_time, solver, **options)
+                self.solutions[key] = self.expand(solution, working_time)
+        elif key not in self.solutions:
+            if solver == 'random':
+                self.solutions[key] = self.solve_random(working_time, **options)
+            else:
+                self.solutions[key] = ENGINES[solver](self, working_time, **options)
+        self.solutions[key] = self.with_edges(self.solutions[key])
+        self.keep_start(working_time, self.solutions[key])
+        return self.solutions[key]
+
+    def solve_random(self, working_time: int, n: int = 50, warm: int = 5, incumbent=None,
+                     guided: bool = False, gap: float = None) -> Output:
+        """
+        Returns the best random walk for working_time. The first solve of a kind of walks (guided, n, gap)
+        runs random walks from every city, later ones warm-start from the closest budget solved with the
+        same kind: paths are trimmed when the budget shrinks and the best ones extended when it grows.
+        :param n: number of random walks for each start city in a cold solve
+        :param warm: number of best per-start paths extended in a warm start
+        :param incumbent: total shared with searches in other processes, prunes starts of a cold solve
+        :param guided: guided walks in a cold solve, see random_solver.find_guided_path
+        :param gap: a cold solve stops once a walk is within gap (a fraction) of the upper bound
+        """
+
+        solved = self.starts.setdefault((guided, n, gap), {})
+        if not solved:
+            bounds = dict(zip(self.csr.names, self.bounds(working_time)))
+            starts = find_best_random_paths_per_start(self.cities_dict, working_time, n, self.corridors, bounds,
+                                                      incumbent, guided, self.target(working_time, gap))
+        else:
+            closest = min(solved, key=lambda b: abs(b - working_time))
+            previous = solved[closest]
+            if working_time < closest:
+                starts = {k: trim_path(o.path, working_time) for k, o in previous.items()}
+            else:
+                # routes of the other starts still fit into the larger budget
+                grown = working_time - closest
+                starts = {k: Output(o.time_left + grown, o.total, o.path) for k, o in previous.items()}
+                best = sorted(previous.items(), key=lambda x: x[1].total, reverse=True)[:warm]
+                starts.update((k, self.extend_path(o.path, working_time)) for k, o in best)
+            # routes of an earlier solve of this budget are kept where they are better
+            for k, o in solved.get(working_time, {}).items():
+                if k not in starts or o.total > starts[k].total:
+                    starts[k] = o
+
+        solved[working_time] = starts
+        for solution in starts.values():
+            self.keep_start(working_time, solution)
+        return max(starts.values(), key=lambda x: x.total)
+
+
+class InstanceCache:
+    """ Least recently used cache of Instance objects keyed by instance_key. """
+
+    def __init__(self, maxsize: int = 8) -> None:
+        self.maxsize = maxsize
+        self._instances = OrderedDict()
+
+    def get(self, key: str):
+        instance = self._instances.get(key)
+        if instance is not None:
+            self._instances.move_to_end(key)
+        return instance
+
+    def put(self, key: str, instance: Instance) -> Instance:
+        self._instances[key] = instance
+        self._instances.move_to_end(key)
+        while len(self._instances) > self.maxsize:
+            self._instances.popitem(last=False)
+        return instance
@@ -0,0 +1,108 @@
+import tracemalloc
+from time import time as now
+
+# status of a search which ran to the end, the other ones name the limit which stopped it
+COMPLETE = 'complete'
+NODES = 'nodes'
+MEMORY = 'memory'
+TIME = 'time'
+# status of a search stopped once its route was within the target gap of the upper bound, see bounds.gap_target
+GAP = 'gap'
+
+
+class LimitReached(Exception):
+    """
+    Raised when a search hits one of its limits: NODES, MEMORY or TIME by Guard,
+    GAP by a search which reached its target total.
+    """
+
+    def __init__(self, limit: str) -> None:
+        super().__init__(f'{limit} limit reached')
+        self.limit = limit
+
+
+class Guard:
+    """
+    Limits of an exhaustive search: number of nodes, memory and wall-clock time.
+    Searches call node() for every expanded node; it only counts, the clock and memory
+    are checked every sample nodes. Memory is the estimate the search adds to node(), less
+    what it gives back with release(), or the memory traced by tracemalloc if trace_memory is set, whichever is larger.
+    """
+
+    def __init__(self, max_nodes: int = None, max_memory: int = None, deadline: float = None,
+                 trace_memory: bool = False, sample: int = 1024) -> None:
+        """
+        :param max_nodes: number of search nodes
+        :param max_memory: memory in bytes
+        :param deadline: wall-clock limit in seconds
+        :param trace_memory: sample memory with tracemalloc, slows the search down
+        :param sample: number of nodes between checks of time and memory
+        """
+        self.max_nodes = max_nodes
+        self.max_memory = max_memory
+        self.deadline = deadline
+        self.trace_memory = trace_memory
+        self.sample = sample
+        self.nodes = 0
+        self.memory = 0
+        self.status = None
+        self._tic = None
+        self._traced = None
+
+    def __enter__(self) -> 'Guard':
+        self._tic = now()
+        if self.trace_memory and self.max_memory is not None:
+            self._traced = not tracemalloc.is_tracing()
+            if self._traced:
+                tracemalloc.start()
+            self._baseline = tracemalloc.get_traced_memory()[0]
+        return self
+
+    def __exit__(self, kind, error, traceback) -> bool:
+        if self._traced:
+            tracemalloc.stop()
+        if kind is None:
+            self.status = COMPLETE
+        elif issubclass(kind, LimitReached):
+            self.status = error.limit
+            return True  # the search keeps its incumbent
+        return False
+
+    def node(self, memory: int = 0) -> None:
+        """ Counts a search node and the memory it keeps. Raises LimitReached. """
+        self.nodes += 1
+        self.memory += memory
+        if self.max_nodes is not None and self.nodes > self.max_nodes:
+            raise LimitReached(NODES)
+        if self.nodes % self.sample == 0:
+            self.check()
+
+    def release(self, memory: int) -> None:
+        """ Takes back memory counted by node(), e.g. when a depth first search steps back. """
+        self.memory -= memory
+
+    def check(self) -> None:
+        """ Checks time and memory limits. Raises LimitReached. """
+        if self.deadline is not None and now() - self._tic > self.deadline:
+            raise LimitReached(TIME)
+        if self.max_memory is not None:
+            memory = self.memory
+            if self._traced is not None:
+                memory = max(memory, tracemalloc.get_traced_memory()[0] - self._baseline)
+            if memory > self.max_memory:
+                raise LimitReached(MEMORY)
+
+
+def offer(incumbent, total: int) -> bool:
+    """
+    Raises a shared incumbent, e.g. multiprocessing.Value('q'), to total if it is better.
+    Searches running in other processes read incumbent.value to prune with it.
+    :return: True if total became the incumbent
+    """
+    if incumbent is None:
+        return False
+    with incumbent.get_lock():
+        if total > incumbent.value:
+            incumbent.value = total
+            return True
+    return False
@@ -0,0 +1,167 @@
+import numpy as np
+
+from .beam_solver import beam_search
+from .graph import Graph
+from .random_solver import Output, path_time, path_total, trim_path
+
+
+def match(graph: Graph, rounds: int = 3) -> np.ndarray:
+    """
+    Pairs neighbouring cities. In every round each unpaired city proposes to its unpaired
+    neighbour with the shortest travel time and mutual proposals are paired.
+    :return: array with the mate of every city, -1 for cities left alone
+    """
+
+    n = graph.n
+    mate = np.full(n, -1, dtype=np.int64)
+    src = np.repeat(np.arange(n), graph.degree)
+    dst = graph.indices
+    rows = np.flatnonzero(graph.degree > 0)
+
+    # travel time and neighbour in one key, the smallest key of a row is its shortest edge
+    # with ties broken by neighbour index; edges to paired cities get the largest key
+    key = graph.times.astype(np.int64) * n + dst
+    closed = np.iinfo(np.int64).max
+    for _ in range(rounds):
+        free = mate < 0
+        ok = free[src] & free[dst] & (src != dst)
+        if not ok.any():
+            break
+
+        best = np.minimum.reduceat(np.where(ok, key, closed), graph.indptr[rows])
+        proposers = rows[best < closed]
+        proposal = np.full(n, -1, dtype=np.int64)
+        proposal[proposers] = best[best < closed] % n
+
+        mutual = proposal[proposers][proposal[proposal[proposers]] == proposers]
+        mate[mutual] = proposal[mutual]
+    return mate
+
+
+def coarsen(graph: Graph, inner: np.ndarray = None, rounds: int = 3) -> tuple:
+    """
+    Merges paired cities (see match) into one. A merged city collects the quantities of its
+    cities, lies at their mean position and is named after its first city.
+    Travel inside a merged city, its inner time, is the time between its cities plus their
+    own inner times; an edge between merged cities takes the shortest travel time between them
+    plus half of the inner time of both ends, so routes on coarse graphs keep realistic lengths.
+
+    :param inner: inner time of every city of the graph, zeros by default
+    :return: tuple (coarse Graph, array with the coarse city of every city, inner times of coarse cities)
+    """
+
+    inner = np.zeros(graph.n) if inner is None else inner
+    mate = match(graph, rounds)
+    own = np.arange(graph.n)
+    representative = np.where(mate >= 0, np.minimum(own, mate), own)
+    firsts, cluster = np.unique(representative, return_inverse=True)
+    m = len(firsts)
+
+    # time of the edge joining every pair, counted once from its smaller end
+    src = np.repeat(own, graph.degree)
+    is_pair = (mate[src] == graph.indices) & (src < graph.indices)
+    pair_time = np.zeros(graph.n)
+    pair_time[src[is_pair]] = graph.times[is_pair]
+    coarse_inner = np.bincount(cluster, weights=inner + pair_time, minlength=m)
+
+    counts = np.bincount(cluster, minlength=m)
+    value = np.bincount(cluster, weights=graph.value, minlength=m).astype(np.int64)
+    x = np.bincount(cluster, weights=graph.x, minlength=m) / counts
+    y = np.bincount(cluster, weights=graph.y, minlength=m) / counts
+
+    cu = cluster[src]
+    cv = cluster[graph.indices]
+    between = cu != cv
+    cu, cv = cu[between], cv[between]
+    t = graph.times[between] + np.round((coarse_inner[cu] + coarse_inner[cv]) / 2).astype(np.int64)
+    # the shortest of parallel edges, one sort of a single key when it fits into int64
+    pair = cu * m + cv
+    if (m * m + 1) * (int(t.max(initial=0)) + 1) < 2 ** 62:
+        order = np.argsort(pair * (int(t.max(initial=0)) + 1) + t)
+    else:
+        order = np.lexsort((t, pair))
+    cu, cv, t, pair = cu[order], cv[order], t[order], pair[order]
+    first = np.flatnonzero(np.r_[True, pair[1:] != pair[:-1]])
+
+    indptr = np.zeros(m + 1, dtype=np.int64)
+    indptr[1:] = np.cumsum(np.bincount(cu[first], minlength=m))
+    coarse = Graph([graph.names[i] for i in firsts.tolist()], x, y, value, indptr, cv[first], t[first])
+    return coarse, cluster, coarse_inner
+
+
+def join_targets(instance, working_time: int, targets: list) -> list:
+    """
+    Joins target city names with shortest paths, targets out of reach are skipped.
+    :return: path of City objects
+    """
+
+    path = [instance.cities_dict[targets[0]]]
+    for name in targets[1:]:
+        last = path[-1].name
+        if name == last:
+            continue
+        dist, prev = instance.distances(last, working_time)
+        if name in dist:
+            path += instance.shortest_path(last, name, prev)
+    return path
+
+
+def project(instance, fine: Graph, cluster: np.ndarray, route: list, working_time: int) -> list:
+    """
+    Maps a route of coarse cities onto the fine graph: every coarse city is replaced by its
+    valuable cities, or by its first one if none has value, and they are joined by shortest paths.
+    The best part fitting into working_time is refined with Instance.extend_path.
+    :return: path of City objects of the fine graph
+    """
+
+    order = np.argsort(cluster, kind='stable')
+    bounds = np.searchsorted(cluster[order], np.arange(cluster.max() + 2))
+
+    targets = []
+    for k in route:
+        members = order[bounds[k]:bounds[k + 1]]
+        valuable = members[fine.value[members] > 0]
+        targets += [fine.names[i] for i in (valuable if len(valuable) else members[:1]).tolist()]
+
+    path = join_targets(instance, working_time, targets)
+    trimmed = trim_path(path, working_time)
+    return instance.extend_path(trimmed.path, working_time).path
+
+
+def multilevel(instance, working_time: int, coarsest: int = 2000, grain: float = 0.1,
+               width: int = 100, rounds: int = 3) -> list:
+    """
+    Coarsens the graph until it has at most coarsest cities, its merged cities take on average
+    more than grain * working_time to travel inside, or it stops shrinking. Solves the coarsest
+    level by beam search and projects the route back level by level.
+    :return: path of City objects of the instance
+    """
+
+    graphs, clusters = [instance.csr], []
+    inner = None
+    while graphs[-1].n > coarsest:
+        coarse, cluster, inner = coarsen(graphs[-1], inner, rounds)
+        if coarse.n > 0.95 * graphs[-1].n or inner.mean() > grain * working_time:
+            break
+        graphs.append(coarse)
+        clusters.append(cluster)
+
+    _, _, route = beam_search(graphs[-1], working_time, width)
+    for level in range(len(clusters) - 1, -1, -1):
+        fine = graphs[level]
+        level_instance = instance if level == 0 else type(instance)(None, None, csr=fine)
+        path = project(level_instance, fine, clusters[level], route, working_time)
+        route = [fine.index[c.name] for c in path]
+
+    if not clusters:
+        return [instance.cities_dict[instance.csr.names[i]] for i in route]
+    return path
+
+
+def find_multilevel_path(instance, working_time: int, **options) -> Output:
+    """
+    Returns Output for the route found by the multilevel solver on an Instance.
+    :param options: passed to multilevel (coarsest, grain, width, rounds)
+    """
+    path = multilevel(instance, working_time, **options)
+    return Output(working_time - path_time(path), path_total(path), path)
@@ -0,0 +1,146 @@
+import inspect
+import multiprocessing
+import random
+from multiprocessing.connection import wait
+from time import time as now
+
+import numpy as np
+
+from .limits import COMPLETE, GAP, TIME, offer
+from .random_solver import Output, path_time, path_total
+
+# engines raced by default: best of random walks, beam search, local search and bounded exact search
+PORTFOLIO = ('random', 'beam', 'annealing', 'exact')
+
+
+def engine_options(instance, solver: str, deadline: float = None, seed: int = None, incumbent=None,
+                   **options) -> dict:
+    """
+    Options of one engine of a race: its own options out of options, deadline and seed
+    if it takes them and the shared incumbent if it prunes with it.
+    """
+
+    parameters = inspect.signature(instance.engine(solver)).parameters
+    takes_any = any(p.kind == p.VAR_KEYWORD for p in parameters.values())
+    chosen = {k: v for k, v in options.items() if k in parameters}
+    for name, value in (('deadline', deadline), ('seed', seed)):
+        if value is not None and (takes_any or name in parameters):
+            chosen[name] = value
+    if incumbent is not None and 'incumbent' in parameters:
+        chosen['incumbent'] = incumbent
+    return chosen
+
+
+def _run_engine(instance, solver: str, working_time: int, seed: int, options: dict, incumbent, conn) -> None:
+    """ Solves in a process of a race, sends (time_left, total, route names, status, error) through conn. """
+    # forked processes start with the same random state
+    random.seed(seed)
+    np.random.seed(seed % 2 ** 32)
+    try:
+        solution = instance.solve(working_time, solver, **options)
+        report = (solution.time_left, solution.total, [c.name for c in solution.path], solution.status, None)
+    except Exception as e:
+        report = (working_time, -1, [], None, f'{type(e).__name__}: {e}')
+    conn.send(report)
+    conn.close()
+    # offered only after the route was sent, so the best total always has its route in the parent
+    offer(incumbent, report[1])
+
+
+def race(instance, working_time: int, engines=PORTFOLIO, deadline: float = 10.0, grace: float = 0.5,
+         seed: int = None, gap: float = None, **options) -> tuple:
+    """
+    Runs engines at once, each in its own process. They share the best total found,
+    exact search and random walks prune with it. Engines are stopped at the deadline:
+    ones which take a deadline are given it, the others are terminated grace seconds later.
+    The race ends early when exact search completes, its route or a better finished one is optimal,
+    or when a finished route is within the target gap of the upper bound.
+
+    :param engines: names of engines, 'random' or ones of ENGINES, as a sequence or comma separated
+    :param deadline: wall-clock limit in seconds
+    :param grace: seconds given to engines to return after the deadline
+    :param seed: random seed, each engine gets seed plus its position
+    :param gap: target gap (a fraction), also passed to the engines which stop at it
+    :param options: passed to the engines which take them by name, e.g. width
+    :return: tuple (Output of the best route, list of reports {engine, total, runtime, status, error}
+             best first), status of the Output is the one of the winning engine
+    """
+
+    if isinstance(engines, str):
+        engines = [e.strip() for e in engines.split(',') if e.strip()]
+    seed = random.randrange(2 ** 31) if seed is None else seed
+    incumbent = multiprocessing.Value('q', -1)
+    target = instance.target(working_time, gap)
+    if gap is not None:
+        options['gap'] = gap
+
+    # unknown engines fail here, before any process is started
+    chosen = [engine_options(instance, solver, deadline, seed + k, incumbent, **options)
+              for k, solver in enumerate(engines)]
+
+    tic = now()
+    processes = {}  # {connection : (engine, process)}
+    for k, solver in enumerate(engines):
+        receiver, sender = multiprocessing.Pipe(duplex=False)
+        args = (instance, solver, working_time, seed + k, chosen[k], incumbent, sender)
+        process = multiprocessing.Process(target=_run_engine, args=args, daemon=True)
+        process.start()
+        sender.close()
+        processes[receiver] = (solver, process)
+
+    results = {}  # {engine : (time_left, total, route, status, error, runtime)}
+    pending = list(processes)
+    end = tic + deadline + grace
+    while pending and now() < end:
+        for conn in wait(pending, timeout=max(0.0, end - now())):
+            pending.remove(conn)
+            solver = processes[conn][0]
+            try:
+                results[solver] = conn.recv() + (now() - tic,)
+            except (EOFError, OSError):
+                # the process died without a result
+                results[solver] = (working_time, -1, [], None, 'no result', now() - tic)
+        if results.get('exact', (None,) * 4)[3] == COMPLETE or \
+                target is not None and results and max(r[1] for r in results.values()) >= target:
+            # nothing beats the exact route or the finished ones it was pruned by,
+            # or the best route is good enough
+            for conn in [c for c in pending if c.poll()]:
+                pending.remove(conn)
+                try:
+                    results[processes[conn][0]] = conn.recv() + (now() - tic,)
+                except (EOFError, OSError):
+                    pass
+            break
+
+    # engines still running at the deadline ran out of time, others lost to a complete exact search
+    # or to a route within the target gap
+    stopped = TIME if now() >= end else None
+    for conn, (solver, process) in processes.items():
+        if process.is_alive():
+            process.terminate()
+        process.join()
+        conn.close()
+        if solver not in results:
+            results[solver] = (working_time, -1, [], stopped, 'stopped', now() - tic)
+
+    reports = [{'engine': solver, 'total': int(r[1]), 'runtime': round(r[5], 4), 'status': r[3], 'error': r[4]}
+               for solver, r in results.items()]
+    reports.sort(key=lambda r: r['total'], reverse=True)
+
+    winner = max(results.values(), key=lambda r: r[1])
+    if winner[1] < 0:
+        return Output(working_time, 0, [], TIME), reports
+    path = [instance.cities_dict[name] for name in winner[2]]
+    status = GAP if target is not None and winner[1] >= target and winner[3] != COMPLETE else winner[3]
+    return Output(working_time - path_time(path), path_total(path), path, status), reports
+
+
+def find_portfolio_path(instance, working_time: int, **options) -> Output:
+    """
+    Returns Output for the best route of a race of engines on an Instance,
+    reports of the engines are kept in instance.races[working_time].
+    :param options: passed to race (engines, deadline, grace, seed and options of engines)
+    """
+    solution, reports = race(instance, working_time, **options)
+    instance.races[working_time] = reports
+    return solution
@@ -1,10 +1,20 @@
+import numpy as np
 import pandas as pd
 import random
 from collections import namedtuple
-from .city import City
+from .bounds import collect_times, start_bounds
+from .city import City, Cities
+from .graph import Graph
+from .limits import GAP
 
 
-Output = namedtuple('Output', ['time_left', 'total', 'path'])
+# status is set by searches run under limits, see limits.Guard, or stopped within a target gap, None otherwise;
+# edges are ids of the edges of the path, see Graph.edge_ids, set by Instance.solve
+Output = namedtuple('Output', ['time_left', 'total', 'path', 'status', 'edges'])
+Output.__new__.__defaults__ = (None, None)
+
+# lists aligned with graph.indices, see walk_tables, and collect times of cities, see bounds.collect_times
+WalkTables = namedtuple('WalkTables', ['prob', 'alias', 'item', 'item_value', 'reach'])
 
 
 def convert_to_dict(df_cities: pd.DataFrame, df_paths: pd.DataFrame) -> dict:
@@ -31,64 +41,301 @@ def convert_to_dict(df_cities: pd.DataFrame, df_paths: pd.DataFrame) -> dict:
     return dict_paths
 
 
-def find_random_path(cities_list: dict, starting_city: City, time_left: int) -> Output:
-    """ Generates a list containing: time, total and random path. """
+def random_walk(graph: Graph, start: int, time_left: int, corridors: dict = None) -> tuple:
+    """
+    Uniform random walk on city indices of the graph, see find_random_path.
+    :return: tuple (time_left, total, list of city indices)
+    """
+
+    names, indptr, indices, times, value = \
+        graph.names, graph.indptr_list, graph.indices_list, graph.times_list, graph.value_list
 
     path = []
+    visited = set()
     tmp_time = time_left
     total = 0
-    curr_city = cities_list[starting_city]
+    curr_city = start
+    corridors = corridors or {}
+    collected = set()
+    edge = None
 
     while tmp_time > 0:
         time_left = tmp_time
 
-        #TODO
-        # change this to:
-        # for city in cities:
-        #   c_copy = cities_list.copy()
-        if curr_city not in path:
+        if curr_city not in visited:
             # city value is added only once
-            total += curr_city.value
+            visited.add(curr_city)
+            total += value[curr_city]
+
+        if edge in corridors and frozenset(edge) not in collected:
+            # corridor value is added only once, whichever the direction
+            collected.add(frozenset(edge))
+            total += corridors[edge]
 
         # add city to a path
         path.append(curr_city)
 
-        # select random neighbour
-        next_city = random.choice(list(curr_city.neighbours.keys()))
+        # select random neighbour, a city without paths ends the walk
+        first = indptr[curr_city]
+        degree = indptr[curr_city + 1] - first
+        if not degree:
+            break
+        position = first + int(random.random() * degree)
+        next_city = indices[position]
 
         # subtract the travel time from available time
-        tmp_time -= curr_city.neighbours[next_city]
+        tmp_time -= times[position]
 
         # set city we travelled to as a current city
-        curr_city = cities_list[next_city]
+        if corridors:
+            edge = (names[curr_city], names[next_city])
+        curr_city = next_city
+
+    return time_left, total, path
+
+
+def find_random_path(cities_list: Cities, starting_city: str, time_left: int, corridors: dict = None) -> Output:
+    """
+    Generates a list containing: time, total and random path.
+    The walk runs on city indices of the graph, City views are made only for the path.
+    :param cities_list: Cities of a Graph
+    :param corridors: values of contracted corridors {(city_from, city_to) : value}, see reduction
+    """
+    graph = cities_list.graph
+    time_left, total, path = random_walk(graph, graph.index[starting_city], time_left, corridors)
+    return Output(time_left, total, [City(graph, i) for i in path])
+
+
+def walk_tables(graph: Graph, floor: float = None) -> WalkTables:
+    """
+    Alias tables of guided walks, one per city over its edges, so a weighted neighbour
+    is drawn in constant time. An edge is weighted by the value it leads to, of the city
+    and of the corridor, plus floor, per unit of travel time.
+    Position k of a row is kept with probability prob[k], otherwise alias[k] is taken.
+    :param floor: weight of edges leading to nothing of value, 0.1 of the mean city value by default
+    """
+
+    gain = graph.value[graph.indices].astype(float)
+    corridor = graph.edge_item >= 0
+    gain[corridor] += graph.item_value[graph.edge_item[corridor]]
+    if floor is None:
+        floor = max(0.1 * float(graph.value.mean()), 1e-3) if graph.n else 1.0
+    weight = (gain + floor) / np.maximum(graph.times, 1)
+
+    # weights scaled to mean 1 in every row
+    rows = np.repeat(np.arange(graph.n), graph.degree)
+    sums = np.bincount(rows, weights=weight, minlength=graph.n)
+    scaled = (weight * graph.degree[rows] / sums[rows]).tolist()
+
+    # Vose's method row by row, positions are indices into graph.indices
+    prob = [1.0] * len(scaled)
+    alias = list(range(len(scaled)))
+    indptr = graph.indptr_list
+    for i in range(graph.n):
+        first, stop = indptr[i], indptr[i + 1]
+        if stop - first < 2:
+            continue
+        small = [k for k in range(first, stop) if scaled[k] < 1]
+        large = [k for k in range(first, stop) if scaled[k] >= 1]
+        while small and large:
+            less, more = small.pop(), large[-1]
+            prob[less], alias[less] = scaled[less], more
+            scaled[more] -= 1 - scaled[less]
+            if scaled[more] < 1:
+                small.append(large.pop())
+
+    return WalkTables(prob, alias, graph.edge_item.tolist(), graph.item_value.tolist(), collect_times(graph).tolist())
+
+
+def guided_walk(graph: Graph, start: int, time_left: int, tables: WalkTables,
+                backtrack: float = 0.05, revisit: float = 0.2, tries: int = 4) -> tuple:
+    """
+    Random walk biased towards value per travel time, see walk_tables. Going straight back
+    and moving to visited cities are redrawn, up to tries times, unless kept with probability
+    backtrack or revisit. The walk ends when nothing more of value is within the time left.
+    Corridor values come from the graph items, so it works on reduced graphs as well.
+    :param tables: walk_tables of the graph
+    :return: tuple (time_left, total, list of city indices)
+    """
+
+    indptr, indices, times, value = graph.indptr_list, graph.indices_list, graph.times_list, graph.value_list
+    prob, alias, items, item_value, reach = tables
+    draw = random.random
+
+    path = []
+    visited = set()
+    collected = set()
+    tmp_time = time_left
+    total = 0
+    curr_city = start
+    prev_city = -1
+    item = -1
+
+    while tmp_time > 0:
+        time_left = tmp_time
+
+        if curr_city not in visited:
+            visited.add(curr_city)
+            total += value[curr_city]
+        if item >= 0 and item not in collected:
+            collected.add(item)
+            total += item_value[item]
+        path.append(curr_city)
+
+        first = indptr[curr_city]
+        degree = indptr[curr_city + 1] - first
+        if reach[curr_city] > time_left or not degree:
+            # nothing else of value can be reached
+            break
+
+        # one draw picks both the position and its alias
+        r = draw() * degree
+        k = int(r)
+        position = first + k if r - k < prob[first + k] else alias[first + k]
+        next_city = indices[position]
+        if degree > 1 and (next_city == prev_city or next_city in visited):
+            for _ in range(tries):
+                if next_city == prev_city:
+                    if draw() < backtrack:
+                        break
+                elif next_city not in visited or draw() < revisit:
+                    break
+                r = draw() * degree
+                k = int(r)
+                position = first + k if r - k < prob[first + k] else alias[first + k]
+                next_city = indices[position]
+
+        tmp_time -= times[position]
+        item = items[position]
+        prev_city, curr_city = curr_city, next_city
+
+    return time_left, total, path
+
+
+def find_guided_path(cities_list: Cities, starting_city: str, time_left: int, tables: WalkTables,
+                     **options) -> Output:
+    """
+    Returns Output of a guided walk, see guided_walk.
+    :param cities_list: Cities of a Graph
+    :param tables: walk_tables of the graph
+    :param options: passed to guided_walk (backtrack, revisit, tries)
+    """
+    graph = cities_list.graph
+    time_left, total, path = guided_walk(graph, graph.index[starting_city], time_left, tables, **options)
+    return Output(time_left, total, [City(graph, i) for i in path])
 
-    return Output(time_left, total, path)
 
+def find_best_random_paths_per_start(cities_dict: dict, working_time: int, n=50, corridors: dict = None,
+                                     bounds: dict = None, incumbent=None, guided: bool = False,
+                                     target: int = None) -> dict:
+    """
+    Returns dictionary {starting_city : Output} with the best random walk found for each start.
+    :param cities_dict: dictionary {name : City}
+    :param working_time:
+    :param n: number of trials for each vertex in random walk
+    :param corridors: values of contracted corridors, see find_random_path
+    :param bounds: upper bounds of value {starting_city : bound}, see bounds.start_bounds;
+                   starts are tried from the best bound and skipped when they cannot beat the best walk
+    :param incumbent: total shared with searches in other processes, see limits.offer;
+                      with bounds, starts which cannot beat it are skipped too
+    :param guided: guided walks instead of uniform ones, see find_guided_path
+    :param target: total which is good enough, other starts are not walked once a walk collects it
+                   and its Output has status limits.GAP
+    """
 
-def find_best_of_random_paths(cities_dict: dict, working_time: int, n=50) -> Output:
+    graph = cities_dict.graph
+    tables = walk_tables(graph) if guided else None
+
+    starts = list(cities_dict.keys())
+    if bounds is not None:
+        starts.sort(key=lambda c: bounds[c], reverse=True)
+
+    best_paths = {}
+    best_total = -1
+    for starting_city in starts:
+        if incumbent is not None and best_paths:
+            # at least one start is walked, so there is a path to return
+            best_total = max(best_total, incumbent.value)
+        if bounds is not None and bounds[starting_city] <= best_total:
+            # bounds are sorted, no other start can do better
+            break
+
+        # walks are kept as city indices, City views are made only for the best one
+        start = graph.index[starting_city]
+        if guided:
+            walks = [guided_walk(graph, start, working_time, tables) for _ in range(n)]
+        else:
+            walks = [random_walk(graph, start, working_time, corridors) for _ in range(n)]
+
+        # the first of the walks with the highest total
+        time_left, total, path = max(walks, key=lambda x: x[1])
+        best_paths[starting_city] = Output(time_left, total, [City(graph, i) for i in path])
+        best_total = max(best_total, total)
+        if target is not None and total >= target:
+            best_paths[starting_city] = best_paths[starting_city]._replace(status=GAP)
+            break
+
+    return best_paths
+
+
+def find_best_of_random_paths(cities_dict: dict, working_time: int, n=50, bounds: dict = None) -> Output:
     """
     Returns list [time_left, sum, path] for the best of paths found in random walk.
-    :param d: dictionary {name : {neighbour1 : travel_time1, neighbour2 : travel_time2}}
+    :param cities_dict: dictionary {name : City}
     :param working_time:
     :param n: number of trials for each vertex in random walk
+    :param bounds: upper bounds of value for each start, see find_best_random_paths_per_start
     """
 
-    best_paths = []
-    for starting_city in cities_dict.keys():
-        lst = []
+    best_paths = list(find_best_random_paths_per_start(cities_dict, working_time, n, bounds=bounds).values())
+    best_paths.sort(key=lambda x: x[1], reverse=True)
+
+    return best_paths[0]
 
-        # for better performance define
-        add = lst.append
-        for i in range(n):
-            add(find_random_path(cities_dict, starting_city, working_time))
 
-        # sort list [time_left, total, path] by total, descending
-        lst.sort(key=lambda x: x[1], reverse=True)
-        best_paths.append(lst[0])
+def path_time(path: list) -> int:
+    """ Returns travel time of a path given as a list of City objects. """
+    return sum(cf.neighbours[ct.name] for cf, ct in zip(path[:-1], path[1:]))
 
-    best_paths.sort(key=lambda x: x[1], reverse=True)
 
-    return best_paths[0]
+def path_total(path: list) -> int:
+    """ Returns value collected on a path, each city is counted only once. """
+    return sum(c.value for c in {c.name: c for c in path}.values())
+
+
+def trim_path(path: list, working_time: int) -> Output:
+    """
+    Shrinks a path to its best contiguous part that fits into working_time.
+    Two pointers over the path, city values are counted once per window.
+    """
+
+    best = (-1, 0, 1)
+    counts = {}
+    total = 0
+    cost = 0
+    left = 0
+    for right, city in enumerate(path):
+        if right > 0:
+            cost += path[right - 1].neighbours[city.name]
+        counts[city.name] = counts.get(city.name, 0) + 1
+        if counts[city.name] == 1:
+            total += city.value
+
+        # move the left end until the window fits into the budget
+        while cost > working_time:
+            gone = path[left]
+            cost -= gone.neighbours[path[left + 1].name]
+            counts[gone.name] -= 1
+            if counts[gone.name] == 0:
+                total -= gone.value
+            left += 1
+
+        if total > best[0]:
+            best = (total, left, right + 1)
+
+    total, start, stop = best
+    trimmed = path[start:stop]
+    return Output(working_time - path_time(trimmed), total, trimmed)
 
 
 def convert_to_edges_list(paths: list):
@@ -103,18 +350,9 @@ def solve(cities: pd.DataFrame, edges: pd.DataFrame, info: pd.DataFrame):
     assert isinstance(edges, pd.DataFrame), 'Wrong data format!'
     assert isinstance(info, pd.DataFrame), 'Wrong data format!'
 
-    # build a dictionary {city : {neighbour1 : travel_time1, neighbour2 : travel_time2}}
-    d = convert_to_dict(cities, edges)
-
-    # build a dict {city_name : City object}
-    cities_dict = {}
-
-    for k in d.keys():
-        # get: name, x, y, quantity
-        vec = cities[cities['name'] == k].values[0]
-        c = City(k, vec[1], vec[2], vec[3])
-        c.set_neighbours(d)
-        cities_dict[k] = c
+    # build the graph and a dict {city_name : City object} of views over it
+    graph = Graph.from_frames(cities, edges)
+    cities_dict = Cities(graph)
 
     # get working time from the data frame
     working_time = info['time'].values[0]
@@ -122,7 +360,10 @@ def solve(cities: pd.DataFrame, edges: pd.DataFrame, info: pd.DataFrame):
     #TODO
     # data validation
 
+    # skip start cities that cannot beat the best path
+    bounds = dict(zip(graph.names, start_bounds(graph, working_time)))
+
     # compute the best path
-    solution = find_best_of_random_paths(cities_dict, working_time, 50)
+    solution = find_best_of_random_paths(cities_dict, working_time, 50, bounds)
 
     return solution, convert_to_edges_list(solution.path)
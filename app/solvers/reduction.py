@@ -0,0 +1,156 @@
+from collections import deque
+from heapq import heappush, heappop
+
+
+class Reduction:
+    """
+    Reduced graph {city: {neighbour : time}} with the data needed to map its paths back.
+    Contracted corridors are kept as {(city_from, city_to) : [cities inside]} for both
+    directions and their collected value as {(city_from, city_to) : value}.
+    """
+
+    def __init__(self, graph: dict, corridors: dict, corridor_value: dict, removed: set) -> None:
+        self.graph = graph
+        self.corridors = corridors
+        self.corridor_value = corridor_value
+        self.removed = removed
+
+    def expand(self, names: list) -> list:
+        """ Maps a path of the reduced graph back to the original city sequence. """
+        if not names:
+            return []
+        path = [names[0]]
+        for a, b in zip(names[:-1], names[1:]):
+            path += self.corridors.get((a, b), [])
+            path.append(b)
+        return path
+
+
+def _remove(graph: dict, city: str) -> None:
+    for neighbour in graph.pop(city):
+        graph[neighbour].pop(city, None)
+
+
+def prune_dead_ends(graph: dict, values: dict) -> set:
+    """ Removes, in place, branches ending with worthless cities. Returns removed cities. """
+    removed = set()
+    leaves = deque(c for c, n in graph.items() if len(n) <= 1 and values[c] == 0)
+    while leaves:
+        city = leaves.popleft()
+        if city not in graph or len(graph[city]) > 1 or values[city] != 0:
+            continue
+        neighbours = list(graph[city])
+        _remove(graph, city)
+        removed.add(city)
+        leaves.extend(n for n in neighbours if len(graph[n]) <= 1 and values[n] == 0)
+    return removed
+
+
+def drop_unreachable(graph: dict, values: dict, working_time: int = None,
+                     reach: float = 0.5, quantile: float = 0.9) -> set:
+    """
+    Removes, in place, components without any value and, if working_time is given,
+    cities further than reach * working_time from every high value city
+    (value at or above the given quantile). Returns removed cities.
+    """
+
+    removed = set()
+    seen = set()
+    for city in list(graph):
+        if city in seen:
+            continue
+        component = {city}
+        queue = [city]
+        while queue:
+            for neighbour in graph[queue.pop()]:
+                if neighbour not in component:
+                    component.add(neighbour)
+                    queue.append(neighbour)
+        seen |= component
+        if not any(values[c] for c in component):
+            removed |= component
+
+    if working_time is not None and graph:
+        ordered = sorted(values[c] for c in graph)
+        threshold = ordered[min(len(ordered) - 1, int(quantile * len(ordered)))]
+        limit = reach * working_time
+
+        # multi source Dijkstra from high value cities
+        dist = {}
+        heap = [(0, c) for c in graph if values[c] >= threshold and values[c] > 0]
+        for d, c in heap:
+            dist[c] = d
+        while heap:
+            d, city = heappop(heap)
+            if d > dist[city]:
+                continue
+            for neighbour, t in graph[city].items():
+                nd = d + t
+                if nd <= limit and nd < dist.get(neighbour, float('inf')):
+                    dist[neighbour] = nd
+                    heappush(heap, (nd, neighbour))
+        removed |= set(graph) - set(dist)
+
+    for city in removed:
+        _remove(graph, city)
+    return removed
+
+
+def contract_corridors(graph: dict, values: dict) -> tuple:
+    """
+    Contracts, in place, chains of degree 2 cities into single edges between their ends.
+    Returns dictionaries (corridors, corridor_value) as described in Reduction.
+    """
+
+    corridors = {}
+    corridor_value = {}
+    for u in list(graph):
+        if u not in graph or len(graph[u]) == 2:
+            continue
+        for first in list(graph[u]):
+            if first not in graph or len(graph[first]) != 2:
+                continue
+
+            # walk along the chain until a city with degree other than 2
+            inside = [first]
+            time = graph[u][first]
+            prev, city = u, first
+            while True:
+                nxt = next(n for n in graph[city] if n != prev)
+                time += graph[city][nxt]
+                if len(graph[nxt]) != 2 or nxt == u:
+                    break
+                inside.append(nxt)
+                prev, city = city, nxt
+            v = nxt
+
+            # loops and parallel edges are left as they are
+            if v == u or v in graph[u]:
+                continue
+
+            for city in inside:
+                _remove(graph, city)
+            graph[u][v] = time
+            graph[v][u] = time
+            corridors[(u, v)] = inside
+            corridors[(v, u)] = inside[::-1]
+            corridor_value[(u, v)] = corridor_value[(v, u)] = sum(values[c] for c in inside)
+
+    return corridors, corridor_value
+
+
+def reduce_graph(graph: dict, values: dict, working_time: int = None, **options) -> Reduction:
+    """
+    Shrinks a graph {city: {neighbour : time}} before search: prunes worthless dead ends,
+    drops unreachable cities and contracts corridors. The input graph is not modified.
+    :param values: dictionary {city : quantity}
+    :param options: passed to drop_unreachable (reach, quantile)
+    """
+
+    graph = {city: dict(neighbours) for city, neighbours in graph.items()}
+    removed = prune_dead_ends(graph, values)
+    removed |= drop_unreachable(graph, values, working_time, **options)
+    removed |= prune_dead_ends(graph, values)
+    corridors, corridor_value = contract_corridors(graph, values)
+    removed |= {c for inside in corridors.values() for c in inside}
+    return Reduction(graph, corridors, corridor_value, removed)
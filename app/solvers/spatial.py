@@ -0,0 +1,64 @@
+import numpy as np
+
+
+class GridIndex:
+    """
+    Uniform grid over points for nearest point queries, e.g. hit testing of clicks on the map.
+    Points are sorted by cell, so every cell is a slice of order.
+    """
+
+    def __init__(self, x: np.ndarray, y: np.ndarray, per_cell: int = 4) -> None:
+        """
+        :param x: coordinates of points
+        :param y:
+        :param per_cell: mean number of points in a cell
+        """
+        self.x = np.asarray(x, dtype=float)
+        self.y = np.asarray(y, dtype=float)
+        self.x0 = self.x.min()
+        self.y0 = self.y.min()
+        self.cells = max(1, int(np.sqrt(len(self.x) / per_cell)))
+        span = max(self.x.max() - self.x0, self.y.max() - self.y0)
+        self.size = span / self.cells if span > 0 else 1.0
+
+        cell = self.cell_of(self.x, self.y)
+        self.order = np.argsort(cell, kind='stable')
+        self.first = np.searchsorted(cell[self.order], np.arange(self.cells ** 2 + 1))
+
+    def cell_of(self, x, y):
+        """ Cell numbers of coordinates, ones outside of the grid go to the closest cell. """
+        i = np.clip(((x - self.x0) // self.size).astype(int), 0, self.cells - 1)
+        j = np.clip(((y - self.y0) // self.size).astype(int), 0, self.cells - 1)
+        return j * self.cells + i
+
+    def _ring(self, i: int, j: int, r: int) -> np.ndarray:
+        """ Points of the cells r cells away from cell (i, j), the square ring around it. """
+        if r == 0:
+            cells = [(i, j)]
+        else:
+            cells = [(a, b) for a in range(i - r, i + r + 1) for b in (j - r, j + r)]
+            cells += [(a, b) for a in (i - r, i + r) for b in range(j - r + 1, j + r)]
+        parts = [self.order[self.first[b * self.cells + a]:self.first[b * self.cells + a + 1]]
+                 for a, b in cells if 0 <= a < self.cells and 0 <= b < self.cells]
+        return np.concatenate(parts) if parts else np.zeros(0, dtype=np.int64)
+
+    def nearest(self, x: float, y: float) -> int:
+        """
+        Returns the position of the point closest to (x, y). Rings of cells around the cell
+        of the query are searched outwards; points beyond ring r are at least r cells away,
+        so the search stops once the best point is closer than that.
+        """
+
+        cell = int(self.cell_of(np.array([x]), np.array([y]))[0])
+        i, j = cell % self.cells, cell // self.cells
+        best, best_dist = -1, np.inf
+        for r in range(self.cells):
+            points = self._ring(i, j, r)
+            if len(points):
+                dist = np.hypot(self.x[points] - x, self.y[points] - y)
+                k = int(np.argmin(dist))
+                if dist[k] < best_dist:
+                    best, best_dist = int(points[k]), dist[k]
+            if best >= 0 and best_dist <= r * self.size:
+                break
+        return best
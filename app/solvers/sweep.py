@@ -0,0 +1,78 @@
+import numpy as np
+
+from .random_solver import Output, find_random_path
+
+
+def walk_profile(path: list) -> tuple:
+    """
+    Returns arrays (times, totals): travel time spent and value collected
+    on arrival at each city of the path.
+    """
+
+    times = np.zeros(len(path), dtype=np.int64)
+    totals = np.zeros(len(path), dtype=np.int64)
+    seen = set()
+    time = total = 0
+    for i, city in enumerate(path):
+        if i > 0:
+            time += path[i - 1].neighbours[city.name]
+        if city.name not in seen:
+            seen.add(city.name)
+            total += city.value
+        times[i] = time
+        totals[i] = total
+
+    return times, totals
+
+
+def sweep(instance, budgets: list, n: int = 50) -> list:
+    """
+    Solves the instance for every budget in one pass. A random walk does not depend
+    on the budget, so a walk for the largest budget contains the walks for all the
+    smaller ones as prefixes; each walk is scored for all budgets at once.
+    Raises ValueError for negative budgets.
+
+    :param instance: Instance to solve
+    :param budgets: list of working times
+    :param n: number of trials for each start city
+    :return: list of Output, one for each budget in ascending order
+    """
+
+    budgets = np.array(sorted(set(int(b) for b in budgets)), dtype=np.int64)
+    if budgets[0] < 0:
+        raise ValueError(f'negative budget {budgets[0]}')
+    top = int(budgets[-1])
+    best = [None] * len(budgets)
+
+    for starting_city in instance.cities_dict.keys():
+        start_totals = np.full(len(budgets), -1, dtype=np.int64)
+        start_best = [None] * len(budgets)
+
+        for _ in range(n):
+            path = find_random_path(instance.cities_dict, starting_city, top).path
+            times, totals = walk_profile(path)
+
+            # last city reached with time left, as random_walk ends when none is left; -1 for no city
+            idx = np.searchsorted(times, budgets, side='left') - 1
+            values = np.where(idx >= 0, totals[idx], 0)
+            for j in np.flatnonzero(values > start_totals):
+                k = idx[j]
+                start_totals[j] = values[j]
+                start_best[j] = Output(int(budgets[j] - (times[k] if k >= 0 else 0)), int(values[j]), path[:k + 1])
+
+        for j, output in enumerate(start_best):
+            if best[j] is None or output.total > best[j].total:
+                best[j] = output
+            instance.starts.setdefault((False, n, None), {}).setdefault(int(budgets[j]), {})[starting_city] = output
+
+    # a larger budget can always afford the route of a smaller one
+    for j in range(1, len(best)):
+        if best[j].total < best[j - 1].total:
+            prev = best[j - 1]
+            best[j] = Output(prev.time_left + int(budgets[j] - budgets[j - 1]), prev.total, prev.path)
+
+    best = [instance.with_edges(output) for output in best]
+    for budget, output in zip(budgets, best):
+        instance.solutions[('random', int(budget))] = output
+
+    return best
@@ -1 +1,48 @@
 import pandas as pd
+from typing import List
+
+
+def cities_problems(df: pd.DataFrame) -> List[str]:
+    """ Returns problems found in an uploaded cities file, empty list if there are none. """
+    problems = []
+    missing = int(df.isna().any(axis=1).sum())
+    if missing:
+        problems.append(f'{missing} rows with missing values')
+    duplicated = int(df['name'].duplicated().sum())
+    if duplicated:
+        problems.append(f'{duplicated} repeated city names')
+    duplicated = int(df.duplicated(['x', 'y']).sum())
+    if duplicated:
+        problems.append(f'{duplicated} cities at the same coordinates as another one')
+    negative = int((pd.to_numeric(df['quantity'], errors='coerce') < 0).sum())
+    if negative:
+        problems.append(f'{negative} cities with negative quantity')
+    return problems
+
+
+def paths_problems(df: pd.DataFrame) -> List[str]:
+    """ Returns problems found in an uploaded paths file, empty list if there are none. """
+    problems = []
+    missing = int(df.isna().any(axis=1).sum())
+    if missing:
+        problems.append(f'{missing} rows with missing values')
+    loops = int((df['city_from'] == df['city_to']).sum())
+    if loops:
+        problems.append(f'{loops} paths from a city to itself')
+    # a-b and b-a are the same path
+    a = df[['city_from', 'city_to']].astype(str)
+    pairs = a.min(axis=1) + '\0' + a.max(axis=1)
+    duplicated = int(pairs.duplicated().sum())
+    if duplicated:
+        problems.append(f'{duplicated} repeated paths')
+    time = pd.to_numeric(df['time'], errors='coerce')
+    conflicting = int((time.groupby(pairs).nunique() > 1).sum())
+    if conflicting:
+        problems.append(f'{conflicting} repeated paths with different times, the last time is used')
+    wrong = int((time.isna() & df['time'].notna()).sum())
+    if wrong:
+        problems.append(f'{wrong} times are not numbers')
+    negative = int((time < 0).sum())
+    if negative:
+        problems.append(f'{negative} paths with negative time')
+    return problems
@@ -51,13 +51,14 @@ def add_points(add_city: callable,
 
 
 def find_edges(cities: pd.DataFrame):
-    cities = cities.copy()
+    # paths work both ways, so each pair of neighbours is written once: to the right and up neighbour
+    at = {(x, y): name for x, y, name in zip(cities.x, cities.y, cities.name)}
     edges = []
-    for x, y, name, _ in cities.values:
-        q = f"(x=={x + 1} & y=={y}) | (x=={x - 1} & y=={y}) | (x=={x} & y=={y + 1}) | (x=={x} & y=={y - 1})"
-        neighbours = cities.query(q)
-        for n_name in neighbours.name:
-            edges.append((name, n_name, randint(1, 24)))
+    for x, y, name in zip(cities.x, cities.y, cities.name):
+        for dx, dy in ((1, 0), (0, 1)):
+            neighbour = at.get((x + dx, y + dy))
+            if neighbour is not None:
+                edges.append((name, neighbour, randint(1, 24)))
 
     return edges
 
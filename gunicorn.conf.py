@@ -0,0 +1,25 @@
+import multiprocessing
+import os
+
+# gunicorn -c gunicorn.conf.py wsgi:server, settings can be overridden by environment variables
+
+bind = os.environ.get('TSP_BIND', '0.0.0.0:8050')
+
+# solves are CPU bound and hold the GIL, so throughput comes from processes,
+# threads only keep uploads and downloads from blocking a worker
+workers = int(os.environ.get('TSP_WORKERS', multiprocessing.cpu_count()))
+threads = int(os.environ.get('TSP_THREADS', 2))
+worker_class = 'gthread'
+
+# large maps and long solves
+timeout = int(os.environ.get('TSP_TIMEOUT', 300))
+limit_request_line = 0
+
+# the app is built once and forked, workers share the memory of everything loaded before the fork;
+# maps of the catalog (uploads of the UI, the api only reads it) are shared between workers through
+# memory-mapped graphs, derived arrays included
+preload_app = True
+
+# workers are replaced now and then, so caches of maps do not grow forever
+max_requests = int(os.environ.get('TSP_MAX_REQUESTS', 1000))
+max_requests_jitter = max_requests // 10
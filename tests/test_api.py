@@ -0,0 +1,92 @@
+import gzip
+import io
+import json
+import tempfile
+
+import pandas as pd
+
+import app.catalog as catalog
+from app.app_factory import create_app
+from app.api import stream_solution
+
+SAMPLE = 'sample files/example1'
+
+
+def read(name: str) -> str:
+    with open(f'{SAMPLE}/{name}.csv') as file:
+        return file.read()
+
+
+class TestApi:
+    catalog_dir = tempfile.mkdtemp()
+    client = create_app(catalog_dir=catalog_dir).server.test_client()
+
+    def test_csv(self):
+        data = {name: (io.BytesIO(read(name).encode()), f'{name}.csv') for name in ('cities', 'paths', 'time')}
+        data.update(solver='beam', options='{"width": 10}')
+        response = self.client.post('/api/solve', data=data, content_type='multipart/form-data')
+        assert response.status_code == 200
+        result = response.get_json()
+        assert result['solver'] == 'beam'
+        assert result['working_time'] == 48
+        assert 0 < result['total'] <= result['bound']
+        assert result['gap'] == round(1 - result['total'] / result['bound'], 4)
+        assert len(result['edges']) == len(result['route']) - 1
+        # uploads of the api are not kept in the catalog
+        assert catalog.list_entries(self.catalog_dir) == []
+
+    def test_json_gzip(self):
+        body = {'cities': pd.read_csv(f'{SAMPLE}/cities.csv').to_dict('records'),
+                'paths': read('paths'),
+                'time': 48,
+                'solver': 'random',
+                'options': {'n': 5}}
+        response = self.client.post('/api/solve', json=body, headers={'Accept-Encoding': 'gzip'})
+        assert response.status_code == 200
+        assert response.headers['Content-Encoding'] == 'gzip'
+        result = json.loads(gzip.decompress(response.get_data()))
+        assert result['time_used'] <= 48
+        assert result['route'][0] in 'ABCDEFGHIJKL'
+
+    def test_errors(self):
+        body = {'cities': read('cities'), 'paths': read('paths'), 'time': 48}
+        response = self.client.post('/api/solve', json=dict(body, solver='nope'))
+        assert response.status_code == 400
+        assert 'Unknown solver' in response.get_json()['error']
+
+        response = self.client.post('/api/solve', json=dict(body, time='soon'))
+        assert response.status_code == 400
+
+        response = self.client.post('/api/solve', json=dict(body, paths='a,b\n1,2'))
+        assert response.get_json()['error'] == 'Wrong columns names!'
+
+        response = self.client.post('/api/solve', json=dict(body, solver='beam', options={'depth': 3}))
+        assert response.status_code == 400
+
+        # options are checked against the solver, also ones it sets itself and values of the wrong type
+        for solver, options in [('random', {'incumbent': 3}), ('exact', {'trace_memory': True}),
+                                ('beam', {'width': 'wide'}), ('random', {'guided': 1}), ('aco', {'ants': 2.5})]:
+            response = self.client.post('/api/solve', json=dict(body, solver=solver, options=options))
+            assert response.status_code == 400
+
+        # a target gap is a fraction below 1
+        for gap in [-0.1, 1, 5]:
+            response = self.client.post('/api/solve', json=dict(body, solver='exact', options={'gap': gap}))
+            assert response.status_code == 400
+
+    def test_portfolio_reduced(self):
+        body = {'cities': read('cities'), 'paths': read('paths'), 'time': 48, 'solver': 'portfolio', 'reduce': True,
+                'options': {'engines': 'random,beam', 'deadline': 2, 'seed': 1}}
+        response = self.client.post('/api/solve', json=body)
+        assert response.status_code == 200
+        # reports of the race on the reduced graph
+        race = response.get_json()['race']
+        assert sorted(report['engine'] for report in race) == ['beam', 'random']
+
+    def test_stream(self):
+        route = [f'c{i}' for i in range(2500)]
+        result = json.loads(''.join(stream_solution({'total': 1}, route)))
+        assert result['route'] == route
+        assert result['edges'][-1] == ['c2498', 'c2499']
+        assert len(result['edges']) == 2499
+        assert json.loads(''.join(stream_solution({'total': 0}, []))) == {'total': 0, 'route': [], 'edges': []}
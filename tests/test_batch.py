@@ -0,0 +1,78 @@
+import io
+import json
+
+import pytest
+
+import app.batch as batch
+from app.batch import (find_instances, instance_peak, main, solve_directory, run_batch, write_json, write_csv,
+                       parse_option)
+
+SAMPLE = 'sample files/example1'
+
+
+class TestBatch:
+    def test_find_instances(self):
+        directories = find_instances(['sample files'])
+        assert SAMPLE in directories
+        assert 'sample files/__pycache__' not in directories
+        assert find_instances([SAMPLE]) == [SAMPLE]
+
+    def test_solve_directory(self):
+        record = solve_directory(SAMPLE, 'beam', seed=1)
+        assert record['error'] is None
+        assert record['working_time'] == 48
+        assert 0 <= record['time_used'] <= 48
+        assert record['total'] > 0
+        assert record['route'][0] in 'ABCDEFGHIJKL'
+
+    def test_seed(self):
+        a = solve_directory(SAMPLE, 'random', seed=7, n=5)
+        b = solve_directory(SAMPLE, 'random', seed=7, n=5)
+        assert a['route'] == b['route']
+
+    def test_deadline(self):
+        record = solve_directory(SAMPLE, 'exact', deadline=5)
+        assert record['error'] is None
+        assert record['status'] == 'complete'
+        # solvers which cannot keep a deadline refuse it instead of running without one
+        assert 'does not take a deadline' in solve_directory(SAMPLE, 'beam', deadline=5)['error']
+        with pytest.raises(ValueError):
+            list(run_batch([SAMPLE], 'multilevel', deadline=5, workers=1))
+        with pytest.raises(SystemExit):
+            main([SAMPLE, '-s', 'random', '--deadline', '5'])
+
+    def test_error(self):
+        record = solve_directory('no such directory')
+        assert record['total'] is None
+        assert 'FileNotFoundError' in record['error']
+
+    def test_instance_peak(self, monkeypatch):
+        monkeypatch.setattr(batch, '_solved', 0)
+        # the first instance of a process owns its peak
+        assert instance_peak(100, 100) == 100
+        # later ones only when they raise it
+        assert instance_peak(100, 100) is None
+        assert instance_peak(100, 150) == 150
+        assert instance_peak(None, None) is None
+
+    def test_pool(self):
+        records = list(run_batch([SAMPLE, SAMPLE], 'beam', workers=2, width=10))
+        assert len(records) == 2
+        assert records[0]['total'] == records[1]['total']
+
+    def test_writers(self):
+        records = list(run_batch([SAMPLE], 'beam', workers=1))
+        out = io.StringIO()
+        assert write_json(records, out) == 1
+        assert json.loads(out.getvalue())['route'] == records[0]['route']
+
+        out = io.StringIO()
+        assert write_csv(records, out) == 1
+        header, row = out.getvalue().splitlines()
+        assert header.startswith('instance,solver,total')
+        assert ' '.join(records[0]['route']) in row
+
+    def test_parse_option(self):
+        assert parse_option('width=50') == ('width', 50)
+        assert parse_option('rho=0.5') == ('rho', 0.5)
+        assert parse_option('cooling=linear') == ('cooling', 'linear')
@@ -0,0 +1,105 @@
+import os
+import time
+
+import numpy as np
+import pytest
+
+import app.catalog as catalog
+from app.batch import find_instances, solve_directory
+from app.helpers import decode_contents, encode_contents, parse_csv
+from app.solvers import Instance
+
+SAMPLE = 'sample files/example1'
+
+
+def read_sample():
+    return [open(os.path.join(SAMPLE, name)).read() for name in ('cities.csv', 'paths.csv', 'time.csv')]
+
+
+class TestCatalog:
+    def test_store_and_load(self, tmp_path):
+        cities_csv, paths_csv, time_csv = read_sample()
+        instance = Instance(parse_csv(cities_csv), parse_csv(paths_csv))
+        expected = instance.solve(30, 'beam')
+        key = catalog.store(instance, cities_csv, paths_csv, time_csv, directory=str(tmp_path))
+
+        [entry] = catalog.list_entries(str(tmp_path))
+        assert entry['key'] == key
+        assert (entry['cities'], entry['working_time']) == (12, 48)
+
+        loaded = catalog.load(key, str(tmp_path))
+        assert (loaded.cities_csv, loaded.paths_csv, loaded.time_csv) == (cities_csv, paths_csv, time_csv)
+        graph = loaded.instance.csr
+        assert graph.names == instance.csr.names
+        # derived arrays are mapped as well, lists are made once a search reads them
+        assert isinstance(graph.nbr, np.memmap) and isinstance(graph.edge_keys, np.memmap)
+        assert 'indices_list' not in vars(graph)
+        assert (graph.edge_ends == instance.csr.edge_ends).all()
+        assert loaded.instance.dump_caches()['distances'].keys() == instance.dump_caches()['distances'].keys()
+        solution = loaded.instance.solve(30, 'beam')
+        assert solution.total == expected.total
+        assert [c.name for c in solution.path] == [c.name for c in expected.path]
+
+        # an entry is an instance directory as well
+        directory = os.path.join(str(tmp_path), key)
+        assert find_instances([str(tmp_path)]) == [directory]
+        assert solve_directory(directory, 'beam')['error'] is None
+
+    def test_unknown_key(self, tmp_path):
+        with pytest.raises(KeyError):
+            catalog.load('0' * 40, str(tmp_path))
+
+        # an entry missing files is not found either, storing it again fills them in
+        cities_csv, paths_csv, time_csv = read_sample()
+        instance = Instance(parse_csv(cities_csv), parse_csv(paths_csv))
+        key = catalog.store(instance, cities_csv, paths_csv, time_csv, directory=str(tmp_path))
+        os.remove(os.path.join(str(tmp_path), key, catalog.FRAMES_FILE))
+        with pytest.raises(KeyError):
+            catalog.load(key, str(tmp_path))
+        catalog.store(instance, cities_csv, paths_csv, time_csv, directory=str(tmp_path))
+        assert catalog.load(key, str(tmp_path)).instance.csr.n == 12
+
+    def test_caches_changed(self, tmp_path, monkeypatch):
+        written = []
+        write = catalog._write
+        monkeypatch.setattr(catalog, '_write', lambda path, data: written.append(os.path.basename(path)) or
+                            write(path, data))
+        cities_csv, paths_csv, time_csv = read_sample()
+        instance = Instance(parse_csv(cities_csv), parse_csv(paths_csv))
+        key = catalog.store(instance, cities_csv, paths_csv, time_csv, directory=str(tmp_path))
+        assert catalog.CACHES_FILE in written
+
+        # caches are pickled again only after a search added to them
+        written.clear()
+        catalog.store(instance, cities_csv, paths_csv, time_csv, directory=str(tmp_path))
+        assert written == [catalog.TIME_FILE]
+        instance.bounds(30)
+        catalog.store(instance, cities_csv, paths_csv, time_csv, directory=str(tmp_path))
+        assert written == [catalog.TIME_FILE, catalog.TIME_FILE, catalog.CACHES_FILE]
+
+        # nor for a reopened instance
+        loaded = catalog.load(key, str(tmp_path)).instance
+        written.clear()
+        catalog.store(loaded, cities_csv, paths_csv, time_csv, directory=str(tmp_path))
+        assert written == [catalog.TIME_FILE]
+
+    def test_eviction(self, tmp_path):
+        cities_csv, paths_csv, time_csv = read_sample()
+        keys = []
+        for i in range(3):
+            # a different paths.csv is a different instance
+            paths = paths_csv + '\n' * i
+            instance = Instance(parse_csv(cities_csv), parse_csv(paths))
+            keys.append(catalog.store(instance, cities_csv, paths, time_csv, directory=str(tmp_path)))
+            time.sleep(0.01)
+        size = catalog.list_entries(str(tmp_path))[0]['bytes']
+
+        catalog.load(keys[0], str(tmp_path))  # the first one is used again
+        removed = catalog.evict(str(tmp_path), max_bytes=2 * size)
+        assert removed == [keys[1]]
+        assert not os.path.exists(os.path.join(str(tmp_path), keys[1]))
+        assert {e['key'] for e in catalog.list_entries(str(tmp_path))} == {keys[0], keys[2]}
+
+    def test_contents(self):
+        txt = 'name,x,y,quantity\nA,0,0,1\n'
+        assert decode_contents(encode_contents(txt)) == txt
@@ -0,0 +1,23 @@
+import json
+import tempfile
+
+from app.app_factory import create_app
+from app.batch import find_instances
+from app.loadtest import make_bodies, run
+
+
+class TestLoadTest:
+    client = create_app(catalog_dir=tempfile.mkdtemp()).server.test_client()
+
+    def test_bodies(self):
+        directories = find_instances(['sample files'])
+        bodies = make_bodies(directories, 'beam', width=10)
+        assert len(bodies) == len(directories)
+        for body in bodies:
+            response = self.client.post('/api/solve', data=body, content_type='application/json')
+            assert response.status_code == 200
+
+    def test_no_server(self):
+        summary = run('http://127.0.0.1:9/api/solve', make_bodies(find_instances(['sample files'])[:1]), 3, 2)
+        assert summary['ok'] == 0
+        assert summary['errors'] == 3
@@ -1,9 +1,25 @@
-from app.app_factory import create_app
+import gzip
+import json
+import os
+import tempfile
+import time
+from threading import Event
+
+import pandas as pd
+import plotly.graph_objs as go
 from dash import Dash
 
+import app.catalog as catalog
+import app.file_handlers as fh
+from app.app_factory import create_app
+from app.helpers import base_figure, encode_contents, figure_bytes, make_graph, query_frame, summarize
+from app.precompute import Precompute
+from app.solvers import Instance
+from app.validators import cities_problems, paths_problems
+
 
 class TestApp:
-    app = create_app()
+    app = create_app(catalog_dir=tempfile.mkdtemp())
 
     def test_factory(self):
         assert isinstance(self.app, Dash)
@@ -15,3 +31,198 @@ class TestApp:
             assert 'inputs' in v.keys()
             assert 'state' in v.keys()
 
+
+
+class TestExport:
+    @staticmethod
+    def solution():
+        from app.solvers import Instance
+        instance = Instance(pd.read_csv('sample files/example1/cities.csv'),
+                            pd.read_csv('sample files/example1/paths.csv'))
+        return instance.solve(48, 'beam', width=10)
+
+    def test_formats(self, tmp_path):
+        solution = self.solution()
+        job = fh.save_solution(solution, 48, directory=str(tmp_path))
+        rows = pd.read_csv(fh.find_export(job, str(tmp_path)))
+        assert list(rows.name) == [c.name for c in solution.path]
+
+        job = fh.save_solution(solution, 48, fmt='json', compress=True, directory=str(tmp_path))
+        with gzip.open(fh.find_export(job, str(tmp_path))) as file:
+            data = json.load(file)
+        assert data['total'] == solution.total
+        assert data['time_used'] == 48 - solution.time_left
+        assert [e[:2] for e in data['edges']] == [[a.name, b.name] for a, b in zip(solution.path, solution.path[1:])]
+        assert sum(e[2] for e in data['edges']) == data['time_used']
+
+    def test_job_id(self, tmp_path):
+        assert fh.find_export('../../etc/passwd', str(tmp_path)) is None
+        assert fh.find_export(fh.new_job(), str(tmp_path)) is None
+
+    def test_eviction(self, tmp_path):
+        solution = self.solution()
+        jobs = [fh.save_solution(solution, 48, directory=str(tmp_path)) for _ in range(3)]
+        old = fh.find_export(jobs[0], str(tmp_path))
+        os.utime(old, (time.time() - 100, time.time() - 100))
+        assert fh.evict_exports(str(tmp_path), max_age=50) == [old]
+
+        size = os.path.getsize(fh.find_export(jobs[1], str(tmp_path)))
+        fh.evict_exports(str(tmp_path), max_bytes=size)
+        assert len(os.listdir(str(tmp_path))) == 1
+
+    def test_download(self, tmp_path):
+        job = fh.save_solution(self.solution(), 48, directory=str(tmp_path))
+        client = create_app(catalog_dir=str(tmp_path / 'catalog'), export_dir=str(tmp_path)).server.test_client()
+        response = client.get(f'/tmp/solution?job={job}')
+        assert response.status_code == 200
+        assert response.get_data(as_text=True).startswith('name,x,y,quantity')
+        assert response.mimetype == 'text/csv'
+        assert client.get('/tmp/solution?job=nope').status_code == 404
+
+        for fmt, compress, mimetype in [('json', False, 'application/json'), ('json', True, 'application/gzip')]:
+            job = fh.save_solution(self.solution(), 48, fmt=fmt, compress=compress, directory=str(tmp_path))
+            response = client.get(f'/tmp/solution?job={job}')
+            assert response.mimetype == mimetype
+            assert response.headers['Content-Disposition'].endswith('solution.json' + ('.gz' if compress else ''))
+
+
+class TestPreview:
+    paths = pd.DataFrame({'city_from': ['A', 'B', 'C', 'A', 'D'],
+                          'city_to': ['B', 'C', 'C', 'B', 'A'],
+                          'time': [5, 3, 1, -2, 8]})
+
+    def test_query_frame(self):
+        rows, pages = query_frame(self.paths, 0, 2)
+        assert pages == 3
+        assert [r['city_from'] for r in rows] == ['A', 'B']
+
+        rows, pages = query_frame(self.paths, 0, 10, [{'column_id': 'time', 'direction': 'desc'}], '{time} > 1')
+        assert [r['time'] for r in rows] == [8, 5, 3]
+        assert pages == 1
+
+        rows, _ = query_frame(self.paths, 0, 10, [], '{city_to} contains C && {time} < 3')
+        assert rows == [{'city_from': 'C', 'city_to': 'C', 'time': 1}]
+
+        rows, _ = query_frame(self.paths, 1, 10, [], '{city_from} = A')
+        assert rows == []
+
+    def test_summary(self):
+        summary = summarize(self.paths, 'time', bins=2)
+        assert summary['rows'] == 5
+        assert (summary['min'], summary['median'], summary['max']) == (-2, 3, 8)
+        assert sum(summary['histogram'][0]) == 5
+
+    def test_problems(self):
+        problems = paths_problems(self.paths)
+        assert '1 paths from a city to itself' in problems
+        assert '1 repeated paths' in problems
+        assert '1 repeated paths with different times, the last time is used' in problems
+        assert '1 paths with negative time' in problems
+
+        cities = pd.DataFrame({'name': ['A', 'B', 'B'], 'x': [0, 0, 1], 'y': [0, 0, 1], 'quantity': [1, 2, 3]})
+        assert cities_problems(cities) == ['1 repeated city names', '1 cities at the same coordinates as another one']
+        assert cities_problems(cities.iloc[:1]) == []
+
+
+class TestFigure:
+    cities = pd.DataFrame({'name': ['A', 'B', 'C'], 'x': [0, 1, 1], 'y': [0, 0, 1], 'quantity': [1, 2, 3]})
+    paths = pd.DataFrame({'city_from': ['A', 'B'], 'city_to': ['B', 'C'], 'time': [4, 5]})
+
+    def test_base_figure(self):
+        figure = base_figure(Instance(self.cities, self.paths).csr)
+        edges, middles, nodes = figure['data']
+        # every edge once, segments split by None
+        assert edges['x'] == [0, 1, None, 1, 1, None]
+        assert middles['text'] == ['time: 4', 'time: 5']
+        assert nodes['text'][2] == 'pos : (1, 1) | name : C | quantity : 3'
+        go.Figure(figure)  # valid for plotly
+
+    def test_make_graph(self):
+        instance = Instance(self.cities, self.paths)
+        base = figure_bytes(base_figure(instance.csr))
+        graph = instance.csr
+        edges = graph.route_edges([graph.index[name] for name in ['A', 'B', 'C', 'B']])
+        figure = make_graph(base, graph, edges)
+        assert len(figure['data']) == 4
+        # every edge of the route once
+        assert figure['data'][1]['x'] == [0, 1, None, 1, 1, None]
+        # the cached bytes are not changed by a solve
+        assert make_graph(base, graph, [])['data'][1]['x'] == []
+        assert json.loads(base) == base_figure(instance.csr)
+
+
+class TestPrecompute:
+    def test_steps(self):
+        precompute = Precompute()
+        done = []
+        # a step may add steps, they run before the remaining ones
+        steps = [lambda: done.append(1), lambda: [lambda: done.append(2)], lambda: done.append(3)]
+        assert precompute.submit('a', steps).result(5) == 4
+        assert done == [1, 2, 3]
+        assert not precompute.running('a')
+        precompute.shutdown()
+
+    def test_cancel(self):
+        precompute = Precompute()
+        started, release, done = Event(), Event(), []
+        steps = [lambda: started.set() or release.wait(5), lambda: done.append('stale')]
+        future = precompute.submit('a', steps)
+        # a second session uploading the same files shares the job
+        assert precompute.submit('a', []) is future
+        started.wait(5)
+        assert not precompute.cancel('a')
+        assert precompute.cancel('a')
+        release.set()
+        assert future.result(5) == 1
+        assert done == []
+        precompute.wait('a')  # nothing to wait for
+        precompute.shutdown()
+
+    def test_paused(self):
+        precompute = Precompute()
+        done = []
+        with precompute.paused():
+            idle = precompute.submit('budget', [lambda: done.append('idle')], idle=True)
+            time.sleep(0.1)
+            assert done == []
+        assert idle.result(5) == 1
+        # other jobs run during searches, also behind an idle job waiting for the search
+        with precompute.paused():
+            idle = precompute.submit('bounds', [lambda: done.append('bounds')], idle=True)
+            assert precompute.submit('graph', [lambda: done.append('graph')]).result(5) == 1
+            assert done == ['idle', 'graph']
+        assert idle.result(5) == 1
+        assert done == ['idle', 'graph', 'bounds']
+        # cancelled while waiting for a search
+        with precompute.paused():
+            idle = precompute.submit('budget', [lambda: done.append('stale')], idle=True)
+            precompute.cancel('budget')
+        assert idle.cancelled() or idle.result(5) == 0
+        assert done == ['idle', 'graph', 'bounds']
+        precompute.shutdown()
+
+    def test_uploads(self, tmp_path):
+        app = create_app(catalog_dir=str(tmp_path))
+        client = app.server.test_client()
+
+        def upload(*names):
+            contents = [encode_contents(open(f'sample files/example1/{name}.csv').read()) if name else None
+                        for name in names]
+            body = {'output': '..precompute.data..', 'outputs': [{'id': 'precompute', 'property': 'data'}],
+                    'inputs': [{'id': idx, 'property': 'contents', 'value': c}
+                               for idx, c in zip(['city-matrix-input', 'coordinates-input', 'info-input'], contents)],
+                    'state': [{'id': 'precompute', 'property': 'data', 'value': None}],
+                    'changedPropIds': ['coordinates-input.contents']}
+            response = client.post('/_dash-update-component', json=body)
+            return response.get_json()['response']['precompute']['data'] if response.status_code == 200 else None
+
+        # nothing is built before both cities and paths are there, a budget job needs time.csv
+        assert upload('cities', None, None) is None
+        assert len(upload('cities', 'paths', None)) == 1
+        assert len(upload('cities', 'paths', 'time')) == 3
+        # the graph is built and stored without a solve
+        for _ in range(100):
+            if catalog.list_entries(str(tmp_path)):
+                break
+            time.sleep(0.05)
+        assert len(catalog.list_entries(str(tmp_path))) == 1
@@ -0,0 +1,561 @@
+import multiprocessing
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from app.helpers import parse_budgets
+from app.solvers import Instance, make_plot_data, sweep
+from app.solvers.aco_solver import find_aco_path
+from app.solvers.annealing_solver import COOLING, find_annealing_path
+from app.solvers.beam_solver import find_beam_path
+from app.solvers.decomposition_solver import decompose, find_decomposition_path, stitch
+from app.solvers.bounds import collect_times, gap_target, knapsack_bound, optimality_gap, start_bounds
+from app.solvers.exact_solver import choose_the_best_path, create_all_possible_paths, exact_search, find_exact_path
+from app.solvers.graph import route_totals
+from app.solvers.limits import COMPLETE, GAP, MEMORY, NODES, TIME, Guard
+from app.solvers.multilevel_solver import coarsen, find_multilevel_path, match
+from app.solvers.portfolio import race
+from app.solvers.instance import path_time, path_total, trim_path
+from app.solvers.random_solver import (find_best_random_paths_per_start, find_guided_path, find_random_path,
+                                       walk_tables)
+from app.solvers.reduction import reduce_graph
+from app.solvers.spatial import GridIndex
+
+
+SAMPLE = os.path.join(os.path.dirname(__file__), '..', 'sample files', 'example1')
+
+
+def load_sample():
+    cities = pd.read_csv(os.path.join(SAMPLE, 'cities.csv'))
+    paths = pd.read_csv(os.path.join(SAMPLE, 'paths.csv'))
+    return cities, paths
+
+
+def check_solution(solution, working_time: int):
+    path = solution.path
+    for cf, ct in zip(path[:-1], path[1:]):
+        assert ct.name in cf.neighbours
+    assert path_time(path) <= working_time
+    assert solution.time_left == working_time - path_time(path)
+    assert solution.total == path_total(path)
+
+
+class TestInstance:
+    instance = Instance(*load_sample())
+
+    def test_cold_solve(self):
+        solution = self.instance.solve(30)
+        check_solution(solution, 30)
+
+    def test_budget_shrinks(self):
+        self.instance.solve(30)
+        solution = self.instance.solve(12)
+        check_solution(solution, 12)
+
+    def test_budget_grows(self):
+        small = self.instance.solve(30)
+        solution = self.instance.solve(60)
+        check_solution(solution, 60)
+        assert solution.total >= small.total
+
+    def test_kinds_of_walks(self):
+        instance = Instance(*load_sample())
+        instance.solve(30)
+        # guided walks are not warm-started from uniform ones
+        check_solution(instance.solve(30, guided=True), 30)
+        assert set(instance.starts) == {(False, 50, None), (True, 50, None)}
+        # a larger budget keeps a route for every start, not only the extended ones
+        check_solution(instance.solve(40), 40)
+        uniform = instance.starts[(False, 50, None)]
+        assert uniform[40].keys() == uniform[30].keys()
+        for name, solution in uniform[40].items():
+            check_solution(solution, 40)
+            assert solution.total >= uniform[30][name].total
+
+    def test_trim_path(self):
+        path = self.instance.solve(30).path
+        for budget in range(0, 30):
+            check_solution(trim_path(path, budget), budget)
+
+    def test_isolated_city(self):
+        cities = pd.DataFrame({'name': ['A', 'Z', 'B', 'C'], 'x': [0, 5, 1, 2], 'y': [0, 5, 0, 0],
+                               'quantity': [10, 100, 20, 30]})
+        paths = pd.DataFrame({'city_from': ['A', 'B'], 'city_to': ['B', 'C'], 'time': [1, 1]})
+        instance = Instance(cities, paths)
+        # walks from a city without paths end where they start
+        for guided in [False, True]:
+            solution = Instance(cities, paths).solve(10, guided=guided)
+            check_solution(solution, 10)
+            assert [c.name for c in solution.path] == ['Z']
+        pinned = instance.pin(10, 'Z', refine=True)
+        check_solution(pinned, 10)
+        assert [c.name for c in pinned.path] == ['Z']
+
+
+class TestSweep:
+    instance = Instance(*load_sample())
+
+    def test_frontier(self):
+        budgets = [40, 10, 20, 30]
+        frontier = sweep(self.instance, budgets)
+        assert len(frontier) == len(budgets)
+        for budget, solution in zip(sorted(budgets), frontier):
+            check_solution(solution, budget)
+
+        totals = [s.total for s in frontier]
+        assert totals == sorted(totals)
+
+    def test_solutions_reused(self):
+        frontier = sweep(self.instance, [15, 25])
+        assert self.instance.solve(25) is frontier[1]
+
+    def test_boundary(self):
+        # a walk ends when no time is left, the city it reaches then is not on the route
+        cities = pd.DataFrame({'name': ['A', 'B'], 'x': [0, 1], 'y': [0, 0], 'quantity': [1, 2]})
+        paths = pd.DataFrame({'city_from': ['A'], 'city_to': ['B'], 'time': [5]})
+        instance = Instance(cities, paths)
+        walk = find_random_path(instance.cities_dict, 'A', 5)
+        assert ([c.name for c in walk.path], walk.time_left) == (['A'], 5)
+        empty, single, both = sweep(instance, [0, 5, 6], n=3)
+        assert (empty.path, empty.time_left, empty.total) == ([], 0, 0)
+        assert ([c.name for c in single.path], single.time_left, single.total) == (['B'], 5, 2)
+        assert (len(both.path), both.time_left, both.total) == (2, 1, 3)
+
+    def test_budgets(self):
+        assert parse_budgets('30:60:10') == [30, 40, 50, 60]
+        assert parse_budgets('5, 0') == [5, 0]
+        for txt in ['-5, 10', '-10:10:5', 'a, 5', '1:5:0']:
+            with pytest.raises(ValueError):
+                parse_budgets(txt)
+        with pytest.raises(ValueError):
+            sweep(self.instance, [-5, 10])
+
+
+class TestBeam:
+    instance = Instance(*load_sample())
+
+    def test_beam(self):
+        for width in [1, 5, 50]:
+            solution = self.instance.solve(30, 'beam', width=width)
+            check_solution(solution, 30)
+
+    def test_deterministic(self):
+        a = find_beam_path(self.instance, 40, width=10)
+        b = find_beam_path(self.instance, 40, width=10)
+        assert [c.name for c in a.path] == [c.name for c in b.path]
+
+
+class TestAntColony:
+    instance = Instance(*load_sample())
+
+    def test_aco(self):
+        solution = find_aco_path(self.instance, 30, seed=0, epochs=3)
+        check_solution(solution, 30)
+
+    def test_seed(self):
+        a = find_aco_path(self.instance, 40, seed=1, epochs=2)
+        b = find_aco_path(self.instance, 40, seed=1, epochs=2)
+        assert [c.name for c in a.path] == [c.name for c in b.path]
+
+    def test_colonies(self):
+        solution = find_aco_path(self.instance, 30, seed=0, epochs=2, colonies=2)
+        check_solution(solution, 30)
+
+
+class TestDecomposition:
+    instance = Instance(*load_sample())
+
+    def test_subgraph(self):
+        graph = self.instance.csr
+        cities = [graph.index[name] for name in 'ABC']
+        sub = graph.subgraph(cities)
+        assert sub.names == list('ABC')
+        for i, name in enumerate(sub.names):
+            expected = {n: t for n, t in graph.neighbour_times(graph.index[name]).items() if n in 'ABC'}
+            assert sub.neighbour_times(i) == expected
+
+    def test_decomposition(self):
+        for size in [2, 3, 100]:
+            solution = find_decomposition_path(self.instance, 30, size=size, tiles=3, workers=1, seed=0)
+            check_solution(solution, 30)
+
+    def test_workers(self):
+        a = decompose(self.instance, 40, size=2, tiles=4, workers=1)
+        b = decompose(self.instance, 40, size=2, tiles=4, workers=2)
+        assert [c.name for c in a] == [c.name for c in b]
+
+    def test_stitch(self):
+        path = stitch(self.instance, 48, [['A', 'B'], ['L', 'K'], []])
+        names = [c.name for c in path]
+        # the most valuable route goes first, the other one is joined by a connector
+        assert names[:2] == ['L', 'K']
+        assert {'A', 'B'} <= set(names)
+        assert path_time(path) <= 48
+        assert stitch(self.instance, 48, []) == []
+
+
+class TestMultilevel:
+    instance = Instance(*load_sample())
+
+    def test_match(self):
+        graph = self.instance.csr
+        mate = match(graph)
+        for i, j in enumerate(mate.tolist()):
+            if j >= 0:
+                assert mate[j] == i
+                assert graph.names[j] in graph.neighbour_times(i)
+
+    def test_coarsen(self):
+        graph = self.instance.csr
+        coarse, cluster, inner = coarsen(graph)
+        assert coarse.n < graph.n
+        assert coarse.value.sum() == graph.value.sum()
+        assert len(cluster) == graph.n and cluster.max() == coarse.n - 1
+        assert (inner >= 0).all()
+        for i in range(coarse.n):
+            for name, t in coarse.neighbour_times(i).items():
+                assert coarse.neighbour_times(coarse.index[name])[coarse.names[i]] == t
+
+    def test_multilevel(self):
+        for coarsest in [2, 6, 100]:
+            solution = find_multilevel_path(self.instance, 30, coarsest=coarsest, grain=10)
+            check_solution(solution, 30)
+            assert solution.total > 0
+
+
+class TestExact:
+    instance = Instance(*load_sample())
+
+    def test_complete(self):
+        for budget in [10, 30]:
+            solution = find_exact_path(self.instance, budget)
+            check_solution(solution, budget)
+            assert solution.status == COMPLETE
+            assert solution.total >= find_beam_path(self.instance, budget).total
+
+    def test_limits(self):
+        for limits, status in [({'max_nodes': 50}, NODES), ({'max_memory': 0}, MEMORY), ({'deadline': 0}, TIME)]:
+            solution = find_exact_path(self.instance, 48, **limits)
+            check_solution(solution, 48)
+            assert solution.status == status
+            assert solution.total > 0
+
+    def test_live_memory(self):
+        # memory of steps taken back is released, only the walk of a few dozen steps is kept
+        solution = find_exact_path(self.instance, 60, max_nodes=None, max_memory=64 * 2 ** 10)
+        assert solution.status == COMPLETE
+        assert find_exact_path(self.instance, 60, max_nodes=None, max_memory=1000).status == MEMORY
+
+    def test_free_moves(self):
+        # a hub of no value joined by free paths, the walk passes it again and again
+        cities = pd.DataFrame({'name': list('HABCDE'), 'x': range(6), 'y': [0] * 6,
+                               'quantity': [0, 10, 10, 10, 10, 10]})
+        paths = pd.DataFrame({'city_from': ['H'] * 5, 'city_to': list('ABCDE'), 'time': [0] * 5})
+        instance = Instance(cities, paths)
+        for budget in [0, 1]:
+            solution = find_exact_path(instance, budget)
+            check_solution(solution, budget)
+            assert solution.status == COMPLETE
+            assert solution.total == 50
+
+    def test_all_paths_limit(self):
+        graph = self.instance.csr.to_dict()
+        guard = Guard(max_nodes=100)
+        paths = create_all_possible_paths(graph, 30, guard)
+        assert guard.status == NODES
+        assert guard.nodes == 101
+        assert paths
+
+
+class TestPortfolio:
+    instance = Instance(*load_sample())
+
+    def test_race(self):
+        solution, reports = race(self.instance, 30, deadline=5, seed=0)
+        check_solution(solution, 30)
+        assert solution.total >= find_beam_path(self.instance, 30).total
+        assert {r['engine'] for r in reports} == {'random', 'beam', 'annealing', 'exact'}
+        assert reports[0]['total'] == solution.total
+
+    def test_deadline(self):
+        solution, reports = race(self.instance, 48, engines='random,annealing', deadline=0.5, grace=0.5)
+        check_solution(solution, 48)
+        assert solution.total > 0
+        assert {r['engine'] for r in reports} == {'random', 'annealing'}
+
+    def test_unknown_engine(self):
+        with pytest.raises(KeyError):
+            race(self.instance, 30, engines=['beam', 'nope'])
+
+    def test_incumbent(self):
+        # nothing beats a shared total above the optimum, the search completes without a walk
+        incumbent = multiprocessing.Value('q', 10 ** 6)
+        solution = find_exact_path(self.instance, 30, incumbent=incumbent)
+        assert solution.status == COMPLETE
+        assert solution.path == []
+        best = exact_search(self.instance.csr, 30, Guard(), incumbent=multiprocessing.Value('q', -1))
+        assert best[0] == find_exact_path(self.instance, 30).total
+
+
+class TestAnnealing:
+    instance = Instance(*load_sample())
+
+    def test_annealing(self):
+        for cooling in COOLING:
+            solution = find_annealing_path(self.instance, 30, seed=0, iterations=2000, cooling=cooling)
+            check_solution(solution, 30)
+
+    def test_not_worse_than_initial(self):
+        initial = self.instance.solve(40, 'beam', width=1)
+        solution = find_annealing_path(self.instance, 40, seed=0, iterations=2000, initial=initial.path)
+        check_solution(solution, 40)
+        assert solution.total >= initial.total
+
+    def test_chains(self):
+        solution = find_annealing_path(self.instance, 30, seed=0, iterations=1000, chains=2)
+        check_solution(solution, 30)
+
+
+def make_corridor_instance():
+    # square A-B-C-D with diagonal A-C, a corridor D-E-F-G-H-B and a worthless dead end B-X-Y
+    cities = pd.DataFrame([('A', 0, 0, 5), ('B', 1, 0, 3), ('C', 1, 1, 7), ('D', 0, 1, 2),
+                           ('E', 0, 2, 4), ('F', 0, 3, 0), ('G', -1, 3, 6), ('H', -1, 2, 1),
+                           ('X', 2, 0, 0), ('Y', 3, 0, 0)],
+                          columns=['name', 'x', 'y', 'quantity'])
+    paths = pd.DataFrame([('A', 'B', 1), ('B', 'C', 1), ('C', 'D', 1), ('D', 'A', 1), ('A', 'C', 2),
+                          ('D', 'E', 2), ('E', 'F', 1), ('F', 'G', 1), ('G', 'H', 2), ('H', 'B', 3),
+                          ('B', 'X', 1), ('X', 'Y', 1)],
+                         columns=['city_from', 'city_to', 'time'])
+    return Instance(cities, paths)
+
+
+def best_from(graph, start: int, working_time: int) -> int:
+    """ Best value of walks from start by exhaustive search over (city, time left, items collected). """
+    memo = {}
+
+    def search(city, time_left, items):
+        key = (city, time_left, items)
+        if key not in memo:
+            best = 0
+            for k in range(graph.indptr[city], graph.indptr[city + 1]):
+                t, nxt = int(graph.times[k]), int(graph.indices[k])
+                if t <= time_left:
+                    new = {i for i in (nxt, int(graph.edge_item[k])) if i >= 0} - items
+                    gain = sum(int(graph.item_value[i]) for i in new)
+                    best = max(best, gain + search(nxt, time_left - t, items | new))
+            memo[key] = best
+        return memo[key]
+
+    return int(graph.item_value[start]) + search(start, working_time, frozenset([start]))
+
+
+class TestReduction:
+    instance = make_corridor_instance()
+
+    def test_reduce_graph(self):
+        values = {name: c.value for name, c in self.instance.cities_dict.items()}
+        reduction = reduce_graph(self.instance.csr.to_dict(), values)
+        assert set(reduction.graph) == {'A', 'B', 'C', 'D'}
+        assert reduction.graph['D']['B'] == 9
+        assert reduction.corridors[('D', 'B')] == ['E', 'F', 'G', 'H']
+        assert reduction.corridor_value[('B', 'D')] == 11
+        assert reduction.expand(['A', 'B', 'D']) == ['A', 'B', 'H', 'G', 'F', 'E', 'D']
+
+    def test_solve_reduced(self):
+        for solver in ['random', 'beam', 'aco', 'annealing', 'exact']:
+            solution = self.instance.solve(12, solver, reduce=True)
+            check_solution(solution, 12)
+        # corridors count in the reduced search, which keeps every valuable city at this budget
+        reduced = self.instance.solve(12, 'exact', reduce=True)
+        assert reduced.status == COMPLETE
+        assert reduced.total == find_exact_path(self.instance, 12).total
+
+
+class TestBounds:
+    instance = Instance(*load_sample())
+
+    def test_bounds_hold(self):
+        graph = self.instance.csr
+        for budget in [5, 20, 40]:
+            bounds = dict(zip(graph.names, start_bounds(graph, budget)))
+            starts = find_best_random_paths_per_start(self.instance.cities_dict, budget, 20)
+            for name, solution in starts.items():
+                assert solution.total <= bounds[name]
+
+    def test_corridor_start_bounds(self):
+        instance = make_corridor_instance()
+        for budget in range(1, 21):
+            graph = instance.reduced(budget).csr
+            bounds = start_bounds(graph, budget)
+            for start in range(graph.n):
+                assert best_from(graph, start, budget) <= bounds[start]
+
+    def test_hopeless_starts_skipped(self):
+        bounds = {name: 0 for name in self.instance.cities_dict}
+        bounds['E'] = 1000
+        starts = find_best_random_paths_per_start(self.instance.cities_dict, 20, 5, bounds=bounds)
+        assert list(starts) == ['E']
+
+    def test_upper_bound(self):
+        instance = Instance(*load_sample())
+        for budget in [5, 20, 30]:
+            optimum = find_exact_path(instance, budget).total
+            assert knapsack_bound(instance.csr, budget) >= optimum
+            # a complete exact search proves its total optimal
+            instance.solve(budget, 'exact')
+            assert instance.upper_bound(budget) == optimum
+            assert optimality_gap(optimum, instance.upper_bound(budget)) == 0
+
+    def test_corridor_bound(self):
+        # the reduction keeps every valuable city within these budgets, so both graphs have the same optimum
+        instance = make_corridor_instance()
+        for budget in [12, 20]:
+            bound = knapsack_bound(instance.reduced(budget).csr, budget)
+            assert bound >= find_exact_path(instance, budget).total
+            for solver in ['random', 'beam', 'aco']:
+                assert instance.solve(budget, solver, reduce=True).total <= bound
+
+    def test_gap_target(self):
+        assert gap_target(200, 0) == 200
+        assert gap_target(200, 0.25) == 150
+        for gap in [-0.5, 1, 2]:
+            with pytest.raises(ValueError):
+                gap_target(200, gap)
+
+    def test_gap_stop(self):
+        for solver in ['random', 'annealing', 'aco', 'exact', 'portfolio']:
+            instance = Instance(*load_sample())
+            solution = instance.solve(40, solver, gap=0.9)
+            check_solution(solution, 40)
+            assert solution.status == GAP
+            assert solution.total >= instance.target(40, 0.9)
+
+
+class TestGuidedWalks:
+    instance = Instance(*load_sample())
+
+    def test_alias_tables(self):
+        graph = self.instance.csr
+        tables = walk_tables(graph, floor=1.0)
+        for i in range(graph.n):
+            first, stop = graph.indptr_list[i], graph.indptr_list[i + 1]
+            # probability of every position drawn from the table
+            drawn = {k: tables.prob[k] for k in range(first, stop)}
+            for k in range(first, stop):
+                drawn[tables.alias[k]] += 1 - tables.prob[k]
+            weights = {k: (graph.value_list[graph.indices_list[k]] + 1) / max(graph.times_list[k], 1)
+                       for k in range(first, stop)}
+            for k in range(first, stop):
+                assert abs(drawn[k] / (stop - first) - weights[k] / sum(weights.values())) < 1e-9
+
+    def test_collect_times(self):
+        graph = make_corridor_instance().csr
+        times = dict(zip(graph.names, collect_times(graph).tolist()))
+        assert times['Y'] == 2
+        assert times['X'] == 1
+        assert times['A'] == 1
+
+    def test_guided_path(self):
+        tables = walk_tables(self.instance.csr)
+        for budget in [0, 5, 20, 40]:
+            for name in self.instance.cities_dict:
+                check_solution(find_guided_path(self.instance.cities_dict, name, budget, tables), budget)
+
+    def test_solve_guided(self):
+        for reduce in [False, True]:
+            solution = Instance(*load_sample()).solve(30, guided=True, reduce=reduce)
+            check_solution(solution, 30)
+            assert solution.total > 0
+
+
+class TestPin:
+    instance = Instance(*load_sample())
+
+    def test_nearest(self):
+        rng = np.random.RandomState(0)
+        x, y = rng.uniform(0, 100, 500), rng.uniform(0, 50, 500)
+        grid = GridIndex(x, y)
+        for qx, qy in rng.uniform(-20, 120, (200, 2)):
+            assert grid.nearest(qx, qy) == int(np.argmin(np.hypot(x - qx, y - qy)))
+        graph = self.instance.csr
+        assert self.instance.nearest_city(graph.x[3] + 1e-3, graph.y[3]) == graph.names[3]
+
+    def test_pin_start(self):
+        solved = self.instance.solve(30)
+        start = solved.path[0].name
+        # the route of the solve is returned at once, a refinement is not worse
+        assert self.instance.pin(30, start) is self.instance.by_start[30][start]
+        assert self.instance.pin(30, start).total >= solved.total
+        for name in self.instance.cities_dict:
+            refined = self.instance.pin(30, name, refine=True)
+            check_solution(refined, 30)
+            assert refined.path[0].name == name
+            assert refined.total >= self.instance.starts[(False, 50, None)][30].get(name, refined).total
+
+    def test_pin_end(self):
+        for start, end in [('A', 'E'), ('B', 'B'), ('C', 'A')]:
+            solution = self.instance.pin(40, start, end)
+            check_solution(solution, 40)
+            assert solution.path[0].name == start
+            assert solution.path[-1].name == end
+        with pytest.raises(ValueError):
+            self.instance.pin(0, 'A', 'E')
+
+
+class TestEdges:
+    instance = Instance(*load_sample())
+
+    def test_edge_table(self):
+        graph = self.instance.csr
+        assert graph.m * 2 == len(graph.indices)
+        src = np.repeat(np.arange(graph.n), graph.degree)
+        # both directions of an edge share its id
+        assert (graph.edge_ids(src, graph.indices) == graph.edge_id).all()
+        assert (graph.edge_ids(graph.indices, src) == graph.edge_id).all()
+        assert (graph.edge_time[graph.edge_id] == graph.times).all()
+        with pytest.raises(KeyError):
+            graph.edge_ids([graph.index['A']], [graph.index['L']])
+
+    def test_conflicting_times(self):
+        cities = pd.DataFrame({'name': ['A', 'B', 'C'], 'x': [0, 1, 2], 'y': [0, 0, 0], 'quantity': [1, 2, 3]})
+        paths = pd.DataFrame({'city_from': ['A', 'B', 'B', 'C'], 'city_to': ['B', 'A', 'C', 'B'],
+                              'time': [5, 7, 2, 4]})
+        graph = Instance(cities, paths).csr
+        # the last row of a pair wins in both directions
+        assert graph.neighbour_times(graph.index['A']) == {'B': 7}
+        assert graph.neighbour_times(graph.index['B']) == {'A': 7, 'C': 4}
+        assert graph.neighbour_times(graph.index['C']) == {'B': 4}
+        assert graph.edge_time.tolist() == [7, 4]
+        assert (graph.edge_time[graph.edge_id] == graph.times).all()
+
+    def test_solution_edges(self):
+        cities, paths = load_sample()
+        for solver in ['random', 'beam', 'exact']:
+            solution = self.instance.solve(40, solver)
+            graph = self.instance.csr
+            assert len(solution.edges) == max(len(solution.path) - 1, 0)
+            assert graph.edge_time[solution.edges].sum() == 40 - solution.time_left
+
+            _, _, edges = make_plot_data(cities, paths, pd.DataFrame({'time': [40]}), self.instance, solver)
+            on_route = {frozenset((a.name, b.name)) for a, b in zip(solution.path, solution.path[1:])}
+            for a, b, data in edges:
+                assert data['solution'] == (frozenset((a, b)) in on_route)
+
+
+class TestRouteScoring:
+    instance = Instance(*load_sample())
+
+    def test_route_totals(self):
+        graph = self.instance.csr
+        paths = [self.instance.solve(budget).path for budget in [10, 20, 30]]
+        routes = [[graph.index[c.name] for c in path] for path in paths]
+        totals = route_totals(routes, graph.value, chunk=2)
+        assert totals.tolist() == [path_total(path) for path in paths]
+
+    def test_choose_the_best_path(self):
+        cities = self.instance.cities_dict
+        best = choose_the_best_path([['A', 'B', 'A'], ['A', 'B', 'C'], ['E', 'D', 'E']], cities)
+        assert best == {8: ['A', 'B', 'A'], 15: ['A', 'B', 'C'], 12: ['E', 'D', 'E']}
+        assert not any(hasattr(c, 'visited') for c in cities.values())
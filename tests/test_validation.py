@@ -148,3 +148,8 @@ class TestGenerator:
         for cities, paths in self.samples:
             s, msg = validate_input(cities, paths)
             assert s
+
+    def test_paths_once(self):
+        for _, paths in self.samples:
+            pairs = {frozenset(pair) for pair in paths[['city_from', 'city_to']].values.tolist()}
+            assert len(pairs) == len(paths)
@@ -0,0 +1,9 @@
+import os
+
+from app.app_factory import create_app
+from app.catalog import CATALOG_DIR
+
+# entry point of WSGI servers, e.g. gunicorn -c gunicorn.conf.py wsgi:server
+app = create_app(catalog_dir=os.environ.get('TSP_CATALOG_DIR', CATALOG_DIR),
+                 cache_size=int(os.environ.get('TSP_CACHE_SIZE', 8)))
+server = app.server